@@ -0,0 +1,119 @@
+"""Semantic answer cache for the interactive query loop
+
+A question whose query embedding is close enough to an earlier one (cosine
+similarity at least threshold) gets the earlier answer back without retrieval
+or synthesis. Answers are tied to the graph version they were produced from
+(IngestStats.graph_version), and answers for any other version are dropped, so
+a rebuilt graph never serves stale answers.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """Past questions, their query embeddings and answers, in SQLite
+
+    The embeddings of the current graph version are also held as one
+    normalized matrix, so a lookup is one embedding plus a matrix-vector product.
+    """
+
+    def __init__(self, path, embed_model, graph_version="", threshold=0.95, max_entries=1000):
+        self.path = path
+        self.embed_model = embed_model
+        self.graph_version = graph_version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, query TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, answer TEXT NOT NULL, graph_version TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._load()
+
+    def _load(self):
+        dropped = self._db.execute(
+            "DELETE FROM answers WHERE graph_version != ?", (self.graph_version,)
+        ).rowcount
+        self._db.commit()
+        if dropped:
+            logger.info("Dropped %d cached answers for an older graph", dropped)
+        rows = self._db.execute(
+            "SELECT id, embedding, answer FROM answers ORDER BY id").fetchall()
+        self._ids = [row[0] for row in rows]
+        self._answers = [row[2] for row in rows]
+        self._matrix = np.array([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+
+    def set_graph_version(self, graph_version):
+        """Switch to another graph version, dropping every answer from the old one"""
+        with self._lock:
+            if graph_version != self.graph_version:
+                self.graph_version = graph_version
+                self._load()
+
+    def _embed(self, query):
+        vector = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, query):
+        """The cached answer to the most similar earlier query, or None"""
+        if not self._answers:
+            self.misses += 1
+            telemetry.incr("cache_misses_total", cache="answer")
+            return None
+        vector = self._embed(query)
+        with self._lock:
+            if not self._answers:
+                self.misses += 1
+                telemetry.incr("cache_misses_total", cache="answer")
+                return None
+            similarity = self._matrix @ vector
+            best = int(np.argmax(similarity))
+            if similarity[best] < self.threshold:
+                self.misses += 1
+                telemetry.incr("cache_misses_total", cache="answer")
+                return None
+            self.hits += 1
+            telemetry.incr("cache_hits_total", cache="answer")
+            logger.info("Answer cache hit (similarity %.3f)", similarity[best])
+            return self._answers[best]
+
+    def put(self, query, answer):
+        vector = self._embed(query)
+        with self._lock:
+            row_id = self._db.execute(
+                "INSERT INTO answers (query, embedding, answer, graph_version, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (query, vector.tobytes(), answer, self.graph_version, time.time()),
+            ).lastrowid
+            self._ids.append(row_id)
+            self._answers.append(answer)
+            self._matrix = np.vstack([self._matrix.reshape(-1, len(vector)), vector])
+            if len(self._ids) > self.max_entries:
+                # oldest first
+                excess = len(self._ids) - self.max_entries
+                self._db.executemany("DELETE FROM answers WHERE id = ?",
+                                     [(i,) for i in self._ids[:excess]])
+                self._ids, self._answers = self._ids[excess:], self._answers[excess:]
+                self._matrix = self._matrix[excess:]
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._answers)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
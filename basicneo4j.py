@@ -1,24 +1,14 @@
 import logging
-from neo4j import GraphDatabase
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
+from llama_index.core import KnowledgeGraphIndex, StorageContext
 
-from config import config
+from neo4j_pool import PooledNeo4jGraphStore, get_driver
 # Enable logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# Connection details
-uri = config.NEO4J_URI
-username = config.NEO4J_USERNAME
-password = config.NEO4J_PASSWORD
-
-# Create the driver
-driver = GraphDatabase.driver(uri, auth=(username, password))
-
-# Verify the connection
+# The shared driver, created and probed once (see neo4j_pool.py)
 try:
-    with GraphDatabase.driver(uri, auth=(username, password)) as driver:
-        driver.verify_connectivity()
-        print("Connection successful")
+    driver = get_driver()
+    print("Connection successful")
 
     with driver.session(database="neo4j") as session:
         result = session.run("RETURN 1")
@@ -27,12 +17,7 @@ except Exception as e:
     logging.error("Failed to connect to the database:", exc_info=e)
 exit()
 # Use the driver in your application
-graph_store = Neo4jGraphStore(
-    username=username,
-    password=password,
-    url=uri,
-    database="neo4j",
-)
+graph_store = PooledNeo4jGraphStore(database="neo4j")
 
 storage_context = StorageContext.from_defaults(graph_store=graph_store)
 
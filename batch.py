@@ -0,0 +1,146 @@
+"""Answer a file of questions concurrently, writing one JSON line per answer
+
+    python main.py batch questions.txt --output answers.jsonl --parallel 4
+
+Questions are one per line (blank lines and lines starting with # are
+skipped), or a JSONL file of {"id": ..., "query": ...}. Each answer is
+appended to the output as soon as it is ready, with the triplets and nodes it
+was answered from and the retrieval and synthesis times. Running the same
+batch again skips every question already answered in the output, so a batch
+that crashed or was interrupted carries on where it stopped; questions that
+failed are asked again.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from llama_index.core.schema import QueryBundle
+
+from config import config
+from extraction import strip_thinking
+
+logger = logging.getLogger(__name__)
+
+
+def read_questions(path):
+    """[(id, query)] from a text file of questions or a JSONL file of {"id", "query"}
+
+    Questions without an id are identified by their text.
+    """
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                questions.append((str(item.get("id", item["query"])), item["query"]))
+            else:
+                questions.append((line, line))
+    return list(dict(questions).items())
+
+
+def answered_ids(path):
+    """Ids of the questions answered without error in an earlier run's output
+
+    A last line cut short by a crash is ignored, so its question is asked again.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+def drop_partial_line(path):
+    """Cut off a last line left unfinished by a crash, so appending starts on a new line"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def describe_sources(nodes):
+    """The knowledge graph triplets and the other nodes a question was answered from"""
+    triplets, sources = [], []
+    for node in nodes:
+        metadata = node.node.metadata
+        rel_texts = metadata.get("kg_rel_text") or metadata.get("kg_rel_texts")
+        if rel_texts:
+            triplets.extend(rel_texts)
+        else:
+            sources.append({"id": node.node.node_id, "score": node.score,
+                            "file": node.node.metadata.get("file_name")})
+    return list(dict.fromkeys(triplets)), sources
+
+
+async def answer_one(query_engine, question_id, query):
+    """The output record for one question, with the error instead if it failed"""
+    record = {"id": question_id, "query": query}
+    bundle = QueryBundle(query)
+    start = time.perf_counter()
+    try:
+        nodes = await query_engine.aretrieve(bundle)
+        retrieved = time.perf_counter()
+        response = await query_engine.asynthesize(bundle, nodes)
+    except Exception as e:
+        logger.warning("Question %r failed: %r", question_id, e)
+        record["error"] = repr(e)
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        return record
+    answer = str(response)
+    record["answer"] = strip_thinking(answer).strip() if config.HIDE_THINKING else answer
+    record["triplets"], record["sources"] = describe_sources(nodes)
+    record["retrieval_seconds"] = round(retrieved - start, 3)
+    record["synthesis_seconds"] = round(time.perf_counter() - retrieved, 3)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+async def run_batch(query_engine, questions, output_path, parallel=4):
+    """Answer questions with at most parallel in flight, appending records to output_path
+
+    Returns the number of questions answered, failed and skipped as already answered.
+    """
+    done = answered_ids(output_path)
+    todo = [(question_id, query) for question_id, query in questions if question_id not in done]
+    counts = {"answered": 0, "failed": 0, "skipped": len(questions) - len(todo)}
+    slots = asyncio.Semaphore(parallel)
+
+    async def run(question_id, query):
+        async with slots:
+            return await answer_one(query_engine, question_id, query)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    drop_partial_line(output_path)
+    with open(output_path, "a") as out:
+        for finished in asyncio.as_completed([run(*question) for question in todo]):
+            record = await finished
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            counts["failed" if "error" in record else "answered"] += 1
+            print(f"[{counts['answered'] + counts['failed']}/{len(todo)}] "
+                  f"{record.get('seconds', 0):6.1f}s  {record['query'][:70]}")
+    return counts
+
+
+def batch(query_engine, questions_path, output_path, parallel=4):
+    questions = read_questions(questions_path)
+    start = time.perf_counter()
+    counts = asyncio.run(run_batch(query_engine, questions, output_path, parallel))
+    print(f"{counts['answered']} answered, {counts['failed']} failed, "
+          f"{counts['skipped']} already answered in {time.perf_counter() - start:.1f}s "
+          f"-> {output_path}")
+    return counts
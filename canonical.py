@@ -0,0 +1,179 @@
+"""Entity and relation canonicalization between triplet extraction and graph writes
+
+Overlapping chunks of the same manual make the LLM name one thing many ways:
+"SAP HANA", "SAP HANA database", "sap hana", "HANA systems". Written as is,
+each spelling becomes its own node, which inflates the graph and the fan-out
+KnowledgeGraphRAGRetriever traverses. Canonicalizer maps every entity name to
+one canonical name before the triplet is written:
+- names with the same normalized key (case, punctuation, spacing, leading
+  articles, a plural last word) are one entity
+- aliases listed in the registry file map spellings to a canonical name
+- optionally, a new name whose embedding is close enough to an existing
+  entity's is merged into it
+Relations are normalized the same way, without leading auxiliaries ("is part
+of" -> "part of"), and a chunk's triplets are deduplicated after mapping.
+
+The first spelling seen becomes the canonical name and the mapping is kept in
+a registry file, so later runs write the same names and incremental updates
+and deletes keep matching the graph.
+"""
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from entity_index import normalize
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_VERSION = 1
+ARTICLES = frozenset({"a", "an", "the"})
+AUXILIARIES = frozenset({"is", "are", "was", "were", "be", "been", "being"})
+
+
+def singular(word):
+    """English plural to singular for the common regular forms"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def entity_key(name):
+    """Normalized key of an entity name, e.g. 'The HANA Systems' -> 'hana system'"""
+    words = normalize(name).split()
+    while len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    if words:
+        words[-1] = singular(words[-1])
+    return " ".join(words)
+
+
+def relation_key(rel):
+    """Normalized relation, e.g. 'Is  part of' -> 'part of'"""
+    words = normalize(rel).split()
+    while len(words) > 1 and words[0] in AUXILIARIES:
+        words = words[1:]
+    return " ".join(words)
+
+
+@dataclass
+class CanonicalStats:
+    """How much canonicalization shrank the triplets of one ingestion run"""
+    names: set = field(default_factory=set)
+    entities: set = field(default_factory=set)
+    triplets: set = field(default_factory=set)
+    edge_mentions: Counter = field(default_factory=Counter)
+    embedding_merges: int = 0
+
+    @property
+    def reduction(self):
+        return 1 - len(self.edge_mentions) / len(self.triplets) if self.triplets else 0.0
+
+    def __str__(self):
+        repeated = sum(1 for count in self.edge_mentions.values() if count > 1)
+        return (f"{len(self.names)} entity names -> {len(self.entities)} entities, "
+                f"{len(self.triplets)} distinct triplets -> {len(self.edge_mentions)} edges "
+                f"({self.reduction:.0%} fewer, {repeated} extracted more than once)")
+
+
+class Canonicalizer:
+    """Maps extracted triplets onto canonical entity names, remembered in a registry file
+
+    The registry belongs to one graph, like the ingestion manifest: if graph_id
+    differs from the one it was written for, it starts out empty. Its "aliases"
+    ({"hana": "SAP HANA"}) can be edited by hand and are kept.
+    With embed_model, a name with no key or alias match is merged into the
+    entity whose name embedding has cosine similarity of at least
+    embed_threshold.
+    """
+
+    def __init__(self, path, graph_id, embed_model=None, embed_threshold=0.92):
+        self.path = path
+        self.graph_id = graph_id
+        self.embed_model = embed_model
+        self.embed_threshold = embed_threshold
+        self.stats = CanonicalStats()
+        self._names = {}    # entity key or compact key -> canonical name
+        self.aliases = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == REGISTRY_VERSION and data.get("graph") == graph_id:
+                self._names = data["names"]
+            self.aliases = data.get("aliases", {})
+        self._aliases = {entity_key(alias): name for alias, name in self.aliases.items()}
+        self._canonical = sorted(set(self._names.values()))
+        self._vectors = None
+
+    def entity(self, name):
+        """The canonical name of an entity, registering name if it is a new one"""
+        key = entity_key(name)
+        if not key:
+            return name.strip()
+        compact = key.replace(" ", "")
+        canonical = (self._aliases.get(key) or self._names.get(key)
+                     or self._names.get(compact))
+        if canonical is None and self.embed_model is not None:
+            canonical = self._nearest(name)
+        if canonical is None:
+            canonical = " ".join(name.split())
+            self._add_canonical(canonical)
+        self._names.setdefault(key, canonical)
+        self._names.setdefault(compact, canonical)
+        return canonical
+
+    def relation(self, rel):
+        return relation_key(rel) or rel.strip()
+
+    def canonicalize(self, triplets):
+        """The chunk's triplets on canonical names, without duplicates, in order"""
+        result = {}
+        for subj, rel, obj in triplets:
+            canonical = (self.entity(subj), self.relation(rel), self.entity(obj))
+            if canonical[0] == canonical[2]:
+                continue
+            self.stats.names.update((subj, obj))
+            self.stats.entities.update((canonical[0], canonical[2]))
+            self.stats.triplets.add((subj, rel, obj))
+            result[canonical] = None
+        self.stats.edge_mentions.update(result.keys())
+        return list(result)
+
+    def _add_canonical(self, name):
+        self._canonical.append(name)
+        if self._vectors is not None:
+            self._vectors = np.vstack([self._vectors, self._embed([name])])
+
+    def _embed(self, names):
+        vectors = np.asarray(self.embed_model.get_text_embedding_batch(names), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(1e-12)
+
+    def _nearest(self, name):
+        if not self._canonical:
+            return None
+        if self._vectors is None:
+            # embedded on first use; the embedding cache makes this cheap after the first run
+            self._vectors = self._embed(self._canonical)
+        similarity = self._vectors @ self._embed([name])[0]
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.embed_threshold:
+            return None
+        logger.debug("Merged entity %r into %r (similarity %.3f)",
+                     name, self._canonical[best], similarity[best])
+        self.stats.embedding_merges += 1
+        return self._canonical[best]
+
+    def save(self):
+        """Write the registry atomically"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": REGISTRY_VERSION, "graph": self.graph_id,
+                       "names": self._names, "aliases": self.aliases}, f)
+        os.replace(self.path + ".tmp", self.path)
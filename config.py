@@ -1,3 +1,5 @@
+import os
+
 from pydantic import ValidationError, field_validator
 from pydantic_settings import BaseSettings
 
@@ -17,6 +19,96 @@ class Settings(BaseSettings):
     OLLAMA_PORT: int = 11434
     OLLAMA_LLM_MODEL: str = "deepseek-r1:14b"
     OLLAMA_EMBED_MODEL: str = "bge-m3"
+    STATE_DIR: str = ".graphrag"
+    # "neo4j", or "local" for the embedded CSRGraphStore kept under STATE_DIR;
+    # the local store answers triplet lookups only, Cypher queries return no rows
+    GRAPH_STORE: str = "neo4j"
+    KG_MAX_TRIPLETS_PER_CHUNK: int = 8
+    # merge spellings of the same entity before writing triplets (canonical.py)
+    CANONICALIZE_ENTITIES: bool = True
+    # also merge new entity names into ones with a close name embedding
+    ENTITY_EMBED_MERGE: bool = False
+    ENTITY_MERGE_THRESHOLD: float = 0.92
+    # keep at most OLLAMA_NUM_PARALLEL (server side) extraction requests in flight
+    EXTRACT_CONCURRENCY: int = 4
+    EXTRACT_REQUEST_TIMEOUT: float = 600.0
+    EXTRACT_RETRIES: int = 2
+    # extract triplets for up to EXTRACT_BATCH_SIZE consecutive chunks of at most
+    # EXTRACT_BATCH_TOKENS tokens together with one prompt, 0 for one prompt per chunk
+    EXTRACT_BATCH_TOKENS: int = 0
+    EXTRACT_BATCH_SIZE: int = 4
+    # a chunk whose extraction failed in EXTRACT_DEAD_LETTER_AFTER runs is skipped by
+    # later ones until `python main.py ingest --retry-failed`
+    EXTRACT_DEAD_LETTER_AFTER: int = 2
+    # stop the build after this many chunks failed in a row; the next run resumes
+    EXTRACT_MAX_CONSECUTIVE_FAILURES: int = 10
+    # shared Neo4j driver (neo4j_pool.py): connections kept open, and recycled
+    # before Aura drops them for being idle
+    NEO4J_POOL_SIZE: int = 20
+    # database the graph is kept in, and that the startup probe checks
+    NEO4J_DATABASE: str = "neo4j"
+    NEO4J_CONNECTION_LIFETIME: float = 2700.0
+    # connections idle longer than this many seconds are checked before use
+    NEO4J_LIVENESS_CHECK: float = 60.0
+    NEO4J_CONNECT_TIMEOUT: float = 5.0
+    # triplets per Neo4j write transaction
+    NEO4J_WRITE_BATCH_SIZE: int = 1000
+    # seconds a triplet may wait for its batch to fill before it is written anyway
+    NEO4J_WRITE_MAX_DELAY: float = 5.0
+    # parsed files buffered ahead of triplet extraction
+    INGEST_FILES_AHEAD: int = 2
+    # PDF parsing processes, 0 for one per CPU
+    PDF_PARSE_WORKERS: int = 0
+    EMBED_CACHE_MAX_ENTRIES: int = 200_000
+    LLM_CACHE_MAX_ENTRIES: int = 50_000
+    # cosine similarity above which an earlier question's answer is reused, >1 disables
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    # fuse Redis vector search with graph retrieval (reciprocal rank fusion)
+    HYBRID_RETRIEVAL: bool = False
+    # seconds to wait for all retrievers; slower ones are dropped from the answer
+    HYBRID_BUDGET: float = 10.0
+    # seconds more to wait for the first retriever if none finished within the budget
+    HYBRID_GRACE: float = 5.0
+    VECTOR_TOP_K: int = 5
+    # nodes embedded and written to the vector index per pipelined batch
+    VECTOR_SYNC_BATCH_SIZE: int = 256
+    # resolve query entities from the graph's entity names instead of asking the LLM
+    ENTITY_INDEX: bool = True
+    # match entity names by embedding when no name matches the query's words
+    ENTITY_EMBED_MATCH: bool = False
+    # ask the LLM for entities when none of the graph's entity names match the query
+    ENTITY_LLM_FALLBACK: bool = False
+    # budgeted graph traversal at query time (traversal.py): hops and triplets in total,
+    # relationships followed per entity, degree above which an entity is a hub that is
+    # not expanded, and seconds for all hops
+    KG_TRAVERSAL_BUDGET: bool = True
+    KG_TRAVERSAL_DEPTH: int = 2
+    KG_TRAVERSAL_MAX_TRIPLETS: int = 30
+    KG_TRAVERSAL_FANOUT: int = 8
+    KG_HUB_DEGREE: int = 50
+    KG_TRAVERSAL_SECONDS: float = 2.0
+    # tokens of retrieved facts and snippets in the answer prompt (context_packing.py),
+    # 0 to pass everything; keep it well below Ollama's num_ctx for the model
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    # print answers token by token as Ollama generates them
+    STREAM_RESPONSES: bool = True
+    # leave deepseek-r1's <think> reasoning out of printed answers
+    HIDE_THINKING: bool = True
+    # write per-stage timings and counters to STATE_DIR/trace.json on exit (telemetry.py)
+    TELEMETRY_TRACE: bool = True
+    # serve Prometheus metrics on http://localhost:METRICS_PORT/metrics, 0 to disable
+    METRICS_PORT: int = 0
+    # port of `python main.py serve`
+    SERVE_PORT: int = 8000
+    # answers generated at once by the service; keep at most OLLAMA_NUM_PARALLEL
+    SERVE_MAX_GENERATIONS: int = 2
+    # generations running or queued before new questions get 503
+    SERVE_MAX_PENDING: int = 32
+    # seconds before a question gets 504
+    SERVE_REQUEST_TIMEOUT: float = 300.0
+    # questions answered at once by `python main.py batch`
+    BATCH_PARALLELISM: int = 4
 
     @field_validator('NEO4J_USERNAME', 'NEO4J_PASSWORD', 'AURA_INSTANCEID', 'AURA_INSTANCENAME', 
         'REDIS_USERNAME', 'REDIS_PASSWORD', 'OLLAMA_LLM_MODEL', 'OLLAMA_EMBED_MODEL')
@@ -26,19 +118,25 @@ class Settings(BaseSettings):
                 f'{field.field_name} must contain only alphanumeric characters and underscores')
         return v
 
-    @field_validator( 'REDIS_HOST',  'OLLAMA_HOST', 'DOC_DIR')
+    @field_validator( 'REDIS_HOST',  'OLLAMA_HOST', 'DOC_DIR', 'STATE_DIR')
     def validate_name(cls, v, field):
         if not all(char.isalnum() or char in '_.-' for char in v):
             raise ValueError(
                 f'{field.field_name} must contain only alphanumeric characters and underscores')
         return v
 
-    @field_validator('REDIS_PORT', 'OLLAMA_PORT')
+    @field_validator('REDIS_PORT', 'OLLAMA_PORT', 'METRICS_PORT', 'SERVE_PORT')
     def validate_redis_port(cls, value):
         if (not isinstance(value, int)) or (not 0 <= value <= 65535):
             raise ValueError('REDIS_PORT must be between 0 and 65535')
         return value
     
+    @field_validator('GRAPH_STORE')
+    def validate_graph_store(cls, value):
+        if value not in ("neo4j", "local"):
+            raise ValueError('GRAPH_STORE must be "neo4j" or "local"')
+        return value
+
     @field_validator('NEO4J_URI')
     def validate_neo4j_uri(cls, value):
         from urllib.parse import urlparse
@@ -46,6 +144,10 @@ class Settings(BaseSettings):
         if not all([result.scheme, result.netloc]):
             raise ValueError('NEO4J_URI must be a valid URI')
         return value
+
+    def state_path(self, name):
+        """Path of a file kept between runs (manifests, caches) under STATE_DIR"""
+        return os.path.join(self.STATE_DIR, name)
         
 
 class LlamaSettings(Settings):
@@ -0,0 +1,197 @@
+"""Token-budgeted packing of retrieved context before answer synthesis
+
+RetrieverQueryEngine hands every retrieved node to the response synthesizer
+as is: the knowledge graph node repeats a paragraph of instructions and one
+"['subject', 'relation', 'object']" line per triplet, the same triplet comes
+back once per query entity whose paths reach it, and vector search adds
+snippets that overlap each other. Every token of that is prefilled by Ollama
+before the first answer token. ContextPacker is a node postprocessor that
+rewrites the retrieved nodes into a fixed token budget:
+- triplets are deduplicated on their canonical names (canonical.py) and
+  written grouped by subject, "SAP HANA: runs on vSphere, KVM; requires
+  memory", which drops the repeated subjects and the list syntax
+- snippets whose text repeats one kept before are dropped
+- in retrieval order, facts and snippets are kept while they fit
+  token_budget; a snippet that only partly fits is cut at a word boundary
+The tokens saved are logged for every query and counted in telemetry.
+"""
+import ast
+import logging
+import time
+
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+from llama_index.core.utils import print_text
+
+from canonical import entity_key, relation_key
+from entity_index import normalize
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# KnowledgeGraphRAGRetriever writes kg_rel_text, KGTableRetriever kg_rel_texts
+REL_TEXT_KEYS = ("kg_rel_text", "kg_rel_texts")
+FACTS_HEADER = "Knowledge graph facts, as subject: relation object; ...\n"
+
+
+def parse_triplet(text):
+    """(subj, rel, obj) from "['subj', 'rel', 'obj']", None for other knowledge sequences"""
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return None
+    if isinstance(value, (list, tuple)) and len(value) == 3:
+        return tuple(str(part) for part in value)
+    return None
+
+
+def render_facts(triplets):
+    """Triplets grouped by subject and relation, one line per subject"""
+    grouped = {}
+    for subj, rel, obj in triplets:
+        grouped.setdefault(subj, {}).setdefault(rel, []).append(obj)
+    return "\n".join(
+        f"{subj}: " + "; ".join(f"{rel} {', '.join(objs)}" for rel, objs in rels.items())
+        for subj, rels in grouped.items()
+    )
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """Node postprocessor fitting the retrieved facts and snippets into token_budget tokens
+
+    Tokens are counted with tokenizer (default Settings.tokenizer), which
+    need not be the answering model's own; leave some headroom in the budget.
+    """
+
+    token_budget: int = 1500
+    # a snippet is cut to fit only if at least this many tokens are left for it
+    min_snippet_tokens: int = 64
+    verbose: bool = False
+    _tokenizer = PrivateAttr()
+
+    def __init__(self, token_budget=1500, tokenizer=None, **kwargs):
+        super().__init__(token_budget=token_budget, **kwargs)
+        self._tokenizer = tokenizer or Settings.tokenizer
+
+    @classmethod
+    def class_name(cls):
+        return "ContextPacker"
+
+    def count(self, text):
+        return len(self._tokenizer(text))
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if not nodes:
+            return nodes
+        start = time.perf_counter()
+        tokens_in = sum(self.count(node.node.get_content(metadata_mode=MetadataMode.LLM))
+                        for node in nodes)
+        packed = self.pack(nodes)
+        tokens_out = sum(self.count(node.node.get_content(metadata_mode=MetadataMode.LLM))
+                         for node in packed)
+        saved = max(tokens_in - tokens_out, 0)
+        telemetry.record_span("context_pack", start, time.perf_counter() - start,
+                              tokens_in=tokens_in, tokens_out=tokens_out)
+        telemetry.incr("context_tokens_saved_total", saved)
+        telemetry.observe("context_tokens", tokens_out)
+        logger.info("Context packed from %d to %d tokens (%d saved), %d nodes -> %d",
+                    tokens_in, tokens_out, saved, len(nodes), len(packed))
+        if self.verbose:
+            print_text(f"Context: {tokens_in} -> {tokens_out} tokens ({saved} saved)\n",
+                       color="green")
+        return packed
+
+    def pack(self, nodes):
+        """The nodes rewritten into the budget, in their order"""
+        remaining = self.token_budget
+        seen_facts = set()
+        kept_snippets = []  # normalized texts
+        packed = []
+        for node in nodes:
+            rel_texts, key = self._rel_texts(node)
+            if rel_texts is not None:
+                fact_node, remaining = self._pack_facts(node, rel_texts, key, seen_facts,
+                                                        remaining)
+                if fact_node is not None:
+                    packed.append(fact_node)
+                continue
+
+            text = node.node.get_content(metadata_mode=MetadataMode.LLM)
+            normalized = normalize(text)
+            if not normalized or any(normalized in other for other in kept_snippets):
+                continue
+            cost = self.count(text)
+            if cost > remaining:
+                node = self._truncate(node, remaining)
+                if node is None:
+                    continue
+                cost = self.count(node.node.get_content(metadata_mode=MetadataMode.LLM))
+            kept_snippets.append(normalized)
+            packed.append(node)
+            remaining -= cost
+        return packed
+
+    @staticmethod
+    def _rel_texts(node):
+        for key in REL_TEXT_KEYS:
+            rel_texts = node.node.metadata.get(key)
+            if rel_texts:
+                return list(rel_texts), key
+        return None, None
+
+    def _pack_facts(self, node, rel_texts, key, seen_facts, remaining):
+        """A node with the knowledge sequence's new facts that fit, and the budget left"""
+        header = self.count(FACTS_HEADER)
+        remaining -= header
+        triplets, other, kept = [], [], []
+        subjects = set()
+        for text in rel_texts:
+            triplet = parse_triplet(text)
+            if triplet is None:
+                # a path of another shape (Neo4jGraphStore.get_rel_map), kept as is
+                fact, cost = text, self.count(text + "\n")
+            else:
+                subj, rel, obj = triplet
+                fact = (entity_key(subj), relation_key(rel), entity_key(obj))
+                cost = self.count(f"{rel} {obj}; ")
+                if subj not in subjects:
+                    cost += self.count(f"\n{subj}: ")
+            if fact in seen_facts or cost > remaining:
+                continue
+            seen_facts.add(fact)
+            remaining -= cost
+            kept.append(text)
+            if triplet is None:
+                other.append(text)
+            else:
+                subjects.add(triplet[0])
+                triplets.append(triplet)
+        if not kept:
+            return None, remaining + header
+
+        text = FACTS_HEADER + "\n".join(filter(None, [render_facts(triplets), *other]))
+        metadata = dict(node.node.metadata)
+        metadata[key] = kept
+        excluded = list(metadata)
+        packed = TextNode(text=text, metadata=metadata, excluded_embed_metadata_keys=excluded,
+                          excluded_llm_metadata_keys=excluded)
+        return NodeWithScore(node=packed, score=node.score), remaining
+
+    def _truncate(self, node, budget):
+        """A copy of a text node cut at a word boundary to at most budget tokens, or None
+        if fewer than min_snippet_tokens of its text would be left"""
+        text = node.node.get_content(metadata_mode=MetadataMode.NONE)
+        metadata_tokens = (self.count(node.node.get_content(metadata_mode=MetadataMode.LLM))
+                           - self.count(text))
+        budget -= max(metadata_tokens, 0) + self.count(" ...")
+        if budget < self.min_snippet_tokens:
+            return None
+        cut = len(text)
+        while cut > 0 and self.count(text[:cut]) > budget:
+            cut = int(cut * min(0.9, budget / max(self.count(text[:cut]), 1)))
+        text = text[:cut].rsplit(None, 1)[0] if " " in text[:cut] else text[:cut]
+        copy = node.node.model_copy()
+        copy.set_content(text + " ...")
+        return NodeWithScore(node=copy, score=node.score)
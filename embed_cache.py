@@ -0,0 +1,214 @@
+"""Persistent on-disk cache in front of the embedding model
+
+Vectors live in a memory-mapped float32 file, one row per cached text, and a
+small JSON index maps sha256(model, kind, text) to a row in least recently used
+order. Once max_entries rows are used the least recently used row is reused.
+Batch lookups only send the misses to the wrapped model.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 1024
+# new vectors between index writes
+SAVE_EVERY = 256
+
+
+class EmbeddingStore:
+    """Fixed-width float32 vectors keyed by string, with LRU eviction"""
+
+    def __init__(self, directory, max_entries=200_000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()  # key -> row, least recently used first
+        self._dim = None
+        self._capacity = 0
+        self._vectors = None
+        self._unsaved = 0
+
+        if os.path.exists(self._index_path) and os.path.exists(self._vectors_path):
+            with open(self._index_path) as f:
+                index = json.load(f)
+            self._dim, self._capacity = index["dim"], index["capacity"]
+            self._slots = OrderedDict((key, row) for key, row in index["keys"])
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                      shape=(self._capacity, self._dim))
+        atexit.register(self.save)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self._slots.get(key)
+                if row is None:
+                    continue
+                self._slots.move_to_end(key)
+                found[key] = np.array(self._vectors[row])
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        telemetry.incr("cache_hits_total", len(found), cache="embedding")
+        telemetry.incr("cache_misses_total", len(set(keys)) - len(found), cache="embedding")
+        return found
+
+    def put_many(self, items):
+        """Cache {key: vector}, evicting the least recently used rows when full"""
+        with self._lock:
+            for key, vector in items.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                if self._dim is None:
+                    self._dim = len(vector)
+                elif len(vector) != self._dim:
+                    raise ValueError(f"Embedding has {len(vector)} dimensions, "
+                                     f"cache at {self.directory} holds {self._dim}")
+                row = self._slots.pop(key, None)
+                if row is None:
+                    row = self._free_row()
+                self._slots[key] = row
+                self._vectors[row] = vector
+                self._unsaved += 1
+            if self._unsaved >= SAVE_EVERY:
+                self._save()
+
+    def _free_row(self):
+        if len(self._slots) < self._capacity:
+            return len(self._slots)
+        if self._capacity < self.max_entries:
+            self._grow(min(max(2 * self._capacity, INITIAL_CAPACITY), self.max_entries))
+            return len(self._slots)
+        _, row = self._slots.popitem(last=False)
+        return row
+
+    def _grow(self, capacity):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self._dim * np.dtype(np.float32).itemsize)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(capacity, self._dim))
+        self._capacity = capacity
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def close(self):
+        self.save()
+        atexit.unregister(self.save)
+        if self._vectors is not None:
+            del self._vectors
+            self._vectors = None
+
+    def _save(self):
+        if self._vectors is None:
+            return
+        # vectors first, so the index never points at rows that aren't on disk
+        self._vectors.flush()
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self._dim, "capacity": self._capacity,
+                       "keys": list(self._slots.items())}, f)
+        os.replace(tmp_path, self._index_path)
+        self._unsaved = 0
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves repeated texts from an EmbeddingStore"""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+
+    def __init__(self, embed_model, store, **kwargs):
+        super().__init__(model_name=embed_model.model_name,
+                         embed_batch_size=embed_model.embed_batch_size, **kwargs)
+        self._embed_model = embed_model
+        self._store = store
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def store(self):
+        return self._store
+
+    def _keys(self, kind, texts):
+        # queries and documents are embedded differently by some models
+        return [
+            hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+            for text in texts
+        ]
+
+    def _lookup(self, kind, texts):
+        keys = self._keys(kind, texts)
+        found = self._store.get_many(keys)
+        first = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                first.setdefault(key, i)
+        return keys, found, list(first.values())
+
+    def _merge(self, keys, found, misses, embeddings):
+        self._store.put_many({keys[i]: e for i, e in zip(misses, embeddings)})
+        found.update({keys[i]: np.asarray(e, dtype=np.float32) for i, e in zip(misses, embeddings)})
+        return [found[key].tolist() for key in keys]
+
+    def _get_query_embedding(self, query):
+        keys, found, misses = self._lookup("query", [query])
+        embeddings = [self._embed_model.get_query_embedding(query)] if misses else []
+        return self._merge(keys, found, misses, embeddings)[0]
+
+    async def _aget_query_embedding(self, query):
+        keys, found, misses = self._lookup("query", [query])
+        embeddings = [await self._embed_model.aget_query_embedding(query)] if misses else []
+        return self._merge(keys, found, misses, embeddings)[0]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts):
+        keys, found, misses = self._lookup("text", texts)
+        embeddings = []
+        if misses:
+            embeddings = self._embed_model.get_text_embedding_batch([texts[i] for i in misses])
+        return self._merge(keys, found, misses, embeddings)
+
+    async def _aget_text_embeddings(self, texts):
+        keys, found, misses = self._lookup("text", texts)
+        embeddings = []
+        if misses:
+            embeddings = await self._embed_model.aget_text_embedding_batch(
+                [texts[i] for i in misses])
+        return self._merge(keys, found, misses, embeddings)
+
+
+def cached_embed_model(embed_model, cache_dir, max_entries=200_000):
+    """Wrap embed_model with a cache stored under cache_dir/<model name>"""
+    directory = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", embed_model.model_name))
+    return CachedEmbedding(embed_model, EmbeddingStore(directory, max_entries))
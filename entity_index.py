@@ -0,0 +1,180 @@
+"""Entity lexicon for resolving query entities without the LLM
+
+KnowledgeGraphRAGRetriever asks the LLM for keywords and then for synonyms of
+those keywords before every graph lookup, two model round trips per query. The
+graph's own entity names are known once ingestion is done, so EntityIndex
+matches the query against them instead: exact phrase matches on normalized
+names and aliases first, then typo-tolerant trigram matches, then optionally
+nearest neighbours by embedding. It is rebuilt by build_knowledge_graph
+whenever the graph changes, together with the number of relationships of each
+entity, which budgeted traversal (traversal.py) uses to recognize hubs.
+"""
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+# longest entity name, in words, matched as a phrase
+MAX_PHRASE_WORDS = 6
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or "
+    "that the their there these this to was what when where which who why will with you your"
+    .split()
+)
+
+
+def normalize(text):
+    """Lowercase words without punctuation, e.g. 'SAP  HANA®' -> 'sap hana'"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def aliases(name):
+    """Normalized forms a name may be written as in a question"""
+    words = normalize(name)
+    forms = {words, words.replace(" ", "")}
+    return {form for form in forms if form and form not in STOPWORDS}
+
+
+class EntityIndex:
+    """Entity names of one graph version, with phrase, trigram and embedding lookups
+
+    extra_aliases maps additional spellings (e.g. {"hana": "SAP HANA"}) to
+    entity names, and degrees entity names to their number of relationships.
+    """
+
+    def __init__(self, names, graph_version="", extra_aliases=None, embed_model=None,
+                 fuzzy_threshold=0.6, embed_threshold=0.8, degrees=None):
+        self.names = sorted(set(names))
+        self.graph_version = graph_version
+        self.extra_aliases = dict(extra_aliases or {})
+        self.degrees = dict(degrees or {})
+        self._degrees = Counter()
+        for name, count in self.degrees.items():
+            self._degrees[name.lower()] += count
+        self.embed_model = embed_model
+        self.fuzzy_threshold = fuzzy_threshold
+        self.embed_threshold = embed_threshold
+
+        self._by_alias = defaultdict(set)  # alias -> entity ids
+        for entity, name in enumerate(self.names):
+            for alias in aliases(name):
+                self._by_alias[alias].add(entity)
+        ids = {name: entity for entity, name in enumerate(self.names)}
+        for alias, name in self.extra_aliases.items():
+            if name in ids:
+                self._by_alias[normalize(alias)].add(ids[name])
+
+        self._alias_list = sorted(self._by_alias)
+        self._by_trigram = defaultdict(list)  # trigram -> alias positions
+        for position, alias in enumerate(self._alias_list):
+            for gram in trigrams(alias):
+                self._by_trigram[gram].append(position)
+
+        self._vectors = None
+        if embed_model is not None and self.names:
+            vectors = np.asarray(embed_model.get_text_embedding_batch(self.names), dtype=np.float32)
+            self._vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(1e-12)
+
+    def __len__(self):
+        return len(self.names)
+
+    def degree(self, name):
+        """Number of relationships of an entity, ignoring case like graph lookups; 0 if unknown"""
+        return self._degrees.get(name.lower(), 0)
+
+    def resolve(self, query, max_entities=10):
+        """Entity names mentioned in query, best matches first"""
+        words = normalize(query).split()
+        scores = {}
+        covered = set()
+
+        # longest phrases first, so "sap hana" wins over "hana"
+        for length in range(min(MAX_PHRASE_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                span = range(start, start + length)
+                if covered.intersection(span):
+                    continue
+                phrase = " ".join(words[start:start + length])
+                entities = self._by_alias.get(phrase) or self._by_alias.get(phrase.replace(" ", ""))
+                if entities:
+                    covered.update(span)
+                    for entity in entities:
+                        scores[entity] = max(scores.get(entity, 0.0), 1.0 + length)
+
+        leftover = [w for i, w in enumerate(words)
+                    if i not in covered and w not in STOPWORDS and len(w) >= 4]
+        for word in leftover:
+            for entity, similarity in self._fuzzy(word):
+                scores[entity] = max(scores.get(entity, 0.0), similarity)
+
+        if not scores and self._vectors is not None:
+            for entity, similarity in self._nearest(query):
+                scores[entity] = similarity
+
+        ranked = sorted(scores, key=lambda entity: (-scores[entity], self.names[entity]))
+        return [self.names[entity] for entity in ranked[:max_entities]]
+
+    def _fuzzy(self, word):
+        grams = trigrams(word)
+        shared = Counter(position for gram in grams for position in self._by_trigram.get(gram, ()))
+        for position, count in shared.most_common(20):
+            alias = self._alias_list[position]
+            similarity = count / len(grams | trigrams(alias))
+            if similarity >= self.fuzzy_threshold:
+                for entity in self._by_alias[alias]:
+                    yield entity, similarity
+
+    def _nearest(self, query, k=5):
+        vector = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+        similarity = self._vectors @ (vector / (np.linalg.norm(vector) or 1.0))
+        for entity in np.argsort(-similarity)[:k]:
+            if similarity[entity] >= self.embed_threshold:
+                yield int(entity), float(similarity[entity])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"version": INDEX_VERSION, "graph_version": self.graph_version,
+                       "names": self.names, "aliases": self.extra_aliases,
+                       "degrees": self.degrees}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, embed_model=None, **kwargs):
+        """The index saved at path, or None if there is none of this format"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        return cls(data["names"], data["graph_version"], data["aliases"],
+                   embed_model=embed_model, degrees=data["degrees"], **kwargs)
+
+
+def update_entity_index(path, names, graph_version, degrees=None):
+    """Rebuild the index at path from the graph's entity names (and degrees) if the
+    graph changed"""
+    index = EntityIndex.load(path)
+    if index is not None and index.graph_version == graph_version:
+        return index
+    index = EntityIndex(names, graph_version,
+                        extra_aliases=index.extra_aliases if index is not None else None,
+                        degrees=degrees)
+    index.save(path)
+    logger.info("Entity index rebuilt with %d entities", len(index))
+    return index
@@ -0,0 +1,230 @@
+"""Triplet extraction with the LLM, outside of KnowledgeGraphIndex
+
+KnowledgeGraphIndex.from_documents extracts and writes in one go, which leaves
+no way to see which triplets came from which chunk. Doing the extraction here
+keeps the same prompt and parser but hands the triplets back to the caller.
+
+Small chunks can also be extracted several at a time: batch_chunks() groups
+them up to a token budget, and one prompt asks for the triplets of each
+numbered chunk under its own "Chunk <n>:" line, so every triplet is still
+attributed to the chunk it came from. Chunks the answer leaves out, or all of
+them if it cannot be attributed, are extracted one by one.
+"""
+import logging
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llama_index.core import KnowledgeGraphIndex, Settings
+from llama_index.core.prompts import PromptTemplate, PromptType
+from llama_index.core.prompts.default_prompts import DEFAULT_KG_TRIPLET_EXTRACT_PROMPT
+
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# deepseek-r1 reasons inside <think> tags before answering, and the reasoning
+# often contains parenthesised text that the triplet parser would pick up
+THINK_BLOCK = re.compile(r"<think>.*?(</think>|$)", re.DOTALL)
+
+# DEFAULT_KG_TRIPLET_EXTRACT_PROMPT for several chunks, with the same examples
+BATCH_KG_TRIPLET_EXTRACT_PROMPT = PromptTemplate(
+    "Some text is provided below, split into numbered chunks. For each chunk, extract up to "
+    "{max_knowledge_triplets} "
+    "knowledge triplets in the form of (subject, predicate, object) from that chunk only. "
+    "Avoid stopwords.\n"
+    "Answer with a line \"Chunk <number>:\" for every chunk, in order, followed by its "
+    "triplets, one per line. Write the line of a chunk even if it has no triplets.\n"
+    "---------------------\n"
+    "Example:\n"
+    "[Chunk 1]\nAlice is Bob's mother.\n"
+    "[Chunk 2]\nPhilz is a coffee shop founded in Berkeley in 1982.\n"
+    "Triplets by chunk:\n"
+    "Chunk 1:\n(Alice, is mother of, Bob)\n"
+    "Chunk 2:\n"
+    "(Philz, is, coffee shop)\n"
+    "(Philz, founded in, Berkeley)\n"
+    "(Philz, founded in, 1982)\n"
+    "---------------------\n"
+    "{text}\n"
+    "Triplets by chunk:\n",
+    prompt_type=PromptType.KNOWLEDGE_TRIPLET_EXTRACT,
+)
+# "Chunk 2:", "**Chunk 2**", "[Chunk 2]" or "### Chunk 2", possibly followed by a triplet
+CHUNK_HEADER = re.compile(r"^[ \t#*\[]*chunk[ \t]+(\d+)[ \t\]:.*]*(.*)$",
+                          re.IGNORECASE | re.MULTILINE)
+
+
+class MalformedBatch(ValueError):
+    """The answer to a batch prompt cannot be attributed to its chunks"""
+
+
+def strip_thinking(text):
+    """Remove <think>...</think> reasoning blocks from a model response"""
+    return THINK_BLOCK.sub("", text)
+
+
+def extract_triplets(llm, text, max_triplets_per_chunk=8, max_object_length=128,
+                     prompt=DEFAULT_KG_TRIPLET_EXTRACT_PROMPT):
+    """Ask the LLM for (subject, predicate, object) triplets found in text
+
+    Uses the same prompt and response parser as KnowledgeGraphIndex, so the
+    graph looks the same as one built with from_documents.
+    """
+    with telemetry.span("extract", chars=len(text)):
+        response = llm.predict(
+            prompt.partial_format(max_knowledge_triplets=max_triplets_per_chunk),
+            text=text,
+        )
+    triplets = KnowledgeGraphIndex._parse_triplet_response(
+        strip_thinking(response), max_length=max_object_length
+    )
+    logger.debug("Extracted triplets: %s", triplets)
+    return triplets
+
+
+def format_batch(texts):
+    return "\n".join(f"[Chunk {i}]\n{text.strip()}" for i, text in enumerate(texts, start=1))
+
+
+def parse_batch_response(response, count, max_object_length=128):
+    """[triplets] per chunk from a batch answer, None for chunks it has no line for
+
+    Raises MalformedBatch if there is no chunk line at all, a chunk number
+    appears twice or is out of range, or triplets come before the first one.
+    """
+    headers = list(CHUNK_HEADER.finditer(response))
+    if not headers:
+        raise MalformedBatch("no chunk lines")
+    if KnowledgeGraphIndex._parse_triplet_response(response[:headers[0].start()]):
+        raise MalformedBatch("triplets before the first chunk line")
+    results = [None] * count
+    for header, following in zip(headers, headers[1:] + [None]):
+        number = int(header.group(1))
+        if not 1 <= number <= count or results[number - 1] is not None:
+            raise MalformedBatch(f"chunk {number} out of range or repeated")
+        section = response[header.start(2):following.start() if following else len(response)]
+        results[number - 1] = KnowledgeGraphIndex._parse_triplet_response(
+            section, max_length=max_object_length
+        )
+    return results
+
+
+def extract_batch(llm, texts, max_triplets_per_chunk=8, max_object_length=128,
+                  prompt=BATCH_KG_TRIPLET_EXTRACT_PROMPT):
+    """Triplets for each of texts from one prompt, None for chunks the answer left out"""
+    with telemetry.span("extract", chars=sum(map(len, texts)), chunks=len(texts)):
+        response = llm.predict(
+            prompt.partial_format(max_knowledge_triplets=max_triplets_per_chunk),
+            text=format_batch(texts),
+        )
+    telemetry.incr("extraction_batches_total")
+    return parse_batch_response(strip_thinking(response), len(texts), max_object_length)
+
+
+def batch_chunks(chunks, max_tokens, max_chunks=4, tokenizer=None):
+    """Group (key, text) pairs into lists of consecutive chunks of at most max_tokens
+
+    A chunk longer than max_tokens on its own is a list by itself. Lazy, one
+    chunk ahead of the lists yielded.
+    """
+    tokenizer = tokenizer or Settings.tokenizer
+    batch, tokens = [], 0
+    for key, text in chunks:
+        size = len(tokenizer(text))
+        if batch and (tokens + size > max_tokens or len(batch) >= max_chunks):
+            yield batch
+            batch, tokens = [], 0
+        batch.append((key, text))
+        tokens += size
+    if batch:
+        yield batch
+
+
+def _with_retries(call, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except MalformedBatch:
+            # the same prompt gets the same (cached) answer
+            raise
+        except Exception as e:
+            if attempt == retries:
+                telemetry.incr("extraction_failures_total")
+                raise
+            telemetry.incr("extraction_retries_total")
+            delay = backoff * 2 ** attempt
+            logger.warning("Triplet extraction failed (%s), retrying in %.0fs", e, delay)
+            time.sleep(delay)
+
+
+def _extract_with_retries(llm, text, max_triplets_per_chunk, retries, backoff):
+    return _with_retries(lambda: extract_triplets(llm, text, max_triplets_per_chunk),
+                         retries, backoff)
+
+
+def _extract_batch_with_retries(llm, batch, max_triplets_per_chunk, retries, backoff):
+    """[(key, triplets)] for a list of (key, text), chunk by chunk where the batch answer fails"""
+    if len(batch) == 1:
+        key, text = batch[0]
+        return [(key, _extract_with_retries(llm, text, max_triplets_per_chunk, retries, backoff))]
+    texts = [text for _, text in batch]
+    try:
+        results = _with_retries(lambda: extract_batch(llm, texts, max_triplets_per_chunk),
+                                retries, backoff)
+    except MalformedBatch as e:
+        logger.warning("Unusable answer for %d chunks (%s), extracting them one by one",
+                       len(batch), e)
+        results = [None] * len(batch)
+    telemetry.incr("extraction_batch_fallbacks_total", results.count(None))
+    return [(key, triplets if triplets is not None else
+             _extract_with_retries(llm, text, max_triplets_per_chunk, retries, backoff))
+            for (key, text), triplets in zip(batch, results)]
+
+
+def extract_concurrently(llm, chunks, max_triplets_per_chunk=8, concurrency=4,
+                         retries=2, backoff=2.0, batch_tokens=0, batch_size=4,
+                         on_failure=None):
+    """Extract triplets for (key, text) pairs with several requests in flight
+
+    Yields (key, triplets) in completion order. chunks is consumed lazily, never
+    more than `concurrency` requests ahead of the results, so it can be a
+    generator over a large corpus. The per-request timeout is the llm's
+    request_timeout; a request that fails is retried with exponential backoff
+    before the error is raised, or with on_failure, passed to
+    on_failure(key, error) for each of its chunks while the others go on.
+    With batch_tokens, up to batch_size consecutive chunks of at most
+    batch_tokens tokens together are extracted with one prompt.
+    """
+    if batch_tokens:
+        batches = batch_chunks(chunks, batch_tokens, batch_size)
+    else:
+        batches = ([item] for item in chunks)
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="extract") as pool:
+
+        def submit_next():
+            batch = next(batches, None)
+            if batch is None:
+                return False
+            future = pool.submit(_extract_batch_with_retries, llm, batch,
+                                 max_triplets_per_chunk, retries, backoff)
+            in_flight[future] = batch
+            return True
+
+        while len(in_flight) < concurrency and submit_next():
+            pass
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    if on_failure is None:
+                        raise
+                    for key, _ in batch:
+                        on_failure(key, e)
+                    results = []
+                yield from results
+                submit_next()
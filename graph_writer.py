@@ -0,0 +1,195 @@
+"""Batched triplet writes to the graph store
+
+Neo4jGraphStore.upsert_triplet opens a session and runs one MERGE per edge,
+which against Aura means one network round trip per triplet. The writers here
+buffer upserts and deletes and apply them in batches, for Neo4j as a handful of
+UNWIND statements inside a single transaction, for the embedded CSRGraphStore
+as one array merge and persist.
+"""
+import logging
+import time
+from itertools import groupby
+
+from llama_index.graph_stores.neo4j import Neo4jGraphStore
+
+from local_graph_store import CSRGraphStore
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+UPSERT, DELETE = "upsert", "delete"
+
+
+def neo4j_rel_type(rel):
+    """Relationship type Neo4jGraphStore.upsert_triplet stores a predicate as"""
+    return rel.replace(" ", "_").upper()
+
+
+def _quote(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+class TripletWriter:
+    """Buffers triplet upserts and deletes and applies them in batches
+
+    Operations are applied in the order they were made, once batch_size are
+    queued or once an operation is queued max_delay seconds after the previous
+    flush, so a slow trickle of triplets still reaches the graph promptly.
+    on_flush is called after every flush, once everything queued so far is in
+    the graph store.
+    This base class applies a batch through the plain GraphStore interface.
+    """
+
+    def __init__(self, graph_store, batch_size=1000, max_delay=None, on_flush=None):
+        self.graph_store = graph_store
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self.round_trips = 0
+        self._ops = []
+        self._last_flush = time.monotonic()
+
+    def upsert(self, subj, rel, obj):
+        self._add(UPSERT, (subj, rel, obj))
+
+    def delete(self, subj, rel, obj):
+        self._add(DELETE, (subj, rel, obj))
+
+    def _add(self, op, triplet):
+        self._ops.append((op, triplet))
+        if len(self._ops) >= self.batch_size or (
+                self.max_delay is not None
+                and time.monotonic() - self._last_flush >= self.max_delay):
+            self.flush()
+
+    def flush(self):
+        if self._ops:
+            # kept queued until written: after a failed write the next flush
+            # retries them (upserts and deletes are idempotent), and on_flush
+            # never runs with operations missing from the graph store
+            ops = self._ops
+            round_trips = self.round_trips
+            with telemetry.span("graph_write", operations=len(ops)):
+                self._write(ops)
+            self._ops = []
+            telemetry.incr("graph_round_trips_total", self.round_trips - round_trips,
+                           store=type(self.graph_store).__name__)
+        self._last_flush = time.monotonic()
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _write(self, ops):
+        for op, triplet in ops:
+            if op == UPSERT:
+                self.graph_store.upsert_triplet(*triplet)
+            else:
+                self.graph_store.delete(*triplet)
+            self.round_trips += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+class Neo4jTripletWriter(TripletWriter):
+    """Writes each batch as one transaction of UNWIND statements
+
+    Relationship types cannot be parameters in Cypher, so a batch becomes one
+    statement per relationship type. Entities left without relationships by a
+    delete are removed, like Neo4jGraphStore.delete intends to.
+    """
+
+    def __init__(self, graph_store, batch_size=1000, max_delay=None, on_flush=None):
+        super().__init__(graph_store, batch_size, max_delay, on_flush)
+        self._driver = graph_store.client
+        self._database = graph_store._database
+        self._label = _quote(graph_store.node_label)
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        """Unique constraint on entity ids, which also indexes MERGE lookups"""
+        self.graph_store.query(
+            f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{self._label}) REQUIRE n.id IS UNIQUE"
+        )
+        self.round_trips += 1
+
+    def _write(self, ops):
+        with self._driver.session(database=self._database) as session:
+            session.execute_write(self._write_tx, ops)
+        self.round_trips += 1
+        logger.debug("Wrote %d triplet operations to Neo4j", len(ops))
+
+    def _write_tx(self, tx, ops):
+        # consecutive operations of the same kind can be reordered freely
+        for op, run in groupby(ops, key=lambda item: item[0]):
+            triplets = [triplet for _, triplet in run]
+            if op == UPSERT:
+                self._upsert_tx(tx, triplets)
+            else:
+                self._delete_tx(tx, triplets)
+
+    @staticmethod
+    def _by_rel_type(triplets):
+        rows = {}
+        for subj, rel, obj in triplets:
+            rows.setdefault(neo4j_rel_type(rel), []).append({"subj": subj, "obj": obj})
+        return rows.items()
+
+    def _upsert_tx(self, tx, triplets):
+        for rel_type, rows in self._by_rel_type(triplets):
+            tx.run(
+                f"UNWIND $rows AS row "
+                f"MERGE (n1:{self._label} {{id: row.subj}}) "
+                f"MERGE (n2:{self._label} {{id: row.obj}}) "
+                f"MERGE (n1)-[:{_quote(rel_type)}]->(n2)",
+                rows=rows,
+            ).consume()
+
+    def _delete_tx(self, tx, triplets):
+        for rel_type, rows in self._by_rel_type(triplets):
+            tx.run(
+                f"UNWIND $rows AS row "
+                f"MATCH (:{self._label} {{id: row.subj}})-[r:{_quote(rel_type)}]->"
+                f"(:{self._label} {{id: row.obj}}) "
+                f"DELETE r",
+                rows=rows,
+            ).consume()
+        entities = list({e for subj, _, obj in triplets for e in (subj, obj)})
+        tx.run(
+            f"UNWIND $ids AS id "
+            f"MATCH (n:{self._label} {{id: id}}) "
+            f"WHERE NOT (n)--() "
+            f"DELETE n",
+            ids=entities,
+        ).consume()
+
+
+class CSRTripletWriter(TripletWriter):
+    """Applies each batch to a CSRGraphStore and persists it
+
+    Persisting before on_flush keeps the store on disk at least as new as
+    whatever on_flush records (the ingestion manifest).
+    """
+
+    def _write(self, ops):
+        for op, run in groupby(ops, key=lambda item: item[0]):
+            triplets = [triplet for _, triplet in run]
+            if op == UPSERT:
+                self.graph_store.upsert_triplets(triplets)
+            else:
+                self.graph_store.delete_triplets(triplets)
+        self.graph_store.persist()
+        self.round_trips += 1
+
+
+def make_triplet_writer(graph_store, batch_size=1000, max_delay=None, on_flush=None):
+    """Writer suited to graph_store: bulk UNWIND for Neo4j, batched arrays for
+    CSRGraphStore, per-triplet otherwise"""
+    if isinstance(graph_store, Neo4jGraphStore):
+        return Neo4jTripletWriter(graph_store, batch_size, max_delay, on_flush)
+    if isinstance(graph_store, CSRGraphStore):
+        return CSRTripletWriter(graph_store, batch_size, max_delay, on_flush)
+    return TripletWriter(graph_store, batch_size, max_delay, on_flush)
@@ -0,0 +1,445 @@
+"""Incremental knowledge graph ingestion
+
+Every chunk is hashed and recorded in a manifest together with the triplets the
+LLM extracted from it. On the next run only chunks whose hash is not in the
+manifest are sent to the LLM, and triplets are removed from the graph once no
+remaining chunk produced them. An unchanged corpus costs no LLM calls at all.
+
+The manifest is also the build's checkpoint: it is saved whenever a batch of
+triplets has been written, and once more when the build fails or is
+interrupted, so a restarted build resumes with the chunks not recorded yet.
+Chunks whose extraction still fails after the retries are kept in a dead letter
+list instead of failing the build; a chunk that failed in several runs is
+skipped by later ones until they are asked to retry the dead letters.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from itertools import groupby
+
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode
+from tqdm import tqdm
+
+from extraction import extract_concurrently
+from entity_index import update_entity_index
+from graph_writer import make_triplet_writer
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+DEAD_LETTERS_VERSION = 1
+
+
+def prefetch(iterable, max_ahead):
+    """Iterate over iterable in a background thread, at most max_ahead items ahead
+
+    The bounded queue is the backpressure: when the consumer falls behind, the
+    producer blocks instead of piling items up in memory.
+    """
+    items = queue.Queue(maxsize=max_ahead)
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            items.put((done, None))
+        except Exception as e:
+            items.put((done, e))
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def stream_documents(reader, files_ahead=2):
+    """Yield a SimpleDirectoryReader's documents file by file as they are parsed
+
+    Unlike load_data(), only the file being indexed and the next few are held
+    in memory, and indexing starts as soon as the first file is parsed.
+    """
+    for file_docs in prefetch(reader.iter_data(), files_ahead):
+        yield from file_docs
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_key(doc):
+    """Identify the source file a document (PDF page) was loaded from"""
+    return doc.metadata.get("file_path") or doc.ref_doc_id or doc.doc_id
+
+
+def write_json(path, data):
+    """Write data to path atomically, so a crash never leaves the file half written"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class IngestionManifest:
+    """Chunk hashes per source document, with the triplets each chunk produced
+
+    The manifest belongs to one graph: if graph_id differs from the one it was
+    written for (e.g. NEO4J_URI changed), it starts out empty so the new graph
+    is built from scratch.
+    """
+
+    def __init__(self, path, graph_id):
+        self.path = path
+        self.graph_id = graph_id
+        self._documents = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and data.get("graph") == graph_id:
+                self._documents = {
+                    doc_key: {h: [tuple(t) for t in triplets] for h, triplets in chunks.items()}
+                    for doc_key, chunks in data["documents"].items()
+                }
+            else:
+                logger.warning("Ignoring manifest %s, it was written for another graph", path)
+        self._refcounts = Counter(
+            t for chunks in self._documents.values()
+            for triplets in chunks.values() for t in set(triplets)
+        )
+
+    def documents(self):
+        return set(self._documents)
+
+    def chunks(self, doc_key):
+        return self._documents.get(doc_key, {})
+
+    def record(self, doc_key, chunk, triplets):
+        """Remember the triplets extracted from a chunk"""
+        triplets = list(dict.fromkeys(tuple(t) for t in triplets))
+        self._documents.setdefault(doc_key, {})[chunk] = triplets
+        self._refcounts.update(triplets)
+
+    def orphans(self, doc_key, chunk):
+        """Triplets of a chunk that no other chunk references"""
+        return [t for t in self.chunks(doc_key).get(chunk, []) if self._refcounts[t] <= 1]
+
+    def forget(self, doc_key, chunk):
+        """Drop a chunk, returning the triplets no other chunk references any more"""
+        chunks = self._documents.get(doc_key, {})
+        orphaned = []
+        for t in chunks.pop(chunk, []):
+            self._refcounts[t] -= 1
+            if self._refcounts[t] <= 0:
+                del self._refcounts[t]
+                orphaned.append(t)
+        if doc_key in self._documents and not chunks:
+            del self._documents[doc_key]
+        return orphaned
+
+    def entities(self):
+        """Subjects and objects of all recorded triplets, i.e. the graph's entities"""
+        return {entity for subj, _, obj in self._refcounts for entity in (subj, obj)}
+
+    def degrees(self):
+        """Number of relationships of each entity"""
+        return Counter(entity for subj, _, obj in self._refcounts for entity in (subj, obj))
+
+    def fingerprint(self):
+        """Digest of the chunks the graph was built from, changing whenever the graph does"""
+        chunks = sorted((doc_key, sorted(chunks)) for doc_key, chunks in self._documents.items())
+        return hashlib.sha256(json.dumps([self.graph_id, chunks]).encode("utf-8")).hexdigest()
+
+    def save(self):
+        write_json(self.path, {
+            "version": MANIFEST_VERSION,
+            "graph": self.graph_id,
+            "documents": self._documents,
+        })
+
+
+class DeadLetters:
+    """Chunks whose extraction failed, with the number of runs they failed in
+
+    A chunk that failed in `after` runs is dead: later runs skip it rather than
+    spend the retries and timeouts on it again, until they retry the dead
+    letters. Entries go away once the chunk is extracted, or is no longer part
+    of its document. Like the manifest, the list belongs to one graph.
+    """
+
+    def __init__(self, path, graph_id, after=2):
+        self.path = path
+        self.graph_id = graph_id
+        self.after = after
+        self._documents = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == DEAD_LETTERS_VERSION and data.get("graph") == graph_id:
+                self._documents = data["documents"]
+
+    def documents(self):
+        return set(self._documents)
+
+    def is_dead(self, doc_key, chunk):
+        entry = self._documents.get(doc_key, {}).get(chunk)
+        return entry is not None and entry["failures"] >= self.after
+
+    def fail(self, doc_key, chunk, error):
+        """Count a failed extraction of a chunk, returning whether it is dead now"""
+        entry = self._documents.setdefault(doc_key, {}).setdefault(chunk, {"failures": 0})
+        entry["failures"] += 1
+        entry["error"] = repr(error)
+        entry["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        return entry["failures"] >= self.after
+
+    def resolve(self, doc_key, chunk):
+        self._documents.get(doc_key, {}).pop(chunk, None)
+        if doc_key in self._documents and not self._documents[doc_key]:
+            del self._documents[doc_key]
+
+    def keep(self, doc_key, chunks=()):
+        """Forget the failures of a document's chunks other than chunks"""
+        for chunk in set(self._documents.get(doc_key, {})) - set(chunks):
+            self.resolve(doc_key, chunk)
+
+    def dead(self):
+        """[(doc_key, chunk, {"failures", "error", "time"})] of the dead chunks"""
+        return [(doc_key, chunk, entry) for doc_key, chunks in self._documents.items()
+                for chunk, entry in chunks.items() if entry["failures"] >= self.after]
+
+    def save(self):
+        write_json(self.path, {
+            "version": DEAD_LETTERS_VERSION,
+            "graph": self.graph_id,
+            "documents": self._documents,
+        })
+
+
+@dataclass
+class IngestStats:
+    documents: int = 0
+    chunks_unchanged: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    triplets_written: int = 0
+    triplets_deleted: int = 0
+    # chunks whose extraction failed in this run, and dead ones it skipped
+    chunks_failed: int = 0
+    chunks_skipped: int = 0
+    # chunks in the dead letter list after the run
+    dead_letters: int = 0
+    seconds: float = 0.0
+    # IngestionManifest.fingerprint() of the resulting graph
+    graph_version: str = ""
+    # CanonicalStats of the run, with a Canonicalizer
+    canonical: object = None
+
+    @property
+    def chunks_per_sec(self):
+        return self.chunks_added / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.documents} documents: {self.chunks_added} chunks extracted, "
+                f"{self.chunks_removed} removed, {self.chunks_unchanged} unchanged; "
+                f"{self.triplets_written} triplets written, {self.triplets_deleted} deleted "
+                f"in {self.seconds:.1f}s ({self.chunks_per_sec:.2f} chunks/sec)"
+                + (f"; {self.chunks_failed} chunks failed, {self.chunks_skipped} dead ones "
+                   f"skipped, {self.dead_letters} dead letters"
+                   if self.chunks_failed or self.dead_letters else "")
+                + (f"; canonicalized {self.canonical}" if self.canonical is not None else ""))
+
+
+def _remove_chunk(writer, manifest, doc_key, chunk, stats):
+    """Delete the triplets only this chunk produced, then drop it from the manifest
+
+    The deletes are queued first: a flush checkpoint must not save a manifest
+    without the chunk while some of its triplets are still in the graph.
+    """
+    for triplet in manifest.orphans(doc_key, chunk):
+        writer.delete(*triplet)
+        stats.triplets_deleted += 1
+    manifest.forget(doc_key, chunk)
+    stats.chunks_removed += 1
+
+
+def _pending_chunks(docs, writer, manifest, stats, seen, dead_letters=None,
+                    retry_dead_letters=False):
+    """Yield ((doc_key, chunk), text) for chunks that still need extraction
+
+    Chunks of a file that are no longer present are removed from the graph as
+    soon as the file has been chunked. Dead chunks are skipped unless
+    retry_dead_letters.
+    """
+    for doc_key, file_docs in groupby(docs, key=document_key):
+        if doc_key in seen:
+            raise ValueError(f"Documents from {doc_key} are not contiguous")
+        seen.add(doc_key)
+        stats.documents += 1
+
+        nodes = Settings.node_parser.get_nodes_from_documents(list(file_docs))
+        texts = {}
+        for node in nodes:
+            text = node.get_content(metadata_mode=MetadataMode.LLM)
+            texts[chunk_hash(text)] = text
+
+        known = manifest.chunks(doc_key)
+        for chunk in set(known) - set(texts):
+            _remove_chunk(writer, manifest, doc_key, chunk, stats)
+        if dead_letters is not None:
+            dead_letters.keep(doc_key, texts)
+
+        for chunk, text in texts.items():
+            if chunk in known:
+                stats.chunks_unchanged += 1
+            elif (dead_letters is not None and not retry_dead_letters
+                  and dead_letters.is_dead(doc_key, chunk)):
+                stats.chunks_skipped += 1
+            else:
+                yield (doc_key, chunk), text
+
+
+def build_knowledge_graph(docs, graph_store, llm, manifest_path, graph_id,
+                          max_triplets_per_chunk=8, concurrency=1, retries=2,
+                          write_batch_size=1000, write_max_delay=5.0, entity_index_path=None,
+                          canonicalizer=None, extract_batch_tokens=0, extract_batch_size=4,
+                          dead_letter_path=None, dead_letter_after=2, retry_dead_letters=False,
+                          max_consecutive_failures=10, show_progress=False):
+    """Bring the graph in line with docs, extracting triplets only for new chunks
+
+    docs must be grouped by source file, as SimpleDirectoryReader returns them,
+    and may be a generator such as stream_documents(): files are chunked and
+    extracted as they arrive.
+    Files that are in the manifest but not in docs are removed from the graph.
+    Up to `concurrency` extraction requests are sent to the LLM at once, each
+    for up to extract_batch_size chunks of extract_batch_tokens tokens together
+    if extract_batch_tokens is set (see extraction.py), and
+    triplets are written in batches of write_batch_size, or sooner when
+    write_max_delay seconds passed since the last write. The manifest is saved
+    after every batch, so it never lists chunks whose triplets aren't written,
+    and what is queued is written and saved before an error is raised.
+    With dead_letter_path, a chunk whose extraction fails after the retries is
+    recorded in the DeadLetters there and the build goes on; dead chunks (failed
+    in dead_letter_after runs) are skipped unless retry_dead_letters. Only when
+    max_consecutive_failures chunks in a row failed, as when Ollama is down, is
+    the error raised.
+    With entity_index_path, the EntityIndex there is rebuilt if the graph changed.
+    With a Canonicalizer, triplets are mapped onto canonical entity names and
+    deduplicated before they are written and recorded.
+    """
+    start = time.perf_counter()
+    manifest = IngestionManifest(manifest_path, graph_id)
+    dead_letters = None
+    if dead_letter_path is not None:
+        dead_letters = DeadLetters(dead_letter_path, graph_id, after=dead_letter_after)
+    stats = IngestStats()
+    seen = set()
+    progress = tqdm(desc="Extracting triplets", unit="chunk", disable=not show_progress)
+
+    def save():
+        # the registry first, so the manifest never records names it doesn't know
+        if canonicalizer is not None:
+            canonicalizer.save()
+        manifest.save()
+        if dead_letters is not None:
+            dead_letters.save()
+
+    failures_in_a_row = 0
+
+    def failed(key, error):
+        nonlocal failures_in_a_row
+        doc_key, chunk = key
+        dead = dead_letters.fail(doc_key, chunk, error)
+        stats.chunks_failed += 1
+        failures_in_a_row += 1
+        telemetry.incr("chunks_failed_total")
+        logger.warning("Extracting a chunk of %s failed%s: %r", doc_key,
+                       ", added to the dead letters" if dead else "", error)
+        progress.update()
+        if failures_in_a_row >= max_consecutive_failures:
+            logger.error("%d chunks in a row failed, stopping; the next run resumes here",
+                         failures_in_a_row)
+            raise error
+
+    writer = make_triplet_writer(graph_store, write_batch_size, write_max_delay,
+                                 on_flush=save)
+    pending = _pending_chunks(docs, writer, manifest, stats, seen, dead_letters,
+                              retry_dead_letters)
+    extracted = extract_concurrently(llm, pending, max_triplets_per_chunk,
+                                     concurrency=concurrency, retries=retries,
+                                     batch_tokens=extract_batch_tokens,
+                                     batch_size=extract_batch_size,
+                                     on_failure=failed if dead_letters is not None else None)
+    try:
+        for (doc_key, chunk), triplets in extracted:
+            if canonicalizer is not None:
+                triplets = canonicalizer.canonicalize(triplets)
+            for triplet in triplets:
+                writer.upsert(*triplet)
+            manifest.record(doc_key, chunk, triplets)
+            if dead_letters is not None:
+                dead_letters.resolve(doc_key, chunk)
+            failures_in_a_row = 0
+            stats.chunks_added += 1
+            stats.triplets_written += len(triplets)
+            progress.update()
+
+        for doc_key in manifest.documents() - seen:
+            for chunk in list(manifest.chunks(doc_key)):
+                _remove_chunk(writer, manifest, doc_key, chunk, stats)
+        if dead_letters is not None:
+            for doc_key in dead_letters.documents() - seen:
+                dead_letters.keep(doc_key)
+        writer.flush()
+    except BaseException:
+        # checkpoint: the chunks extracted so far are kept for the next run,
+        # unless the graph store itself is what fails
+        try:
+            writer.flush()
+        except Exception as e:
+            logger.warning("Could not write the triplets queued since the last checkpoint "
+                           "(%r), the next run resumes from that one", e)
+        logger.warning("Knowledge graph ingestion stopped after %d chunks, rerun to resume",
+                       stats.chunks_added)
+        raise
+    finally:
+        progress.close()
+
+    stats.graph_version = manifest.fingerprint()
+    if canonicalizer is not None:
+        stats.canonical = canonicalizer.stats
+    if dead_letters is not None:
+        stats.dead_letters = len(dead_letters.dead())
+    if entity_index_path is not None:
+        update_entity_index(entity_index_path, manifest.entities(), stats.graph_version,
+                            degrees=manifest.degrees())
+    stats.seconds = time.perf_counter() - start
+    telemetry.record_span("ingest", start, stats.seconds, chunks=stats.chunks_added,
+                          triplets=stats.triplets_written)
+    telemetry.incr("chunks_extracted_total", stats.chunks_added)
+    telemetry.incr("chunks_unchanged_total", stats.chunks_unchanged)
+    logger.info("Knowledge graph ingestion: %s", stats)
+    return stats
@@ -0,0 +1,146 @@
+"""Persistent completion cache for deterministic LLM calls
+
+Triplet extraction and query keyword/synonym expansion send the same prompts
+run after run. CachedLLM answers a repeated predict() from a SQLite table keyed
+by model, prompt template, template inputs and sampling parameters, so a
+rebuild or a replayed query set never reaches Ollama for prompts it has
+already answered. Only wrap LLMs whose answers may be reused; answer synthesis
+keeps using the plain LLM.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# writes between evictions of the least recently used entries
+EVICT_EVERY = 100
+
+
+def _sha256(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """SQLite table of completions with hit/miss counters and an LRU size cap"""
+
+    def __init__(self, path, max_entries=50_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions "
+            "(key TEXT PRIMARY KEY, response TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                telemetry.incr("cache_misses_total", cache="completion")
+                return None
+            self.hits += 1
+            telemetry.incr("cache_hits_total", cache="completion")
+            self._db.execute(
+                "UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, key, response):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, response, last_used) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        self._db.execute(
+            "DELETE FROM completions WHERE key IN (SELECT key FROM completions "
+            "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM completions").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedLLM:
+    """Wraps an LLM so predict/apredict answer repeated prompts from a CompletionCache
+
+    Everything else is passed through to the wrapped LLM, so it can be handed
+    to KnowledgeGraphRAGRetriever(llm=...) and to the triplet extraction.
+    """
+
+    def __init__(self, llm, cache):
+        self._llm = llm
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    def _key(self, prompt, prompt_args):
+        llm = self._llm
+        sampling = {
+            "temperature": getattr(llm, "temperature", None),
+            "json_mode": getattr(llm, "json_mode", None),
+            "additional_kwargs": getattr(llm, "additional_kwargs", None),
+        }
+        inputs = {**prompt.kwargs, **prompt_args}
+        return _sha256(json.dumps([
+            getattr(llm, "model", None) or llm.metadata.model_name,
+            _sha256(prompt.get_template(llm=llm)),
+            _sha256(json.dumps(inputs, sort_keys=True, default=str)),
+            sampling,
+        ], sort_keys=True, default=str))
+
+    def predict(self, prompt, **prompt_args):
+        key = self._key(prompt, prompt_args)
+        response = self.cache.get(key)
+        if response is None:
+            response = self._llm.predict(prompt, **prompt_args)
+            self.cache.put(key, response)
+        return response
+
+    async def apredict(self, prompt, **prompt_args):
+        key = self._key(prompt, prompt_args)
+        response = self.cache.get(key)
+        if response is None:
+            response = await self._llm.apredict(prompt, **prompt_args)
+            self.cache.put(key, response)
+        return response
@@ -0,0 +1,297 @@
+"""Embedded graph store with CSR adjacency, for running without Neo4j
+
+Entity and relation names are interned to integer ids and the edges are kept
+in compressed sparse row form: for entity i, its outgoing edges are
+dst[indptr[i]:indptr[i + 1]] with relation ids rel[...] alongside. Lookups are
+array slices in this process, so a retrieval hop costs microseconds instead of
+a network round trip. Changes are buffered and merged into new arrays on
+compact(); persist() writes the arrays as .npy files that are memory-mapped
+on the next start.
+
+Like Neo4jGraphStore.get_rel_map, entity lookups ignore case.
+"""
+import json
+import logging
+import os
+import shutil
+from collections import defaultdict
+
+import numpy as np
+from llama_index.core.graph_stores.types import GraphStore
+
+logger = logging.getLogger(__name__)
+
+CURRENT = "CURRENT"
+
+
+class CSRGraphStore(GraphStore):
+    """GraphStore for StorageContext.from_defaults(graph_store=...) backed by CSR arrays
+
+    persist_dir holds one generation directory per persist() and a CURRENT
+    file naming the latest, so a crash while persisting leaves the previous
+    generation intact.
+    """
+
+    def __init__(self, persist_dir=None, compact_ratio=0.1):
+        self.schema = ""
+        self.persist_dir = persist_dir
+        self.compact_ratio = compact_ratio
+        self._names = []
+        self._ids = {}
+        self._by_lower = defaultdict(set)
+        self._rel_names = []
+        self._rel_ids = {}
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._dst = np.zeros(0, dtype=np.int32)
+        self._rel = np.zeros(0, dtype=np.int32)
+        self._added = defaultdict(set)  # src -> {(rel, dst)} not in the arrays yet
+        self._deleted = set()  # (src, rel, dst) still in the arrays
+        self._pending = 0
+        self._generation = 0
+        if persist_dir is not None and os.path.exists(os.path.join(persist_dir, CURRENT)):
+            self._load()
+
+    @property
+    def client(self):
+        return self
+
+    # interning
+
+    def _entity_id(self, name, create=False):
+        entity = self._ids.get(name)
+        if entity is None and create:
+            entity = self._ids[name] = len(self._names)
+            self._names.append(name)
+            self._by_lower[name.lower()].add(entity)
+        return entity
+
+    def _rel_id(self, rel, create=False):
+        rel_id = self._rel_ids.get(rel)
+        if rel_id is None and create:
+            rel_id = self._rel_ids[rel] = len(self._rel_names)
+            self._rel_names.append(rel)
+        return rel_id
+
+    def _lookup(self, name):
+        return sorted(self._by_lower.get(name.lower(), ()))
+
+    # adjacency
+
+    def _base_edges(self, entity):
+        if entity + 1 >= len(self._indptr):
+            return []
+        start, stop = self._indptr[entity], self._indptr[entity + 1]
+        return zip(self._rel[start:stop].tolist(), self._dst[start:stop].tolist())
+
+    def _has_base_edge(self, src, rel, dst):
+        return any(edge == (rel, dst) for edge in self._base_edges(src))
+
+    def edges(self, entity):
+        """(rel id, dst id) pairs going out of an entity id"""
+        for rel, dst in self._base_edges(entity):
+            if (entity, rel, dst) not in self._deleted:
+                yield rel, dst
+        yield from self._added.get(entity, ())
+
+    def _out_degree(self, entity):
+        base = 0
+        if entity + 1 < len(self._indptr):
+            base = int(self._indptr[entity + 1] - self._indptr[entity])
+        deleted = sum(1 for src, _, _ in self._deleted if src == entity) if self._deleted else 0
+        return base - deleted + len(self._added.get(entity, ()))
+
+    def degree(self, name):
+        """Number of outgoing relationships of an entity, 0 if unknown
+
+        Read off the row offsets, without visiting the relationships.
+        """
+        return sum(self._out_degree(entity) for entity in self._lookup(name))
+
+    def entities(self):
+        """Names of all entities with at least one relationship"""
+        self.compact(force=True)
+        return list(self._names)
+
+    # GraphStore interface
+
+    def get(self, subj):
+        return [[self._rel_names[rel], self._names[dst]]
+                for entity in self._lookup(subj) for rel, dst in self.edges(entity)]
+
+    def neighbors(self, names, terms=(), limit=None, timeout=None):
+        """{name: [(subj, rel, obj)]} for the relationships going out of each entity named
+
+        For traversal.traverse(). The relationships are array slices in this
+        process, so all of them are returned for the caller to rank, whatever
+        terms and limit; there is no query to time out.
+        """
+        return {name: [(self._names[entity], self._rel_names[rel], self._names[dst])
+                       for entity in self._lookup(name) for rel, dst in self.edges(entity)]
+                for name in names}
+
+    def get_rel_map(self, subjs=None, depth=2, limit=30):
+        """[subj, rel, obj] triplets reachable from each subject within depth hops
+
+        At most limit triplets in total, breadth first so closer facts come first.
+        """
+        rel_map = {}
+        if not subjs:
+            return rel_map
+        remaining = limit
+        for subj in subjs:
+            triplets = []
+            frontier = self._lookup(subj)
+            seen = set(frontier)
+            for _ in range(depth):
+                next_frontier = []
+                for entity in frontier:
+                    for rel, dst in self.edges(entity):
+                        if len(triplets) >= remaining:
+                            break
+                        triplets.append([self._names[entity], self._rel_names[rel], self._names[dst]])
+                        if dst not in seen:
+                            seen.add(dst)
+                            next_frontier.append(dst)
+                frontier = next_frontier
+            if triplets:
+                rel_map[subj] = triplets
+                remaining -= len(triplets)
+            if remaining <= 0:
+                break
+        return rel_map
+
+    def upsert_triplet(self, subj, rel, obj):
+        self.upsert_triplets([(subj, rel, obj)])
+
+    def delete(self, subj, rel, obj):
+        self.delete_triplets([(subj, rel, obj)])
+
+    def upsert_triplets(self, triplets):
+        for subj, rel, obj in triplets:
+            src, dst = self._entity_id(subj, True), self._entity_id(obj, True)
+            rel = self._rel_id(rel, True)
+            if (src, rel, dst) in self._deleted:
+                self._deleted.discard((src, rel, dst))
+            elif (rel, dst) not in self._added[src] and not self._has_base_edge(src, rel, dst):
+                self._added[src].add((rel, dst))
+            self._pending += 1
+        self._maybe_compact()
+
+    def delete_triplets(self, triplets):
+        for subj, rel, obj in triplets:
+            src, dst, rel = self._entity_id(subj), self._entity_id(obj), self._rel_id(rel)
+            if src is None or dst is None or rel is None:
+                continue
+            if (rel, dst) in self._added.get(src, ()):
+                self._added[src].discard((rel, dst))
+            elif self._has_base_edge(src, rel, dst):
+                self._deleted.add((src, rel, dst))
+            self._pending += 1
+        self._maybe_compact()
+
+    def get_schema(self, refresh=False):
+        return self.schema
+
+    def query(self, query, param_map=None):
+        """Cypher is not supported: logs the query and returns no rows"""
+        logger.warning("CSRGraphStore does not run Cypher queries, returning no rows for: %s",
+                       " ".join(query.split())[:200])
+        return []
+
+    # compaction and persistence
+
+    def _maybe_compact(self):
+        if self._pending > max(self.compact_ratio * len(self._dst), 1000):
+            self.compact()
+
+    def compact(self, force=False):
+        """Merge buffered changes into new CSR arrays, dropping unconnected entities"""
+        if not self._pending and not force:
+            return
+        if not self._pending and len(self._indptr) - 1 == len(self._names):
+            return
+        n = len(self._indptr) - 1
+        src = np.repeat(np.arange(n, dtype=np.int64), np.diff(self._indptr))
+        rel, dst = np.asarray(self._rel, dtype=np.int64), np.asarray(self._dst, dtype=np.int64)
+        if self._deleted:
+            deleted = np.array(sorted(self._deleted), dtype=np.int64)
+            keep = ~_rows_in(np.stack([src, rel, dst], axis=1), deleted)
+            src, rel, dst = src[keep], rel[keep], dst[keep]
+        added = [(s, r, d) for s, edges in self._added.items() for r, d in edges]
+        if added:
+            added = np.array(added, dtype=np.int64)
+            src = np.concatenate([src, added[:, 0]])
+            rel = np.concatenate([rel, added[:, 1]])
+            dst = np.concatenate([dst, added[:, 2]])
+
+        # renumber so entities without relationships disappear
+        used = np.zeros(len(self._names), dtype=bool)
+        used[src], used[dst] = True, True
+        new_ids = np.cumsum(used) - 1
+        self._names = [name for name, keep in zip(self._names, used) if keep]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._by_lower = defaultdict(set)
+        for i, name in enumerate(self._names):
+            self._by_lower[name.lower()].add(i)
+        src, dst = new_ids[src], new_ids[dst]
+
+        order = np.lexsort((dst, rel, src))
+        src, rel, dst = src[order], rel[order], dst[order]
+        self._indptr = np.zeros(len(self._names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(self._names)), out=self._indptr[1:])
+        self._dst, self._rel = dst.astype(np.int32), rel.astype(np.int32)
+        self._added, self._deleted, self._pending = defaultdict(set), set(), 0
+
+    def persist(self, persist_path=None, fs=None):
+        """Write the graph to persist_path (default persist_dir)
+
+        StorageContext.persist passes <dir>/graph_store.json; the arrays then go
+        to <dir>/graph_store.
+        """
+        directory = persist_path or self.persist_dir
+        if directory is None:
+            raise ValueError("No persist_dir given for CSRGraphStore")
+        if directory.endswith(".json"):
+            directory = os.path.splitext(directory)[0]
+        self.compact(force=True)
+        generation = self._generation + 1
+        target = os.path.join(directory, f"gen-{generation}")
+        os.makedirs(target, exist_ok=True)
+        np.save(os.path.join(target, "indptr.npy"), self._indptr)
+        np.save(os.path.join(target, "dst.npy"), self._dst)
+        np.save(os.path.join(target, "rel.npy"), self._rel)
+        with open(os.path.join(target, "names.json"), "w") as f:
+            json.dump({"entities": self._names, "relations": self._rel_names}, f)
+        with open(os.path.join(directory, CURRENT + ".tmp"), "w") as f:
+            f.write(f"gen-{generation}")
+        os.replace(os.path.join(directory, CURRENT + ".tmp"), os.path.join(directory, CURRENT))
+        previous = os.path.join(directory, f"gen-{self._generation}")
+        if self._generation and os.path.isdir(previous) and previous != target:
+            shutil.rmtree(previous, ignore_errors=True)
+        self._generation = generation
+
+    def _load(self):
+        with open(os.path.join(self.persist_dir, CURRENT)) as f:
+            name = f.read().strip()
+        source = os.path.join(self.persist_dir, name)
+        self._generation = int(name.split("-")[1])
+        with open(os.path.join(source, "names.json")) as f:
+            names = json.load(f)
+        self._names, self._rel_names = names["entities"], names["relations"]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        for i, name in enumerate(self._names):
+            self._by_lower[name.lower()].add(i)
+        self._rel_ids = {rel: i for i, rel in enumerate(self._rel_names)}
+        self._indptr = np.load(os.path.join(source, "indptr.npy"), mmap_mode="r")
+        self._dst = np.load(os.path.join(source, "dst.npy"), mmap_mode="r")
+        self._rel = np.load(os.path.join(source, "rel.npy"), mmap_mode="r")
+        logger.info("Loaded %d entities and %d relationships from %s",
+                    len(self._names), len(self._dst), source)
+
+
+def _rows_in(rows, table):
+    """Boolean mask of which rows (n x 3 int64) appear in table (m x 3, sorted)"""
+    view = np.dtype((np.void, rows.dtype.itemsize * 3))
+    rows_v = np.ascontiguousarray(rows).view(view).ravel()
+    table_v = np.ascontiguousarray(table).view(view).ravel()
+    return np.isin(rows_v, table_v)
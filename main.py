@@ -1,36 +1,33 @@
-import nest_asyncio
-
-from llama_index.core import SummaryIndex
-from llama_index.core import KnowledgeGraphIndex
-from llama_index.core import VectorStoreIndex
-from llama_index.core import Settings, SimpleDirectoryReader, PromptTemplate
-from llama_index.core import StorageContext, ServiceContext
-
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
-
-from llama_index.llms.ollama import Ollama
-
-#from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.embeddings.ollama import OllamaEmbedding
-
-## to use Qdrant, install it w/ poetry add llama-index-vector-stores-qdrant
-## note: vectorstore not supporting python 3.13 yet, 
-#from llama_index.vector_stores.qdrant import QdrantVectorStore
-#import qdrant_client
-
-from llama_index.vector_stores.redis import RedisVectorStore
-from redis import Redis
+"""Graph RAG over the PDFs in DOC_DIR with Ollama and llama-index
+
+    python main.py ingest    # bring the knowledge graph (and vector index) up to date
+    python main.py ingest --retry-failed    # ... and retry the dead-lettered chunks
+    python main.py query     # ask questions about the graph as it is
+    python main.py serve     # answer questions over HTTP
+    python main.py batch questions.txt --output answers.jsonl
+    python main.py           # ingest, then query
+
+Backends are imported by the commands that use them, so `query`, `serve` and `batch`
+open the existing graph without loading the PDF parsers or reading DOC_DIR.
+"""
+import argparse
+import atexit
+import logging
+import os
 
 from config import config
 
-import logging
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-nest_asyncio.apply()
-
 
 def create_qdrant_index(documents):
+    ## to use Qdrant, install it w/ poetry add llama-index-vector-stores-qdrant
+    ## note: vectorstore not supporting python 3.13 yet,
+    import qdrant_client
+    from llama_index.core import StorageContext, VectorStoreIndex
+    from llama_index.vector_stores.qdrant import QdrantVectorStore
+
     client = qdrant_client.QdrantClient(
         host="localhost",
         port=6333
@@ -43,7 +40,12 @@ def create_qdrant_index(documents):
     )
     return index
 
-def create_redis_index(documents):
+def open_redis_vector_store():
+    """The vector store in Redis, kept as is, with the document hashes stored next to it"""
+    from llama_index.vector_stores.redis import RedisVectorStore
+    from redis import Redis
+    from vector_sync import RedisDocumentHashes
+
     redis_client = Redis(
         host=config.REDIS_HOST,
         port=config.REDIS_PORT,
@@ -52,108 +54,310 @@ def create_redis_index(documents):
         db=0
     )
     logger.info("Redis client created: %s", redis_client.ping())
+    vector_store = RedisVectorStore(redis_client=redis_client, overwrite=False)
+    hashes = RedisDocumentHashes(redis_client, f"{vector_store.index_name}:doc_hashes")
+    return vector_store, hashes
+
+def open_local_vector_store():
+    """The vector store persisted under STATE_DIR, memory-mapped instead of re-embedded"""
+    from mmap_vector_store import MmapVectorStore
+    from vector_sync import FileDocumentHashes
+
+    vector_store = MmapVectorStore(persist_dir=config.state_path("vectors"))
+    return vector_store, FileDocumentHashes(config.state_path("vector_hashes.json"))
+
+def open_vector_store():
+    """Redis if it is reachable, otherwise the local vector store"""
+    try:
+        return open_redis_vector_store()
+    except Exception:
+        logger.warning("Redis vector store unavailable, using the local one", exc_info=True)
+        return open_local_vector_store()
+
+
+def setup_models():
+    """Telemetry, then the answering LLM and the embedding model as llama-index defaults"""
+    from llama_index.core import Settings
+    from llama_index.core.callbacks import CallbackManager
+    from models import build_embed_model, build_llm
+    from telemetry import TelemetryHandler, serve_metrics, telemetry
+
+    # per-stage timings and LLM, cache and graph counters (telemetry.py)
+    Settings.callback_manager = CallbackManager([TelemetryHandler()])
+    if config.TELEMETRY_TRACE:
+        atexit.register(telemetry.write_trace, config.state_path("trace.json"))
+    if config.METRICS_PORT:
+        serve_metrics(config.METRICS_PORT)
+
+    # setup llm & embedding model
+    Settings.llm = build_llm(request_timeout=600.0)
+    # embed_model = HuggingFaceEmbedding( model_name="BAAI/bge-large-en-v1.5", trust_remote_code=True)
+    Settings.embed_model = build_embed_model()
+    return Settings.llm, Settings.embed_model
+
+
+def ingest(graph_store, retry_failed=False):
+    """Bring the graph, and with HYBRID_RETRIEVAL the vector index, in line with DOC_DIR
+
+    With retry_failed, chunks whose extraction failed in earlier runs are retried.
+    """
+    from llama_index.core import SimpleDirectoryReader
+    from ingest import build_knowledge_graph, stream_documents
+    from models import build_llm, cached
+    from pdf_loader import ParallelPDFLoader
+    from stores import graph_store_id
+    from telemetry import telemetry
+    from vector_sync import VectorSync
+
+    # triplet extraction gets its own client so a stuck request times out sooner,
+    # and answers from earlier builds are served from the completion cache
+    extract_llm = cached(build_llm(request_timeout=config.EXTRACT_REQUEST_TIMEOUT))
+
+    # spellings of one entity ("SAP HANA", "sap hana", "the HANA systems") become one node
+    canonicalizer = None
+    if config.CANONICALIZE_ENTITIES:
+        from llama_index.core import Settings
+        from canonical import Canonicalizer
+        canonicalizer = Canonicalizer(
+            config.state_path("entities.json"), graph_store_id(),
+            embed_model=Settings.embed_model if config.ENTITY_EMBED_MERGE else None,
+            embed_threshold=config.ENTITY_MERGE_THRESHOLD,
+        )
 
-    # create the vector store wrapper
-    vector_store = RedisVectorStore(redis_client=redis_client, overwrite=True)
+    # load data
+    loader = SimpleDirectoryReader(
+                input_dir = config.DOC_DIR,
+                required_exts=[".pdf"],
+                recursive=True
+            )
+    # PDFs are parsed in worker processes, and not at all if unchanged since the last run
+    loader = ParallelPDFLoader(loader, workers=config.PDF_PARSE_WORKERS or None,
+                               cache_dir=config.state_path("parsed"))
+    # parsed file by file while the graph is being built, see stream_documents
+    docs = stream_documents(loader, files_ahead=config.INGEST_FILES_AHEAD)
+
+    # Update the vector index for hybrid retrieval while the documents stream past
+    vector_sync = None
+    if config.HYBRID_RETRIEVAL:
+        vector_store, doc_hashes = open_vector_store()
+        vector_sync = VectorSync(vector_store, doc_hashes, batch_size=config.VECTOR_SYNC_BATCH_SIZE)
+        docs = vector_sync.passthrough(docs)
+
+    # NOTE: the first build can take a while! Later runs only extract triplets
+    # for chunks that are new or changed since the manifest was written, which
+    # is also how an interrupted build resumes. Chunks that keep failing are
+    # listed in kg_dead_letters.json instead of failing the build.
+    stats = build_knowledge_graph(
+        docs,
+        graph_store,
+        extract_llm,
+        manifest_path=config.state_path("kg_manifest.json"),
+        graph_id=graph_store_id(),
+        max_triplets_per_chunk=config.KG_MAX_TRIPLETS_PER_CHUNK,
+        concurrency=config.EXTRACT_CONCURRENCY,
+        retries=config.EXTRACT_RETRIES,
+        extract_batch_tokens=config.EXTRACT_BATCH_TOKENS,
+        extract_batch_size=config.EXTRACT_BATCH_SIZE,
+        write_batch_size=config.NEO4J_WRITE_BATCH_SIZE,
+        write_max_delay=config.NEO4J_WRITE_MAX_DELAY,
+        entity_index_path=config.state_path("entity_index.json"),
+        canonicalizer=canonicalizer,
+        dead_letter_path=config.state_path("kg_dead_letters.json"),
+        dead_letter_after=config.EXTRACT_DEAD_LETTER_AFTER,
+        retry_dead_letters=retry_failed,
+        max_consecutive_failures=config.EXTRACT_MAX_CONSECUTIVE_FAILURES,
+        show_progress=True
+    )
+    loader.close()
+    print(f"Knowledge graph: {stats}")
+    if stats.dead_letters:
+        print(f"{stats.dead_letters} chunks skipped after failing repeatedly, see "
+              f"{config.state_path('kg_dead_letters.json')}; retry them with "
+              f"`python main.py ingest --retry-failed`")
+    if vector_sync is not None:
+        print(f"Vector index: {vector_sync.finish()}")
+    print(f"Time per stage:\n{telemetry.summary()}")
+    return stats
+
+
+def build_query_engine(graph_store, llm, embed_model, streaming, graph_version=None):
+    """Query engine over the existing graph, and the answer cache for its graph version
+
+    Without graph_version (no ingestion in this process), the version is the one
+    the entity index, or failing that the ingestion manifest, was written for.
+    """
+    from llama_index.core import StorageContext, VectorStoreIndex
+    from llama_index.core.query_engine import RetrieverQueryEngine
+    from answer_cache import AnswerCache
+    from context_packing import ContextPacker
+    from entity_index import EntityIndex
+    from models import cached
+    from retrieval import GraphRAGRetriever, HybridRetriever
+    from traversal import TraversalBudget
+
+    storage_context = StorageContext.from_defaults(graph_store=graph_store)
+
+    # query entities are looked up among the graph's entity names, without the LLM
+    entity_index = None
+    if config.ENTITY_INDEX:
+        entity_index = EntityIndex.load(
+            config.state_path("entity_index.json"),
+            embed_model=embed_model if config.ENTITY_EMBED_MATCH else None,
+        )
 
-    # load storage context
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    # hubs are not expanded and the traversal stops within its budgets, however dense the graph
+    traversal_budget = None
+    if config.KG_TRAVERSAL_BUDGET:
+        traversal_budget = TraversalBudget(fanout=config.KG_TRAVERSAL_FANOUT,
+                                           hub_degree=config.KG_HUB_DEGREE,
+                                           seconds=config.KG_TRAVERSAL_SECONDS)
 
-    # build and load index from documents and storage context
-    index = VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context
+    # keyword and synonym expansion prompts repeat across queries and runs
+    graph_rag_retriever = GraphRAGRetriever(
+        storage_context=storage_context,
+        llm=cached(llm),
+        entity_index=entity_index,
+        llm_fallback=config.ENTITY_LLM_FALLBACK,
+        traversal_budget=traversal_budget,
+        graph_traversal_depth=config.KG_TRAVERSAL_DEPTH,
+        max_knowledge_sequence=config.KG_TRAVERSAL_MAX_TRIPLETS,
+        verbose=True,
     )
-    # index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
-    return index
 
-
-# setup llm & embedding model
-llm=Ollama(model=config.OLLAMA_LLM_MODEL, base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}", 
-           request_timeout=600.0)
-Settings.llm = llm
-# embed_model = HuggingFaceEmbedding( model_name="BAAI/bge-large-en-v1.5", trust_remote_code=True)
-embed_model = OllamaEmbedding(model_name=config.OLLAMA_EMBED_MODEL, 
-                              base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}", 
-                              trust_remote_code=True)
-Settings.embed_model = embed_model
-
-# load data
-loader = SimpleDirectoryReader(
-            input_dir = config.DOC_DIR,
-            required_exts=[".pdf"],
-            recursive=True
+    # vector search and the graph queried side by side, within HYBRID_BUDGET seconds
+    retriever = graph_rag_retriever
+    if config.HYBRID_RETRIEVAL:
+        vector_store, _ = open_vector_store()
+        vector_index = VectorStoreIndex.from_vector_store(vector_store=vector_store)
+        retriever = HybridRetriever(
+            {
+                "vector": vector_index.as_retriever(similarity_top_k=config.VECTOR_TOP_K),
+                "graph": graph_rag_retriever,
+            },
+            budget=config.HYBRID_BUDGET,
+            grace=config.HYBRID_GRACE,
         )
-docs = loader.load_data()
-
-# # Creating a vector index over loaded data
-# logger.info('Creating vector index')
-# try:
-#     index = create_redis_index(docs)
-#     logger.info('Using Redis collection')
-# except:
-#     logger.warning("Failed to create Redis collection, using local collection")
-#     index = VectorStoreIndex.from_documents(docs, show_progress=True)
-
-
-# # ====== Customise prompt template ======
-# qa_prompt_tmpl_str = (
-# "Context information is below.\n"
-# "---------------------\n"
-# "{context_str}\n"
-# "---------------------\n"
-# "Given the context information above I want you to think step by step to answer the query in a crisp manner, incase case you don't know the answer say 'I don't know!'.\n"
-# "Query: {query_str}\n"
-# "Answer: "
-# )
-# qa_prompt_tmpl = PromptTemplate(qa_prompt_tmpl_str)
-
-# query_engine.update_prompts(
-#     {"response_synthesizer:text_qa_template": qa_prompt_tmpl}
-# )
-# response = query_engine.query(user_query,)
-
-
-# Create the knowledge graph index
-uri = config.NEO4J_URI
-username = config.NEO4J_USERNAME
-password = config.NEO4J_PASSWORD
-
-graph_store = Neo4jGraphStore(
-    username=username,
-    password=password,
-    url=uri,
-    database="neo4j",
-    timeout=600.0
-)
-
-storage_context = StorageContext.from_defaults(graph_store=graph_store)
-
-# NOTE: only need once to build the KG, can take a while!
-kg_index = KnowledgeGraphIndex.from_documents(
-    docs,
-    storage_context=storage_context,
-    max_triplets_per_chunk=8,
-    embed_model=embed_model,
-    show_progress=True
-)
-
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
-
-graph_rag_retriever = KnowledgeGraphRAGRetriever(
-    storage_context=storage_context,
-    verbose=True,
-)
-
-query_engine = RetrieverQueryEngine.from_args(
-    graph_rag_retriever,
-    embed_model=embed_model,
-)
-
-
-# get user query
-while (user_query := input("\n\nWhat do you want to know about these files?\n")):
-    # Generate the response
-    response = query_engine.query(user_query,)
-
-    print(str(response))
+
+    # retrieved facts and snippets deduplicated and packed into CONTEXT_TOKEN_BUDGET tokens
+    node_postprocessors = []
+    if config.CONTEXT_TOKEN_BUDGET:
+        node_postprocessors.append(ContextPacker(token_budget=config.CONTEXT_TOKEN_BUDGET,
+                                                 verbose=True))
+
+    query_engine = RetrieverQueryEngine.from_args(
+        retriever,
+        embed_model=embed_model,
+        streaming=streaming,
+        node_postprocessors=node_postprocessors,
+    )
+
+    if graph_version is None:
+        if entity_index is not None:
+            graph_version = entity_index.graph_version
+        else:
+            from ingest import IngestionManifest
+            from stores import graph_store_id
+            graph_version = IngestionManifest(config.state_path("kg_manifest.json"),
+                                              graph_store_id()).fingerprint()
+
+    # near-duplicate questions are answered from earlier runs until the graph changes
+    answer_cache = AnswerCache(
+        config.state_path("answers.sqlite"),
+        embed_model,
+        graph_version=graph_version,
+        threshold=config.ANSWER_CACHE_THRESHOLD,
+        max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+    )
+    return query_engine, answer_cache
+
+
+def query_loop(query_engine, answer_cache):
+    from extraction import strip_thinking
+    from streaming import stream_answer
+    from telemetry import telemetry
+
+    # get user query
+    while (user_query := input("\n\nWhat do you want to know about these files?\n")):
+        with telemetry.span("answer") as span:
+            response = answer_cache.get(user_query)
+            span["cached"] = response is not None
+            if response is not None:
+                print(strip_thinking(response).strip() if config.HIDE_THINKING else response)
+            elif config.STREAM_RESPONSES:
+                # Generate the response, printing it as it is generated
+                response, timing = stream_answer(query_engine, user_query,
+                                                 hide_thinking=config.HIDE_THINKING)
+                telemetry.observe("first_token_seconds", timing.first_token)
+                print(f"\n[{timing}]")
+                answer_cache.put(user_query, response)
+            else:
+                # Generate the response
+                response = str(query_engine.query(user_query,))
+                answer_cache.put(user_query, response)
+                print(strip_thinking(response).strip() if config.HIDE_THINKING else response)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Graph RAG over local PDFs with Ollama")
+    commands = parser.add_subparsers(dest="command")
+    ingest_parser = commands.add_parser("ingest",
+                                        help="update the knowledge graph from DOC_DIR and exit")
+    ingest_parser.add_argument("--retry-failed", action="store_true",
+                               help="also retry chunks whose extraction failed repeatedly")
+    commands.add_parser("query", help="ask questions about the existing graph")
+    serve_parser = commands.add_parser("serve", help="answer questions over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    batch_parser = commands.add_parser("batch", help="answer a file of questions into JSONL")
+    batch_parser.add_argument("questions", help="one question per line, or JSONL of {id, query}")
+    batch_parser.add_argument("--output", help="JSONL file to append answers to, and resume from "
+                                               "(default: <questions>.answers.jsonl)")
+    batch_parser.add_argument("--parallel", type=int, default=config.BATCH_PARALLELISM)
+    args = parser.parse_args(argv)
+    ingesting = args.command in (None, "ingest")
+
+    from stores import build_graph_store
+
+    if args.command not in ("serve", "batch"):
+        # the synchronous llama-index APIs run event loops of their own;
+        # serve and batch answer on a real event loop through the async ones
+        import nest_asyncio
+        nest_asyncio.apply()
+    llm, embed_model = setup_models()
+
+    # Open the knowledge graph, in Neo4j or in the embedded store (GRAPH_STORE).
+    # Answering never reads the schema, which takes APOC and a scan of the graph.
+    graph_store = build_graph_store(refresh_schema=ingesting)
+
+    graph_version = None
+    if ingesting:
+        graph_version = ingest(graph_store,
+                               retry_failed=getattr(args, "retry_failed", False)).graph_version
+    if args.command == "ingest":
+        return
+
+    if args.command == "batch":
+        from batch import batch
+        query_engine, _ = build_query_engine(graph_store, llm, embed_model, streaming=False)
+        output = args.output or os.path.splitext(args.questions)[0] + ".answers.jsonl"
+        batch(query_engine, args.questions, output, args.parallel)
+        return
+
+    if args.command == "serve":
+        from service import serve
+        query_engine, answer_cache = build_query_engine(graph_store, llm, embed_model,
+                                                        streaming=False)
+        serve(query_engine, answer_cache, args.host, args.port,
+              max_generations=config.SERVE_MAX_GENERATIONS,
+              max_pending=config.SERVE_MAX_PENDING,
+              timeout=config.SERVE_REQUEST_TIMEOUT)
+        return
+
+    query_engine, answer_cache = build_query_engine(graph_store, llm, embed_model,
+                                                    streaming=config.STREAM_RESPONSES,
+                                                    graph_version=graph_version)
+    query_loop(query_engine, answer_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Persistent local vector store on a memory-mapped float32 matrix
+
+The no-Redis alternative to VectorStoreIndex's in-memory SimpleVectorStore:
+embeddings are normalized once and written to a memory-mapped file, one row
+per node, next to a SQLite table with the nodes themselves. Opening the store
+maps the file instead of re-embedding or parsing anything, and a query is one
+matrix-vector product with NumPy top-k. For larger corpora the rows are also
+clustered (IVF) and a query only scores the rows in the closest clusters.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQueryResult
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 1024
+NO_LIST = -1
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _kmeans(vectors, n_lists, iterations=10, seed=0):
+    """Spherical k-means centroids for the (normalized) rows of vectors"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignment == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Vector store kept in persist_dir, for StorageContext.from_defaults(vector_store=...)
+
+    Like RedisVectorStore it stores the node text, so an index is reopened
+    with VectorStoreIndex.from_vector_store. Once ivf_min_rows nodes are
+    stored they are clustered into about sqrt(rows) lists, reclustered when the
+    store has doubled since, and queries score the n_probe closest lists.
+    Metadata filters are not supported.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+    persist_dir: str
+    n_probe: int = 8
+    ivf_min_rows: int = 50_000
+
+    _db = PrivateAttr()
+    _lock = PrivateAttr()
+    _vectors = PrivateAttr(default=None)
+    _dim = PrivateAttr(default=None)
+    _capacity = PrivateAttr(default=0)
+    _row_of = PrivateAttr()  # node id -> row
+    _live = PrivateAttr()
+    _lists = PrivateAttr()
+    _centroids = PrivateAttr(default=None)
+    _ivf_rows = PrivateAttr(default=0)
+    _list_rows = PrivateAttr(default=None)  # live rows of each list, rebuilt after changes
+
+    def __init__(self, persist_dir, **kwargs):
+        super().__init__(persist_dir=persist_dir, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(persist_dir, "nodes.sqlite"),
+                                   check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS nodes (row INTEGER PRIMARY KEY, node_id TEXT UNIQUE, "
+            "ref_doc_id TEXT, list INTEGER NOT NULL, node TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS nodes_ref_doc_id ON nodes (ref_doc_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        rows = self._db.execute("SELECT row, node_id, list FROM nodes").fetchall()
+        self._row_of = {node_id: row for row, node_id, _ in rows}
+        if "dim" in meta:
+            self._dim = int(meta["dim"])
+        if int(meta.get("capacity", 0)):
+            self._capacity = int(meta["capacity"])
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                      shape=(self._capacity, self._dim))
+        self._live = np.zeros(self._capacity, dtype=bool)
+        self._lists = np.full(self._capacity, NO_LIST, dtype=np.int32)
+        for row, _, list_id in rows:
+            self._live[row], self._lists[row] = True, list_id
+        if "ivf_rows" in meta:
+            self._centroids = np.load(os.path.join(persist_dir, "centroids.npy"))
+            self._ivf_rows = int(meta["ivf_rows"])
+
+    @classmethod
+    def class_name(cls):
+        return "MmapVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.persist_dir, "vectors.f32")
+
+    @property
+    def node_count(self):
+        # not __len__: StorageContext.from_defaults(vector_store=...) would take
+        # an empty store for a missing one
+        return len(self._row_of)
+
+    # storage
+
+    def _grow(self, rows):
+        capacity = max(self._capacity, INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self._dim * np.dtype(np.float32).itemsize)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(capacity, self._dim))
+        self._live = np.concatenate([self._live, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._lists = np.concatenate(
+            [self._lists, np.full(capacity - self._capacity, NO_LIST, dtype=np.int32)])
+        self._capacity = capacity
+        self._set_meta(dim=self._dim, capacity=capacity)
+
+    def _set_meta(self, **values):
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(key, str(value)) for key, value in values.items()])
+
+    def _free_rows(self, count):
+        free = np.flatnonzero(~self._live)
+        if len(free) < count:
+            self._grow(self._capacity + count - len(free))
+            free = np.flatnonzero(~self._live)
+        return free[:count].tolist()
+
+    def _assign(self, vectors):
+        if self._centroids is None:
+            return np.full(len(vectors), NO_LIST, dtype=np.int32)
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    # BasePydanticVectorStore
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        vectors = _normalize([node.get_embedding() for node in nodes])
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._set_meta(dim=self._dim, capacity=0)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, "
+                                 f"store at {self.persist_dir} holds {self._dim}")
+            self._delete_rows([self._row_of[n.node_id] for n in nodes if n.node_id in self._row_of])
+            rows = self._free_rows(len(nodes))
+            lists = self._assign(vectors)
+            self._vectors[rows] = vectors
+            self._live[rows], self._lists[rows] = True, lists
+            self._list_rows = None
+            self._db.executemany(
+                "INSERT INTO nodes (row, node_id, ref_doc_id, list, node) VALUES (?, ?, ?, ?, ?)",
+                [(row, node.node_id, node.ref_doc_id, int(list_id), json.dumps(
+                    node_to_metadata_dict(node, remove_text=False, flat_metadata=self.flat_metadata)))
+                 for row, node, list_id in zip(rows, nodes, lists)],
+            )
+            self._row_of.update((node.node_id, row) for node, row in zip(nodes, rows))
+            self._vectors.flush()
+            self._db.commit()
+            if len(self._row_of) >= max(self.ivf_min_rows, 2 * self._ivf_rows):
+                self._build_ivf()
+        return [node.node_id for node in nodes]
+
+    def _delete_rows(self, rows):
+        if not rows:
+            return
+        placeholders = ",".join("?" * len(rows))
+        for (node_id,) in self._db.execute(
+                f"SELECT node_id FROM nodes WHERE row IN ({placeholders})", rows).fetchall():
+            del self._row_of[node_id]
+        self._db.execute(f"DELETE FROM nodes WHERE row IN ({placeholders})", rows)
+        self._live[rows] = False
+        self._list_rows = None
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        with self._lock:
+            rows = [row for (row,) in self._db.execute(
+                "SELECT row FROM nodes WHERE ref_doc_id = ?", (ref_doc_id,))]
+            self._delete_rows(rows)
+            self._db.commit()
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        if filters is not None:
+            raise NotImplementedError("MmapVectorStore does not support metadata filters")
+        with self._lock:
+            self._delete_rows([self._row_of[i] for i in node_ids or [] if i in self._row_of])
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._delete_rows(list(self._row_of.values()))
+            self._db.commit()
+
+    def get_nodes(self, node_ids=None, filters=None):
+        if filters is not None:
+            raise NotImplementedError("MmapVectorStore does not support metadata filters")
+        if node_ids is None:
+            rows = list(self._row_of.values())
+        else:
+            rows = [self._row_of[i] for i in node_ids if i in self._row_of]
+        return self._nodes(rows)
+
+    def _nodes(self, rows):
+        placeholders = ",".join("?" * len(rows))
+        found = dict(self._db.execute(
+            f"SELECT row, node FROM nodes WHERE row IN ({placeholders})", rows))
+        return [metadata_dict_to_node(json.loads(found[row])) for row in rows]
+
+    def query(self, query, **kwargs):
+        if query.filters is not None:
+            raise NotImplementedError("MmapVectorStore does not support metadata filters")
+        with self._lock:
+            if not self._row_of:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+            vector = _normalize(query.query_embedding)
+            if self._centroids is not None:
+                probe = np.argsort(-(self._centroids @ vector))[:self.n_probe]
+                candidates = np.sort(np.concatenate([self._rows_in_list(i) for i in probe]))
+            else:
+                candidates = np.flatnonzero(self._live)
+            # VectorStoreIndex.as_retriever passes node_ids=[] for stores that keep the text
+            if query.node_ids:
+                wanted = [self._row_of[i] for i in query.node_ids if i in self._row_of]
+                candidates = np.intersect1d(candidates, np.array(wanted, dtype=np.int64))
+            if query.doc_ids:
+                placeholders = ",".join("?" * len(query.doc_ids))
+                wanted = [row for (row,) in self._db.execute(
+                    f"SELECT row FROM nodes WHERE ref_doc_id IN ({placeholders})", query.doc_ids)]
+                candidates = np.intersect1d(candidates, np.array(wanted, dtype=np.int64))
+            scores = self._vectors[candidates] @ vector
+            k = min(query.similarity_top_k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+            top = top[np.argsort(-scores[top])]
+            rows = candidates[top].tolist()
+            nodes = self._nodes(rows)
+        return VectorStoreQueryResult(nodes=nodes, similarities=scores[top].tolist(),
+                                      ids=[node.node_id for node in nodes])
+
+    def _rows_in_list(self, list_id):
+        if self._list_rows is None:
+            # rows added since the last clustering were assigned a list too
+            live = np.flatnonzero(self._live)
+            order = np.argsort(self._lists[live], kind="stable")
+            lists, rows = self._lists[live][order], live[order]
+            bounds = np.searchsorted(lists, np.arange(len(self._centroids) + 1))
+            self._list_rows = [rows[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._list_rows[list_id]
+
+    def persist(self, persist_path=None, fs=None):
+        """Every add and delete is already on disk; this only flushes the vectors"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+
+    # IVF
+
+    def build_ivf(self, n_lists=None):
+        """Cluster the stored vectors so queries only score n_probe clusters"""
+        with self._lock:
+            self._build_ivf(n_lists)
+
+    def _build_ivf(self, n_lists=None):
+        rows = np.flatnonzero(self._live)
+        n_lists = n_lists or max(1, int(np.sqrt(len(rows))))
+        vectors = np.asarray(self._vectors[rows])
+        sample = vectors[np.random.default_rng(0).permutation(len(rows))[:256 * n_lists]]
+        self._centroids = _kmeans(sample, min(n_lists, len(sample)))
+        self._lists[rows] = self._assign(vectors)
+        self._list_rows = None
+        self._db.executemany("UPDATE nodes SET list = ? WHERE row = ?",
+                             [(int(self._lists[row]), int(row)) for row in rows])
+        np.save(os.path.join(self.persist_dir, "centroids.npy"), self._centroids)
+        self._ivf_rows = len(rows)
+        self._set_meta(ivf_rows=self._ivf_rows)
+        self._db.commit()
+        logger.info("Clustered %d vectors into %d lists", len(rows), len(self._centroids))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
@@ -0,0 +1,41 @@
+"""Ollama LLM and embedding model construction"""
+from functools import lru_cache
+
+from llama_index.core import Settings
+from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.llms.ollama import Ollama
+
+from config import config
+from embed_cache import cached_embed_model
+from llm_cache import CachedLLM, CompletionCache
+
+
+def ollama_url():
+    return f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}"
+
+
+def build_llm(request_timeout=600.0):
+    # LLMs not assigned to Settings.llm only report to handlers they are given
+    return Ollama(model=config.OLLAMA_LLM_MODEL, base_url=ollama_url(),
+                  request_timeout=request_timeout,
+                  callback_manager=Settings.callback_manager)
+
+
+@lru_cache(maxsize=None)
+def completion_cache():
+    return CompletionCache(config.state_path("completions.sqlite"), config.LLM_CACHE_MAX_ENTRIES)
+
+
+def cached(llm):
+    """Serve repeated prompts (triplet extraction, keyword expansion) from disk"""
+    return CachedLLM(llm, completion_cache())
+
+
+def build_embed_model(cache=True):
+    embed_model = OllamaEmbedding(model_name=config.OLLAMA_EMBED_MODEL,
+                                  base_url=ollama_url(),
+                                  trust_remote_code=True)
+    if cache:
+        embed_model = cached_embed_model(embed_model, config.state_path("embeddings"),
+                                         config.EMBED_CACHE_MAX_ENTRIES)
+    return embed_model
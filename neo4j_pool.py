@@ -0,0 +1,138 @@
+"""One Neo4j driver per process, shared by ingestion, retrieval and diagnostics
+
+Every Neo4jGraphStore opens its own driver, and its __init__ closes that
+driver again right after checking connectivity, so each component pays for
+new TCP and TLS handshakes to Aura. get_driver() creates one driver from
+config, with a bounded pool, a connection lifetime below Aura's idle timeout
+and liveness checks, and PooledNeo4jGraphStore uses it instead.
+"""
+import atexit
+import logging
+import threading
+import time
+
+import neo4j
+from llama_index.graph_stores.neo4j import Neo4jGraphStore
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_driver = None
+_lock = threading.Lock()
+
+
+def get_driver():
+    """The shared driver, created and probed on first use
+
+    Raises ValueError if Neo4j is unreachable or rejects the credentials,
+    after at most NEO4J_CONNECT_TIMEOUT seconds.
+    """
+    global _driver
+    with _lock:
+        if _driver is None:
+            driver = neo4j.GraphDatabase.driver(
+                config.NEO4J_URI,
+                auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD),
+                max_connection_pool_size=config.NEO4J_POOL_SIZE,
+                max_connection_lifetime=config.NEO4J_CONNECTION_LIFETIME,
+                liveness_check_timeout=config.NEO4J_LIVENESS_CHECK,
+                connection_timeout=config.NEO4J_CONNECT_TIMEOUT,
+                keep_alive=True,
+            )
+            try:
+                logger.info("Connected to Neo4j at %s in %.0f ms",
+                            config.NEO4J_URI, probe(driver) * 1000)
+            except (neo4j.exceptions.ServiceUnavailable, neo4j.exceptions.AuthError) as e:
+                driver.close()
+                raise ValueError(f"Could not connect to Neo4j at {config.NEO4J_URI}: {e}") from e
+            _driver = driver
+            atexit.register(close_driver)
+        return _driver
+
+
+def probe(driver=None, database=None):
+    """Seconds for a RETURN 1 round trip, the connectivity check done at startup
+
+    database defaults to NEO4J_DATABASE, the one the graph store uses.
+    """
+    driver = driver or get_driver()
+    start = time.perf_counter()
+    # an auto-commit query, so an unreachable server fails at once instead of
+    # being retried like execute_query does
+    with driver.session(database=database or config.NEO4J_DATABASE) as session:
+        session.run("RETURN 1").consume()
+    return time.perf_counter() - start
+
+
+def close_driver():
+    global _driver
+    with _lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+class PooledNeo4jGraphStore(Neo4jGraphStore):
+    """Neo4jGraphStore on the shared driver
+
+    The schema needs APOC; without it the store is still usable for triplet
+    writes and KnowledgeGraphRAGRetriever, so a missing plugin only logs a
+    warning here. close() leaves the shared driver open for the other users.
+    """
+
+    def __init__(self, database=None, node_label="Entity", refresh_schema=True,
+                 timeout=None, driver=None):
+        # Neo4jGraphStore.__init__ would open (and close) a driver of its own
+        self.node_label = node_label
+        self._driver = driver or get_driver()
+        self._database = database or config.NEO4J_DATABASE
+        self._timeout = timeout
+        self.schema = ""
+        self.structured_schema = {}
+        if refresh_schema:
+            try:
+                self.refresh_schema()
+            except neo4j.exceptions.ClientError:
+                logger.warning("Could not read the Neo4j schema, APOC is not available")
+        self.query(
+            f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:`{node_label}`) REQUIRE n.id IS UNIQUE"
+        )
+
+    def neighbors(self, names, terms=(), limit=None, timeout=None):
+        """{name: [(subj, rel, obj)]} for the relationships going out of each entity named
+
+        For traversal.traverse(): one query per hop instead of get_rel_map's
+        variable-length paths. Names are matched ignoring case, like
+        get_rel_map does. At most limit relationships per entity are returned,
+        those whose type or target contains one of terms first, so a hub's
+        other relationships never leave the server; the query is cancelled
+        after timeout seconds.
+        """
+        query = (
+            "UNWIND $names AS name "
+            f"MATCH (n:`{self.node_label}`) WHERE toLower(n.id) = name "
+            "CALL { "
+            "  WITH n MATCH (n)-[r]->(m) "
+            "  WITH r, m, size([t IN $terms WHERE toLower(m.id) CONTAINS t "
+            "                   OR toLower(type(r)) CONTAINS t]) AS hits "
+            "  ORDER BY hits DESC LIMIT $limit "
+            "  RETURN type(r) AS rel, m.id AS obj "
+            "} "
+            "RETURN name, n.id AS subj, rel, obj"
+        )
+        by_lower = {}
+        for name in names:
+            by_lower.setdefault(name.lower(), []).append(name)
+        params = {"names": list(by_lower), "terms": [t.lower() for t in terms],
+                  "limit": limit if limit is not None else 2 ** 31}
+        with self._driver.session(database=self._database) as session:
+            records = [r.data() for r in session.run(neo4j.Query(query, timeout=timeout), params)]
+        result = {name: [] for name in names}
+        for record in records:
+            for name in by_lower[record["name"]]:
+                result[name].append((record["subj"], record["rel"], record["obj"]))
+        return result
+
+    def close(self):
+        pass
@@ -0,0 +1,176 @@
+"""Parallel PDF parsing for SimpleDirectoryReader, with a per-file text cache
+
+pypdf text extraction is pure Python and holds the GIL, so parsing a directory
+of large vendor manuals runs on one core. ParallelPDFLoader parses the files a
+SimpleDirectoryReader would load in a process pool, splitting very large PDFs
+into page ranges, and produces the same per-page Documents with the same
+metadata, in the same order. Parsed text is cached per file and reused while
+the file's mtime and size, or failing that its sha256, are unchanged.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _page_count(path):
+    import pypdf
+    return len(pypdf.PdfReader(path).pages)
+
+
+def _parse_pages(path, start=0, stop=None):
+    """(page_label, text) for pages [start, stop) of a PDF, as PDFReader extracts them"""
+    import pypdf
+    pdf = pypdf.PdfReader(path)
+    stop = len(pdf.pages) if stop is None else stop
+    labels = pdf.page_labels
+    return [(labels[page], pdf.pages[page].extract_text()) for page in range(start, stop)]
+
+
+class ParallelPDFLoader:
+    """Drop-in for a SimpleDirectoryReader's load_data()/iter_data() on PDFs
+
+    The worker processes are started when the loader is created. They are
+    forked from a forkserver, a single-threaded process of its own, so threads
+    already running here (a metrics server, stream_documents) don't matter.
+    Platforms without forkserver, and workers=1, parse in this process.
+    """
+
+    def __init__(self, reader, workers=None, cache_dir=None, split_bytes=20 << 20,
+                 pages_per_task=50):
+        self.reader = reader
+        self.cache_dir = cache_dir
+        self.split_bytes = split_bytes
+        self.pages_per_task = pages_per_task
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        if self.workers > 1 and "forkserver" in multiprocessing.get_all_start_methods():
+            self._pool = ProcessPoolExecutor(self.workers,
+                                             mp_context=multiprocessing.get_context("forkserver"))
+            # starts every worker now rather than on the first file
+            self._pool.submit(os.getpid).result()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def load_data(self):
+        return [doc for file_docs in self.iter_data() for doc in file_docs]
+
+    def iter_data(self):
+        """Yield each file's Documents in reader order, parsing ahead in the pool"""
+        files = iter(self.reader.input_files)
+        pending = deque()
+
+        def schedule():
+            path = next(files, None)
+            if path is None:
+                return False
+            pending.append((path, self._schedule(Path(path))))
+            return True
+
+        while len(pending) < max(2 * self.workers, 2) and schedule():
+            pass
+        while pending:
+            path, result = pending.popleft()
+            schedule()
+            file_docs = result()
+            if file_docs:
+                yield file_docs
+
+    def _schedule(self, path):
+        """Start parsing path, returning a function that waits for its Documents"""
+        if path.suffix.lower() != ".pdf":
+            from llama_index.core import SimpleDirectoryReader
+            reader = SimpleDirectoryReader(input_files=[path], file_metadata=self.reader.file_metadata)
+            return reader.load_data
+
+        stat = path.stat()
+        cached, sha256 = self._cache_get(path, stat)
+        if cached is not None:
+            telemetry.incr("cache_hits_total", cache="pdf")
+            return lambda: self._documents(path, cached)
+        telemetry.incr("cache_misses_total", cache="pdf")
+
+        if self._pool is None:
+            results = lambda: [_parse_pages(str(path))]  # noqa: E731
+        else:
+            ranges = [(0, None)]
+            if stat.st_size > self.split_bytes:
+                pages = _page_count(str(path))
+                ranges = [(start, min(start + self.pages_per_task, pages))
+                          for start in range(0, pages, self.pages_per_task)]
+            futures = [self._pool.submit(_parse_pages, str(path), start, stop)
+                       for start, stop in ranges]
+            results = lambda: [f.result() for f in futures]  # noqa: E731
+
+        def finish():
+            # the time spent waiting for the workers, i.e. parsing not hidden by other work
+            with telemetry.span("pdf_parse", file=path.name):
+                pages = [page for part in results() for page in part]
+            telemetry.incr("pdf_pages_total", len(pages))
+            self._cache_put(path, stat, sha256, pages)
+            return self._documents(path, pages)
+        return finish
+
+    def _documents(self, path, pages):
+        from llama_index.core import Document
+        metadata = self.reader.file_metadata(str(path))
+        docs = [
+            Document(text=text, metadata={"page_label": label, "file_name": path.name, **metadata})
+            for label, text in pages
+        ]
+        return self.reader._exclude_metadata(docs)
+
+    def _cache_path(self, path):
+        key = hashlib.sha256(str(path.resolve()).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _cache_get(self, path, stat):
+        """Cached pages of path if it is unchanged, and the file's sha256 if computed"""
+        if self.cache_dir is None:
+            return None, None
+        try:
+            with open(self._cache_path(path)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, _file_sha256(path)
+        if entry.get("version") != CACHE_VERSION:
+            return None, _file_sha256(path)
+        if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["pages"], entry["sha256"]
+        sha256 = _file_sha256(path)
+        if entry["sha256"] != sha256:
+            return None, sha256
+        # touched but not modified: remember the new mtime
+        self._cache_put(path, stat, sha256, entry["pages"])
+        return entry["pages"], sha256
+
+    def _cache_put(self, path, stat, sha256, pages):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_path = self._cache_path(path)
+        with open(cache_path + ".tmp", "w") as f:
+            json.dump({"version": CACHE_VERSION, "mtime_ns": stat.st_mtime_ns,
+                       "size": stat.st_size, "sha256": sha256, "pages": pages}, f)
+        os.replace(cache_path + ".tmp", cache_path)
@@ -0,0 +1,228 @@
+"""Knowledge graph and hybrid retrieval"""
+import asyncio
+import hashlib
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llama_index.core.retrievers import BaseRetriever, KnowledgeGraphRAGRetriever
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.utils import print_text
+
+from telemetry import telemetry
+from traversal import traverse
+
+logger = logging.getLogger(__name__)
+
+
+class GraphRAGRetriever(KnowledgeGraphRAGRetriever):
+    """KnowledgeGraphRAGRetriever that asks the LLM the same question for the same query,
+    or not at all
+
+    The stock retriever expands synonyms for str(list(set(keywords))), whose
+    order changes from run to run with hash randomisation, so the completion
+    cache would never see the same synonym prompt twice.
+
+    With an entity_index, query entities are looked up in the graph's entity
+    lexicon instead of being extracted and expanded by the LLM. The LLM is only
+    asked when the lexicon finds nothing and llm_fallback is set.
+
+    With a TraversalBudget, the graph is expanded by traversal.traverse()
+    instead of get_rel_map, up to graph_traversal_depth hops and
+    max_knowledge_sequence triplets, if the graph store supports it.
+    """
+
+    def __init__(self, *args, entity_index=None, llm_fallback=False, traversal_budget=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entity_index = entity_index
+        self._llm_fallback = llm_fallback
+        self._traversal_budget = traversal_budget
+        if traversal_budget is not None and not hasattr(self._graph_store, "neighbors"):
+            logger.warning("%s has no neighbors(), graph traversal is not budgeted",
+                           type(self._graph_store).__name__)
+            self._traversal_budget = None
+
+    def _resolve_entities(self, query_str):
+        with telemetry.span("entity_resolve"):
+            entities = self._entity_index.resolve(query_str,
+                                                  self._max_entities + self._max_synonyms)
+        if self._verbose:
+            print_text(f"Entities resolved from the index: {entities}\n", color="green")
+        return entities
+
+    def _get_entities(self, query_str):
+        if self._entity_index is not None:
+            entities = self._resolve_entities(query_str)
+            if entities or not self._llm_fallback:
+                return entities
+        return super()._get_entities(query_str)
+
+    async def _aget_entities(self, query_str):
+        if self._entity_index is not None:
+            entities = self._resolve_entities(query_str)
+            if entities or not self._llm_fallback:
+                return entities
+        return await super()._aget_entities(query_str)
+
+    # as the stock ones, handing the question on to the traversal
+
+    def _retrieve_keyword(self, query_bundle):
+        if self._retriever_mode not in ["keyword", "keyword_embedding"]:
+            return []
+        entities = self._get_entities(query_bundle.query_str)
+        if not entities:
+            logger.info("> No entities extracted from query string.")
+            return []
+        knowledge_sequence, rel_map = self._get_knowledge_sequence(entities,
+                                                                   query_bundle.query_str)
+        return self._build_nodes(knowledge_sequence, rel_map)
+
+    async def _aretrieve_keyword(self, query_bundle):
+        if self._retriever_mode not in ["keyword", "keyword_embedding"]:
+            return []
+        entities = await self._aget_entities(query_bundle.query_str)
+        if not entities:
+            logger.info("> No entities extracted from query string.")
+            return []
+        knowledge_sequence, rel_map = await self._aget_knowledge_sequence(
+            entities, query_bundle.query_str)
+        return self._build_nodes(knowledge_sequence, rel_map)
+
+    def _get_knowledge_sequence(self, entities, query_str=""):
+        with telemetry.span("graph_traversal", entities=len(entities)) as span:
+            if self._traversal_budget is None:
+                return super()._get_knowledge_sequence(entities)
+            return self._traverse(entities, query_str, span)
+
+    async def _aget_knowledge_sequence(self, entities, query_str=""):
+        with telemetry.span("graph_traversal", entities=len(entities)) as span:
+            if self._traversal_budget is None:
+                return await super()._aget_knowledge_sequence(entities)
+            # graph stores are synchronous; the event loop serves other questions meanwhile
+            return await asyncio.to_thread(self._traverse, entities, query_str, span)
+
+    def _traverse(self, entities, query_str, span):
+        degree = None
+        if self._entity_index is not None and self._entity_index.degrees:
+            degree = self._entity_index.degree
+        traversal = traverse(self._graph_store, entities, query_str, self._traversal_budget,
+                             depth=self._graph_traversal_depth,
+                             max_triplets=self._max_knowledge_sequence, degree=degree)
+        span.update(triplets=traversal.triplets, hubs=len(traversal.hubs),
+                    truncated=traversal.truncated)
+        telemetry.incr("graph_hubs_pruned_total", len(traversal.hubs))
+        if traversal.truncated:
+            telemetry.incr("graph_traversal_truncated_total", reason=traversal.truncated)
+        if self._verbose and traversal.hubs:
+            print_text(f"Hubs not expanded: {traversal.hubs}\n", color="green")
+        if not traversal.rel_map:
+            logger.info("> No knowledge sequence extracted from entities.")
+            return [], None
+        knowledge_sequence = [str(triplet) for triplets in traversal.rel_map.values()
+                              for triplet in triplets]
+        return knowledge_sequence, traversal.rel_map
+
+    def _expand_synonyms(self, keywords):
+        return super()._expand_synonyms(sorted(keywords))
+
+    async def _aexpand_synonyms(self, keywords):
+        return await super()._aexpand_synonyms(sorted(keywords))
+
+
+def _node_key(node_with_score):
+    """Nodes are the same if they have the same id or the same text"""
+    node = node_with_score.node
+    return node.node_id, hashlib.sha256(node.get_content().encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked node lists, scoring each node sum(1 / (k + rank)) over the lists
+
+    Nodes found by several retrievers (same id or same text) are merged into one.
+    """
+    merged = {}
+    aliases = {}
+    for nodes in rankings:
+        for rank, node in enumerate(nodes, start=1):
+            node_id, content = _node_key(node)
+            key = aliases.get(node_id) or aliases.get(content) or node_id
+            aliases[node_id] = aliases[content] = key
+            if key not in merged:
+                merged[key] = [node, 0.0]
+            merged[key][1] += 1.0 / (k + rank)
+    fused = [NodeWithScore(node=node.node, score=score) for node, score in merged.values()]
+    return sorted(fused, key=lambda node: node.score, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Queries several retrievers at once and fuses their results by reciprocal rank
+
+    retrievers maps a name (for logging) to a retriever, e.g. {"vector": ...,
+    "graph": GraphRAGRetriever(...)}. Results arriving within budget seconds
+    are fused; a retriever that takes longer is left to finish in the
+    background and its results are dropped for this query. If none finishes
+    within the budget, the first one to finish within grace more seconds is
+    used, and failing that the query gets no retrieved nodes.
+    """
+
+    def __init__(self, retrievers, budget=10.0, grace=5.0, rrf_k=60, top_k=None, **kwargs):
+        super().__init__(**kwargs)
+        self._retrievers = dict(retrievers)
+        self._budget = budget
+        self._grace = grace
+        self._rrf_k = rrf_k
+        self._top_k = top_k
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self._retrievers),
+                                            thread_name_prefix="hybrid")
+
+    def _fuse(self, results):
+        fused = reciprocal_rank_fusion(results.values(), self._rrf_k)
+        return fused[:self._top_k] if self._top_k else fused
+
+    def _retrieve(self, query_bundle):
+        start = time.perf_counter()
+        futures = {self._executor.submit(retriever.retrieve, query_bundle): name
+                   for name, retriever in self._retrievers.items()}
+        done, late = wait(futures, timeout=self._budget)
+        if not done:
+            done, late = wait(futures, timeout=self._grace, return_when=FIRST_COMPLETED)
+        results = {}
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception:
+                logger.exception("%s retriever failed", name)
+        if not done:
+            logger.warning("No retriever answered within %.1fs, retrieved nothing",
+                           self._budget + self._grace)
+        elif late:
+            logger.warning("Skipped %s retrieval, over the %.1fs budget",
+                           ", ".join(futures[f] for f in late), self._budget)
+        logger.debug("Hybrid retrieval took %.2fs: %s", time.perf_counter() - start,
+                     {name: len(nodes) for name, nodes in results.items()})
+        return self._fuse(results)
+
+    async def _aretrieve(self, query_bundle):
+        tasks = {asyncio.ensure_future(retriever.aretrieve(query_bundle)): name
+                 for name, retriever in self._retrievers.items()}
+        done, late = await asyncio.wait(tasks, timeout=self._budget)
+        if not done:
+            done, late = await asyncio.wait(tasks, timeout=self._grace,
+                                            return_when=asyncio.FIRST_COMPLETED)
+        for task in late:
+            task.cancel()
+        results = {}
+        for task in done:
+            if task.exception() is not None:
+                logger.error("%s retriever failed: %r", tasks[task], task.exception())
+            else:
+                results[tasks[task]] = task.result()
+        if not done:
+            logger.warning("No retriever answered within %.1fs, retrieved nothing",
+                           self._budget + self._grace)
+        elif late:
+            logger.warning("Skipped %s retrieval, over the %.1fs budget",
+                           ", ".join(tasks[t] for t in late), self._budget)
+        return self._fuse(results)
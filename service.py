@@ -0,0 +1,209 @@
+"""Asyncio HTTP query service over a query engine (`python main.py serve`)
+
+POST /query with {"query": "..."} answers {"answer": "...", "cached": bool,
+"coalesced": bool, "seconds": float}. GET /health reports the load and
+GET /metrics the telemetry counters in Prometheus format.
+
+Queries run on one event loop through the query engine's async API, so many
+requests can wait on Ollama at once:
+- identical questions in flight (same words, ignoring case and spacing) are
+  answered by one generation, whose answer every asker gets
+- at most max_generations answers are generated at once; the others queue
+- with max_pending generations running or queued, new questions are turned
+  away with 503 and Retry-After, so a load balancer can try another instance
+  instead of letting the queue grow
+Questions answered from the answer cache never take a generation slot.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from config import config
+from extraction import strip_thinking
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 << 10
+# seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 75.0
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+def coalesce_key(query):
+    return " ".join(query.casefold().split())
+
+
+class Overloaded(Exception):
+    """More than max_pending generations would be running or queued"""
+
+
+class QueryService:
+    """Answers questions concurrently, coalescing duplicates and bounding generations
+
+    query_engine needs an async aquery() (RetrieverQueryEngine, not streaming);
+    answer_cache is an AnswerCache, whose blocking lookups run in threads.
+    """
+
+    def __init__(self, query_engine, answer_cache, max_generations=2, max_pending=32,
+                 timeout=300.0):
+        self.query_engine = query_engine
+        self.answer_cache = answer_cache
+        self.max_generations = max_generations
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.generating = 0
+        self._generations = None
+        self._in_flight = {}
+
+    async def answer(self, query):
+        """{"answer", "cached", "coalesced"} for query
+
+        Raises Overloaded when the queue is full and asyncio.TimeoutError when
+        the answer takes longer than timeout; the generation then carries on
+        for whoever else asked, and fills the answer cache.
+        """
+        key = coalesce_key(query)
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            telemetry.incr("service_coalesced_total")
+        else:
+            task = asyncio.ensure_future(self._answer(query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda task: self._done(key, task))
+        text, cached = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        return {"answer": text, "cached": cached, "coalesced": coalesced}
+
+    def _done(self, key, task):
+        self._in_flight.pop(key, None)
+        # retrieved here too, in case every asker timed out
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Answering %r failed: %r", key, task.exception())
+
+    async def _answer(self, query):
+        response = await asyncio.to_thread(self.answer_cache.get, query)
+        cached = response is not None
+        if not cached:
+            if self.pending >= self.max_pending:
+                telemetry.incr("service_rejected_total")
+                raise Overloaded(f"{self.pending} questions are already being answered")
+            self.pending += 1
+            try:
+                response = await self._generate(query)
+            finally:
+                self.pending -= 1
+            await asyncio.to_thread(self.answer_cache.put, query, response)
+        return (strip_thinking(response).strip() if config.HIDE_THINKING else response), cached
+
+    async def _generate(self, query):
+        if self._generations is None:
+            # created here so it belongs to the running event loop
+            self._generations = asyncio.Semaphore(self.max_generations)
+        queued = time.perf_counter()
+        async with self._generations:
+            telemetry.observe("service_queue_seconds", time.perf_counter() - queued)
+            self.generating += 1
+            try:
+                with telemetry.span("answer", query=query):
+                    return str(await self.query_engine.aquery(query))
+            finally:
+                self.generating -= 1
+
+    def health(self):
+        return {"status": "ok", "generating": self.generating, "pending": self.pending,
+                "max_pending": self.max_pending, "in_flight": len(self._in_flight)}
+
+    async def handle(self, method, path, body):
+        """(status, payload, content type, extra headers) for one request"""
+        if method == "GET" and path == "/health":
+            return 200, self.health(), "application/json", {}
+        if method == "GET" and path == "/metrics":
+            return 200, telemetry.prometheus(), "text/plain; version=0.0.4", {}
+        if path != "/query" or method != "POST":
+            return 404, {"error": f"unknown endpoint {method} {path}"}, "application/json", {}
+        try:
+            query = json.loads(body)["query"].strip()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": 'expected {"query": "..."}'}, "application/json", {}
+
+        start = time.perf_counter()
+        try:
+            result = await self.answer(query)
+        except Overloaded as e:
+            return 503, {"error": str(e)}, "application/json", {"Retry-After": "5"}
+        except asyncio.TimeoutError:
+            return 504, {"error": f"no answer within {self.timeout:.0f}s"}, "application/json", {}
+        except Exception as e:
+            logger.exception("Query failed: %s", query)
+            return 500, {"error": str(e)}, "application/json", {}
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return 200, result, "application/json", {}
+
+    async def _connection(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one connection, keeping it open between them"""
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request line"})
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "request body too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload, content_type, extra = await self.handle(method, path, body)
+                keep_alive = (version == "HTTP/1.1"
+                              and headers.get("connection", "").lower() != "close")
+                telemetry.incr("service_requests_total", status=status)
+                await self._respond(writer, status, payload, content_type, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, content_type="application/json", extra=None,
+                       keep_alive=False):
+        data = (payload if isinstance(payload, str) else json.dumps(payload)).encode()
+        headers = {"Content-Type": content_type, "Content-Length": str(len(data)),
+                   "Connection": "keep-alive" if keep_alive else "close", **(extra or {})}
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """Start listening, returning the asyncio server"""
+        return await asyncio.start_server(self._connection, host, port)
+
+
+def serve(query_engine, answer_cache, host="127.0.0.1", port=8000, **kwargs):
+    """Run a QueryService until interrupted; kwargs are passed to QueryService"""
+    service = QueryService(query_engine, answer_cache, **kwargs)
+
+    async def run():
+        server = await service.start(host, port)
+        print(f"Answering questions on http://{host}:{server.sockets[0].getsockname()[1]}/query")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,24 @@
+"""Graph store selection from config.GRAPH_STORE"""
+from config import config
+
+
+def build_graph_store(refresh_schema=True):
+    """The configured graph store: Neo4j at NEO4J_URI on the shared driver, or the
+    embedded CSRGraphStore
+
+    refresh_schema=False opens Neo4j without reading its schema (an APOC call
+    that scans the graph), which retrieval doesn't use.
+    """
+    if config.GRAPH_STORE == "local":
+        from local_graph_store import CSRGraphStore
+        return CSRGraphStore(config.state_path("graph"))
+
+    from neo4j_pool import PooledNeo4jGraphStore
+    return PooledNeo4jGraphStore(database=config.NEO4J_DATABASE, refresh_schema=refresh_schema, timeout=600.0)
+
+
+def graph_store_id():
+    """Identifies the graph the ingestion manifest describes"""
+    if config.GRAPH_STORE == "local":
+        return "local:" + config.state_path("graph")
+    return f"{config.NEO4J_URI}/{config.NEO4J_DATABASE}"
@@ -0,0 +1,112 @@
+"""Streamed answers for the query loop
+
+With RetrieverQueryEngine.from_args(..., streaming=True), query() returns as
+soon as retrieval is done and the answer is read token by token from
+response_gen while Ollama generates it. stream_answer writes those tokens out
+as they arrive and times the first token separately from the whole answer.
+"""
+import sys
+import time
+from dataclasses import dataclass
+
+THINK_OPEN, THINK_CLOSE = "<think>", "</think>"
+
+
+def _partial_tag(text, tag):
+    """Length of the longest end of text that could be the start of tag"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class ThinkFilter:
+    """Drops <think>...</think> blocks from a token stream
+
+    Tags may be split across tokens, so text that could be the start of a tag
+    is held back until the next token shows whether it is one.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+        self._started = False
+
+    def feed(self, token):
+        """The visible part of token, possibly including text held back earlier"""
+        self._buffer += token
+        out = []
+        while True:
+            tag = THINK_CLOSE if self._inside else THINK_OPEN
+            i = self._buffer.find(tag)
+            if i < 0:
+                break
+            if not self._inside:
+                out.append(self._buffer[:i])
+            self._buffer = self._buffer[i + len(tag):]
+            self._inside = not self._inside
+        keep = _partial_tag(self._buffer, THINK_CLOSE if self._inside else THINK_OPEN)
+        if not self._inside:
+            out.append(self._buffer[:len(self._buffer) - keep])
+        self._buffer = self._buffer[len(self._buffer) - keep:]
+        return self._visible("".join(out))
+
+    def flush(self):
+        """Whatever is still held back once the stream has ended"""
+        rest = "" if self._inside else self._buffer
+        self._buffer = ""
+        return self._visible(rest)
+
+    def _visible(self, text):
+        # the answer follows the reasoning after a blank line
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+@dataclass
+class StreamStats:
+    # seconds from the query to the first token Ollama produced
+    first_token: float = 0.0
+    # seconds from the query to the first token shown (after any hidden reasoning)
+    first_visible: float = 0.0
+    total: float = 0.0
+
+    def __str__(self):
+        text = f"first token {self.first_token:.2f}s"
+        if self.first_visible != self.first_token:
+            text += f", answer after {self.first_visible:.2f}s"
+        return text + f", total {self.total:.2f}s"
+
+
+def stream_answer(query_engine, query, hide_thinking=True, out=None):
+    """Query a streaming query engine, writing the answer to out as it is generated
+
+    Returns the full answer, reasoning included, and its StreamStats.
+    """
+    out = out or sys.stdout
+    start = time.perf_counter()
+    stats = StreamStats()
+    think_filter = ThinkFilter() if hide_thinking else None
+    tokens = []
+    response = query_engine.query(query)
+    for token in response.response_gen:
+        now = time.perf_counter() - start
+        if not tokens:
+            stats.first_token = now
+        tokens.append(token)
+        visible = think_filter.feed(token) if think_filter else token
+        if visible:
+            if not stats.first_visible:
+                stats.first_visible = now
+            out.write(visible)
+            out.flush()
+    if think_filter:
+        out.write(think_filter.flush())
+    out.write("\n")
+    out.flush()
+    stats.total = time.perf_counter() - start
+    if not stats.first_visible:
+        stats.first_visible = stats.total
+    return "".join(tokens), stats
@@ -0,0 +1,290 @@
+"""Per-stage timings and counters for ingestion and queries
+
+A build or a query is a handful of stages (PDF parsing, triplet extraction,
+embedding, graph writes, entity resolution, graph traversal, synthesis) and the
+logs only show their sum. The Telemetry registry records:
+- spans: a named, timed stage, kept as a trace event and added to the
+  stage_seconds histogram
+- counters: LLM calls and tokens, cache hits and misses, graph round trips
+- histograms: any other observed value, with fixed buckets
+
+TelemetryHandler feeds LlamaIndex callback events (LLM, embedding, retrieval,
+synthesis, query) into the same registry. It is exported as a JSON trace in
+Chrome trace event format, for chrome://tracing or ui.perfetto.dev, and as
+Prometheus text, which serve_metrics() serves over HTTP.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "graphrag_"
+# seconds, from a cache lookup to a full deepseek-r1 answer
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 120.0, 300.0)
+# the LLM and embedding events being handled in this thread or task; LlamaIndex
+# passes no parent for them, they never go on its trace stack
+_outer_events = {
+    CBEventType.LLM: ContextVar("outer_llm_event", default=None),
+    CBEventType.EMBEDDING: ContextVar("outer_embedding_event", default=None),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, as Prometheus exposes them"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """Thread-safe registry of spans, counters and histograms
+
+    At most max_events spans are kept for the trace; later ones still count
+    towards the histograms, and the number dropped is reported in the trace.
+    """
+
+    def __init__(self, max_events=100_000):
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._start = time.perf_counter()
+            self._start_wall = time.time()
+            self._events = []
+            self._dropped = 0
+            self._counters = {}
+            self._histograms = {}
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the with block as stage name; attrs are kept in the trace event"""
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record_span(name, start, time.perf_counter() - start, **attrs)
+
+    def record_span(self, name, start, seconds, **attrs):
+        """Record a stage that started at perf_counter() start and took seconds"""
+        event = {"name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts": round((start - self._start) * 1e6), "dur": round(seconds * 1e6)}
+        if attrs:
+            event["args"] = {key: value if isinstance(value, (int, float, bool)) else str(value)
+                             for key, value in attrs.items()}
+        with self._lock:
+            if len(self._events) < self.max_events:
+                self._events.append(event)
+            else:
+                self._dropped += 1
+            self._observe("stage_seconds", seconds, _labels_key({"stage": name}))
+
+    def incr(self, name, value=1, **labels):
+        if not value:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._observe(name, value, _labels_key(labels))
+
+    def _observe(self, name, value, labels):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = Histogram()
+        histogram.observe(value)
+
+    def counter(self, name, **labels):
+        """Current value of a counter, summed over the labels not given"""
+        wanted = set(_labels_key(labels))
+        with self._lock:
+            return sum(value for (counter, key), value in self._counters.items()
+                       if counter == name and wanted <= set(key))
+
+    def stages(self):
+        """{stage: (count, total seconds)} for every span recorded so far"""
+        with self._lock:
+            return {dict(labels)["stage"]: (histogram.count, histogram.sum)
+                    for (name, labels), histogram in self._histograms.items()
+                    if name == "stage_seconds"}
+
+    def summary(self):
+        """One line per stage, slowest first, e.g. "extract 42.1s (120)" """
+        stages = sorted(self.stages().items(), key=lambda item: -item[1][1])
+        return "\n".join(f"  {stage:20} {total:8.2f}s ({count})"
+                         for stage, (count, total) in stages)
+
+    def trace(self):
+        """The spans and counters in Chrome trace event format"""
+        with self._lock:
+            counters = {name + _format_labels(labels): value
+                        for (name, labels), value in sorted(self._counters.items())}
+            return {"traceEvents": list(self._events),
+                    "displayTimeUnit": "ms",
+                    "otherData": {"start_time": self._start_wall,
+                                  "dropped_events": self._dropped,
+                                  "counters": counters}}
+
+    def write_trace(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.trace(), f)
+        os.replace(path + ".tmp", path)
+        logger.info("Wrote telemetry trace to %s", path)
+
+    def prometheus(self):
+        """Counters and histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{PREFIX}{name}_bucket"
+                                     f"{_format_labels(labels, [('le', str(bound))])} {count}")
+                    lines.append(f"{PREFIX}{name}_bucket"
+                                 f"{_format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+telemetry = Telemetry()
+
+
+class TelemetryHandler(BaseCallbackHandler):
+    """LlamaIndex callback handler recording events as spans in a Telemetry registry
+
+    LLM events also count calls and, from Ollama's prompt_eval_count and
+    eval_count, prompt and completion tokens; embedding events count the texts
+    asked for, cache hits included. An LLM or embedding event nested in another
+    one of its type (Ollama's complete() calls chat(), CachedEmbedding calls the
+    model it wraps, and both fire one) is left to the outer event so each call
+    counts once.
+    """
+
+    EVENTS = (CBEventType.LLM, CBEventType.EMBEDDING, CBEventType.RETRIEVE,
+              CBEventType.SYNTHESIZE, CBEventType.QUERY, CBEventType.CHUNKING)
+
+    def __init__(self, registry=None):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.registry = registry or telemetry
+        self._starts = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+        if event_type in self.EVENTS:
+            with self._lock:
+                outer = _outer_events.get(event_type)
+                if outer is not None:
+                    if outer.get() not in (None, event_id):
+                        return event_id
+                    outer.set(event_id)
+                self._starts[event_id] = time.perf_counter()
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        outer = _outer_events.get(event_type)
+        if outer is not None and outer.get() == event_id:
+            outer.set(None)
+        with self._lock:
+            start = self._starts.pop(event_id, None)
+        if start is None:
+            return
+        self.registry.record_span(event_type.value, start, time.perf_counter() - start)
+        payload = payload or {}
+        if event_type == CBEventType.LLM:
+            self._count_llm(payload)
+        elif event_type == CBEventType.EMBEDDING:
+            self.registry.incr("embedded_texts_total", len(payload.get(EventPayload.CHUNKS) or []))
+
+    def _count_llm(self, payload):
+        response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+        # the ollama client's response, a dict or a pydantic model depending on the version
+        raw = getattr(response, "raw", None) or {}
+        field = raw.get if isinstance(raw, dict) else lambda key: getattr(raw, key, None)
+        model = field("model") or ""
+        self.registry.incr("llm_calls_total", model=model)
+        self.registry.incr("llm_prompt_tokens_total", field("prompt_eval_count") or 0, model=model)
+        self.registry.incr("llm_completion_tokens_total", field("eval_count") or 0, model=model)
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1", registry=None):
+    """Serve /metrics (Prometheus text) and /trace (JSON) from a daemon thread
+
+    Returns the server; call shutdown() on it to stop.
+    """
+    registry = registry or telemetry
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = registry.prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/trace":
+                body, content_type = json.dumps(registry.trace()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
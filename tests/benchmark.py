@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Benchmark ingestion, graph writes and query latency offline
+
+Runs the real ingestion and query code against the stub Ollama server
+(tests/stub_ollama.py) and the embedded CSRGraphStore, on a generated corpus,
+so the numbers only move when the code does. Model time is simulated with
+--latency / --token-latency. Results are saved as JSON under
+tests/benchmark_results/ and compared with the previous run (or --baseline).
+
+    python tests/benchmark.py
+    python tests/benchmark.py --latency 0.05 --neo4j   # also time writes to NEO4J_URI
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+sys.path.append('.')
+
+import numpy as np
+from llama_index.core import Document, Settings, StorageContext
+from llama_index.core.query_engine import RetrieverQueryEngine
+
+from config import config
+from entity_index import EntityIndex
+from graph_writer import make_triplet_writer
+from ingest import build_knowledge_graph
+from local_graph_store import CSRGraphStore
+from models import build_embed_model, build_llm
+from retrieval import GraphRAGRetriever
+from streaming import stream_answer
+from tests.stub_ollama import StubOllama
+
+RESULTS_DIR = "tests/benchmark_results"
+
+PRODUCTS = ["Hana", "Vsphere", "Suse", "Numa", "Esxi", "Oracle", "Db2", "Kubernetes"]
+
+
+def make_corpus(files, pages):
+    """files x pages documents, each naming a few components and products"""
+    docs = []
+    for f in range(files):
+        for p in range(pages):
+            i = f * pages + p
+            text = (f"Component{i} runs on {PRODUCTS[i % len(PRODUCTS)]} with "
+                    f"Component{(i * 7 + 3) % (files * pages)}. "
+                    f"Sizing of {PRODUCTS[(i + 3) % len(PRODUCTS)]} depends on Component{i}.")
+            docs.append(Document(text=text, metadata={"file_path": f"manual{f}.pdf", "page": p}))
+    return docs
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(samples, 50)), 2),
+            "p95_ms": round(float(np.percentile(samples, 95)), 2),
+            "p99_ms": round(float(np.percentile(samples, 99)), 2)}
+
+
+def bench_ingestion(args, state_dir, graph_store):
+    docs = make_corpus(args.files, args.pages)
+    stats = build_knowledge_graph(
+        docs, graph_store, build_llm(request_timeout=60.0),
+        manifest_path=os.path.join(state_dir, "kg_manifest.json"),
+        graph_id="benchmark",
+        concurrency=args.concurrency,
+        write_batch_size=args.write_batch,
+        extract_batch_tokens=args.extract_batch_tokens,
+        entity_index_path=os.path.join(state_dir, "entity_index.json"),
+    )
+    rerun = build_knowledge_graph(
+        docs, graph_store, build_llm(request_timeout=60.0),
+        manifest_path=os.path.join(state_dir, "kg_manifest.json"),
+        graph_id="benchmark",
+    )
+    return {"chunks": stats.chunks_added,
+            "triplets": stats.triplets_written,
+            "seconds": round(stats.seconds, 3),
+            "chunks_per_sec": round(stats.chunks_per_sec, 1),
+            "unchanged_rerun_seconds": round(rerun.seconds, 3)}
+
+
+def bench_writes(graph_store, count, batch_size):
+    """Upsert then delete count triplets through the store's batched writer"""
+    triplets = [(f"Bench{i}", f"bench rel {i % 5}", f"Bench{(i * 13 + 1) % count}")
+                for i in range(count)]
+    timings = {}
+    for name, op in (("upsert", "upsert"), ("delete", "delete")):
+        writer = make_triplet_writer(graph_store, batch_size)
+        start = time.perf_counter()
+        with writer:
+            for triplet in triplets:
+                getattr(writer, op)(*triplet)
+        seconds = time.perf_counter() - start
+        timings[f"{name}_per_sec"] = round(count / seconds, 1)
+        timings[f"{name}_round_trips"] = writer.round_trips
+    return dict(triplets=count, batch_size=batch_size, **timings)
+
+
+def bench_queries(args, state_dir, graph_store):
+    entity_index = EntityIndex.load(os.path.join(state_dir, "entity_index.json"))
+    retriever = GraphRAGRetriever(
+        storage_context=StorageContext.from_defaults(graph_store=graph_store),
+        llm=build_llm(request_timeout=60.0),
+        entity_index=entity_index,
+    )
+    query_engine = RetrieverQueryEngine.from_args(retriever, streaming=True)
+    total_pages = args.files * args.pages
+    queries = [f"Where does Component{(i * 37) % total_pages} run, and what about "
+               f"{PRODUCTS[i % len(PRODUCTS)]}?" for i in range(args.queries)]
+
+    retrieval, first_token, total = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.retrieve(query)
+        retrieval.append(time.perf_counter() - start)
+        _, stats = stream_answer(query_engine, query, out=io.StringIO())
+        first_token.append(stats.first_token)
+        total.append(stats.total)
+    return {"queries": len(queries),
+            "retrieval": percentiles(retrieval),
+            "first_token": percentiles(first_token),
+            "total": percentiles(total)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)):
+            yield f"{prefix}{key}", value
+
+
+def compare(results, baseline_path):
+    """Print each number next to the baseline run's"""
+    with open(baseline_path) as f:
+        baseline = dict(flatten(json.load(f)["results"]))
+    print(f"\nCompared with {baseline_path}:")
+    for key, value in flatten(results):
+        if key in baseline and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            print(f"  {key:40} {baseline[key]:>12} -> {value:>12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Graph RAG benchmarks")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated seconds per Ollama request")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="simulated seconds per streamed token")
+    parser.add_argument("--extract-batch-tokens", type=int, default=0,
+                        help="extract several chunks per prompt, up to this many tokens")
+    parser.add_argument("--write-triplets", type=int, default=20_000)
+    parser.add_argument("--write-batch", type=int, default=1000)
+    parser.add_argument("--neo4j", action="store_true",
+                        help="also time graph writes against the configured Neo4j")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--baseline", help="results file to compare with (default: latest)")
+    args = parser.parse_args()
+
+    previous = sorted(glob.glob(os.path.join(args.output, "*.json")))
+    results = {}
+    with StubOllama(latency=args.latency, token_latency=args.token_latency) as ollama, \
+            tempfile.TemporaryDirectory() as state_dir:
+        config.OLLAMA_HOST, config.OLLAMA_PORT = "127.0.0.1", ollama.port
+        Settings.embed_model = build_embed_model(cache=False)
+        Settings.llm = build_llm(request_timeout=60.0)
+        graph_store = CSRGraphStore(os.path.join(state_dir, "graph"))
+
+        print("Benchmarking ingestion...")
+        results["ingestion"] = bench_ingestion(args, state_dir, graph_store)
+        print(f"  {results['ingestion']}")
+
+        print("Benchmarking graph writes...")
+        results["writes"] = {"local": bench_writes(CSRGraphStore(os.path.join(state_dir, "writes")),
+                                                   args.write_triplets, args.write_batch)}
+        if args.neo4j:
+            from neo4j_pool import PooledNeo4jGraphStore
+            store = PooledNeo4jGraphStore(database="neo4j", node_label="BenchmarkEntity")
+            try:
+                results["writes"]["neo4j"] = bench_writes(store, args.write_triplets,
+                                                          args.write_batch)
+            finally:
+                store.query("MATCH (n:BenchmarkEntity) DETACH DELETE n")
+        print(f"  {results['writes']}")
+
+        print("Benchmarking queries...")
+        results["queries"] = bench_queries(args, state_dir, graph_store)
+        print(f"  {results['queries']}")
+        results["ollama_requests"] = ollama.requests
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump({"timestamp": datetime.now().isoformat(timespec="seconds"),
+                   "commit": git_commit(),
+                   "python": platform.python_version(),
+                   "parameters": vars(args),
+                   "results": results}, f, indent=2)
+    print(f"\nResults saved to {path}")
+
+    baseline = args.baseline or (previous[-1] if previous else None)
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -69,8 +69,26 @@ def main():
     tests = [
         ("quick_test.py", "Ollama LLM Connection Test"),
         ("test_neo4j.py", "Neo4j Database Connection Test"), 
+        ("test_graph_writer.py", "Neo4j Batched Write Test"),
         ("test_current_system.py", "Document Loading & Basic RAG Test"),
         ("test_graph_rag.py", "Full Graph RAG System Test"),
+        ("test_ingest.py", "Incremental Ingestion Test"),
+        ("test_caches.py", "Model Cache Test"),
+        ("test_pdf_loader.py", "Parallel PDF Loading Test"),
+        ("test_local_graph_store.py", "Embedded Graph Store Test"),
+        ("test_streaming.py", "Streaming Response Test"),
+        ("test_entity_index.py", "Entity Index Test"),
+        ("test_hybrid.py", "Hybrid Retrieval Test"),
+        ("test_vector_store.py", "Local Vector Store Test"),
+        ("test_vector_sync.py", "Vector Index Sync Test"),
+        ("test_telemetry.py", "Telemetry Test"),
+        ("test_cli.py", "CLI and Service Test"),
+        ("test_batch.py", "Batch Question Test"),
+        ("test_canonical.py", "Entity Canonicalization Test"),
+        ("test_traversal.py", "Graph Traversal Test"),
+        ("test_context_packing.py", "Context Packing Test"),
+        ("test_batch_extraction.py", "Batched Extraction Test"),
+        ("test_resume.py", "Resumable Ingestion Test"),
     ]
     
     results = []
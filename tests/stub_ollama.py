@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the Ollama HTTP API, for tests and benchmarks without a GPU
+
+Serves /api/chat, /api/generate, /api/embeddings, /api/embed and /api/show on
+localhost with deterministic answers:
+- triplet extraction prompts get one "(A, relates to, B)" triplet per pair of
+  adjacent capitalised words in the text, so the graph is the same every run;
+  batched prompts get them under a "Chunk <n>:" line per chunk
+- keyword prompts get the capitalised words of the question
+- anything else gets an answer of answer_tokens words, streamed if asked
+- embeddings are hashed bags of words of dimension dim
+Every request waits latency seconds, and streamed answers token_latency
+seconds per token, to stand in for model time.
+
+    python tests/stub_ollama.py --port 11434 --latency 0.2
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+CAPITALISED = re.compile(r"\b[A-Z][\w-]*")
+CHUNK = re.compile(r"^\[Chunk (\d+)\]$", re.MULTILINE)
+
+
+def embed(text, dim):
+    """Hashed bag of words, normalised, so texts sharing words are similar"""
+    vector = np.zeros(dim)
+    for word in text.lower().split():
+        bucket = int.from_bytes(hashlib.md5(word.strip("?.,").encode()).digest()[:4], "little")
+        vector[bucket % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def triplets(text):
+    words = CAPITALISED.findall(text)
+    return "\n".join(f"({a}, relates to, {b})" for a, b in zip(words, words[1:]))
+
+
+def answer(prompt, answer_tokens):
+    """The deterministic completion for prompt"""
+    if prompt.rstrip().endswith("Triplets by chunk:"):
+        text = prompt.rsplit("-" * 21, 1)[-1].rsplit("Triplets by chunk:", 1)[0]
+        parts = CHUNK.split(text)[1:]
+        return "\n".join(f"Chunk {number}:\n{triplets(chunk)}"
+                         for number, chunk in zip(parts[::2], parts[1::2]))
+    if prompt.rstrip().endswith("Triplets:"):
+        return triplets(prompt.rsplit("Text:", 1)[-1].rsplit("Triplets:", 1)[0])
+    if "'SYNONYMS: <keywords>'" in prompt:
+        keywords = prompt.rsplit("KEYWORDS:", 1)[-1].split("----", 1)[0]
+        return "SYNONYMS: " + ", ".join(CAPITALISED.findall(keywords))
+    if "'KEYWORDS: <keywords>'" in prompt:
+        question = prompt.split("-" * 21)[1] if prompt.count("-" * 21) >= 2 else prompt
+        return "KEYWORDS: " + ", ".join(CAPITALISED.findall(question))
+    return " ".join(f"word{i}" for i in range(answer_tokens))
+
+
+class StubOllama:
+    """Runs the stub server in a background thread
+
+        with StubOllama(latency=0.1) as ollama:
+            Ollama(model="stub", base_url=ollama.url)
+    """
+
+    def __init__(self, port=0, latency=0.0, token_latency=0.0, answer_tokens=50, dim=64):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.dim = dim
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                route = {
+                    "/api/chat": self.chat,
+                    "/api/generate": self.generate,
+                    "/api/embeddings": self.embeddings,
+                    "/api/embed": self.embed,
+                    "/api/show": self.show,
+                }.get(self.path)
+                if route is None:
+                    self.send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+                else:
+                    route(body)
+
+            def send_json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def reply(self, body, text, message):
+                """Answer text, whole or one token per line (NDJSON) if streaming"""
+                base = {"model": body.get("model", "stub"),
+                        "created_at": datetime.now(timezone.utc).isoformat()}
+                done = dict(base, done=True, done_reason="stop",
+                            prompt_eval_count=0, eval_count=len(text.split()))
+                if not body.get("stream", True):
+                    time.sleep(stub.token_latency * len(text.split()))
+                    self.send_json(dict(done, **message(text)))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in re.findall(r"\S+\s*", text):
+                    time.sleep(stub.token_latency)
+                    self.write_chunk(dict(base, done=False, **message(token)))
+                self.write_chunk(dict(done, **message("")))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def write_chunk(self, payload):
+                data = json.dumps(payload).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def chat(self, body):
+                prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                self.reply(body, answer(prompt, stub.answer_tokens),
+                           lambda text: {"message": {"role": "assistant", "content": text,
+                                                    "tool_calls": []}})
+
+            def generate(self, body):
+                self.reply(body, answer(body.get("prompt", ""), stub.answer_tokens),
+                           lambda text: {"response": text})
+
+            def embeddings(self, body):
+                self.send_json({"embedding": embed(body.get("prompt", ""), stub.dim)})
+
+            def embed(self, body):
+                inputs = body.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self.send_json({"model": body.get("model", "stub"),
+                                "embeddings": [embed(text, stub.dim) for text in inputs]})
+
+            def show(self, body):
+                self.send_json({"modelfile": "", "parameters": "", "template": "",
+                                "details": {"family": "stub"},
+                                "model_info": {"stub.context_length": 8192}})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per streamed token")
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=64, help="embedding dimension")
+    args = parser.parse_args()
+    stub = StubOllama(args.port, args.latency, args.token_latency, args.answer_tokens, args.dim)
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test batch question answering offline: concurrency, JSONL records and resuming
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+from llama_index.core.schema import NodeWithScore, TextNode
+from batch import answered_ids, read_questions, run_batch
+
+
+class FakeQueryEngine:
+    """Retrieves one knowledge graph node and one text node, answers after delay seconds"""
+
+    def __init__(self, delay=0.1, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.asked = []
+        self.running = 0
+        self.max_running = 0
+
+    async def aretrieve(self, bundle):
+        self.asked.append(bundle.query_str)
+        if bundle.query_str in self.fail:
+            raise RuntimeError("Ollama timed out")
+        return [
+            NodeWithScore(node=TextNode(text="kg", metadata={
+                "kg_rel_texts": ["['SAP HANA', 'runs on', 'vSphere']"] * 2}), score=1.0),
+            NodeWithScore(node=TextNode(text="page", metadata={"file_name": "hana.pdf"}),
+                          score=0.5),
+        ]
+
+    async def asynthesize(self, bundle, nodes):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return f"<think>...</think>Answer to {bundle.query_str}"
+
+
+def test_batch():
+    """Questions run in parallel, each answer is one JSONL record"""
+    print("Testing batch answering...")
+    with tempfile.TemporaryDirectory() as tmp:
+        questions_path = os.path.join(tmp, "questions.txt")
+        with open(questions_path, "w") as f:
+            f.write("# SAP on VMware\nWhat is SAP HANA?\n\nHow should vSphere be configured?\n"
+                    + "".join(f"Question {i}?\n" for i in range(8)))
+        questions = read_questions(questions_path)
+        assert len(questions) == 10, questions
+
+        engine = FakeQueryEngine(fail={"Question 3?"})
+        output = os.path.join(tmp, "answers.jsonl")
+        start = time.perf_counter()
+        counts = asyncio.run(run_batch(engine, questions, output, parallel=4))
+        elapsed = time.perf_counter() - start
+        assert counts == {"answered": 9, "failed": 1, "skipped": 0}, counts
+        assert engine.max_running == 4, engine.max_running
+        assert elapsed < 10 * engine.delay, elapsed
+        with open(output) as f:
+            records = {record["id"]: record for record in map(json.loads, f)}
+        record = records["What is SAP HANA?"]
+        assert record["answer"] == "Answer to What is SAP HANA?", record
+        assert record["triplets"] == ["['SAP HANA', 'runs on', 'vSphere']"], record
+        assert record["sources"][0]["file"] == "hana.pdf", record
+        assert record["retrieval_seconds"] <= record["seconds"]
+        assert "error" in records["Question 3?"]
+        print(f"✓ 10 questions in {elapsed:.2f}s with 4 in flight, failure recorded")
+
+        # a crash mid-write leaves a partial line behind
+        with open(output, "a") as f:
+            f.write('{"id": "Question 7?", "que')
+        engine = FakeQueryEngine()
+        counts = asyncio.run(run_batch(engine, questions, output, parallel=4))
+        assert counts == {"answered": 1, "failed": 0, "skipped": 9}, counts
+        assert engine.asked == ["Question 3?"], engine.asked
+        assert len(answered_ids(output)) == 10
+        print("✓ Resumed run only asked the failed question again")
+
+
+if __name__ == "__main__":
+    print("=== Batch Question Test ===")
+    try:
+        test_batch()
+    except AssertionError as e:
+        print(f"✗ Batch test failed: {e}")
+        sys.exit(1)
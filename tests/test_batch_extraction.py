@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test extracting triplets for several chunks per prompt offline, with a fake LLM
+"""
+
+import os
+import re
+import sys
+import tempfile
+sys.path.append('.')
+
+from extraction import MalformedBatch, batch_chunks, parse_batch_response
+from ingest import build_knowledge_graph
+from tests.test_ingest import FakeGraphStore, FakeLLM, make_docs
+
+CHUNK = re.compile(r"^\[Chunk (\d+)\]\n", re.MULTILINE)
+
+
+class FakeBatchLLM(FakeLLM):
+    """Answers batch prompts chunk by chunk, leaving out the last chunk or all structure if asked"""
+
+    def __init__(self, mode="ok"):
+        super().__init__()
+        self.mode = mode
+
+    def predict(self, prompt, text, **kwargs):
+        if not text.startswith("[Chunk "):
+            return super().predict(prompt, text)
+        with self._lock:
+            self.calls += 1
+        if self.mode == "garbage":
+            return "<think>(Hana, is, thinking)</think>Sorry, (Hana, is, unclear) to me."
+        parts = CHUNK.split(text)[1:]
+        sections = []
+        for number, chunk in zip(parts[::2], parts[1::2]):
+            answer = super().predict(prompt, chunk.strip())
+            with self._lock:
+                self.calls -= 1
+            sections.append(f"**Chunk {number}:**\n{answer}")
+        if self.mode == "drop":
+            sections.pop()
+        return "Here are the triplets.\n" + "\n".join(sections)
+
+
+def test_batch_chunks():
+    """Consecutive chunks are grouped up to the token and chunk limits"""
+    print("Testing chunk batching...")
+    chunks = [("a", "one two three"), ("b", "four five six"), ("c", "seven eight nine"),
+              ("d", " ".join(["word"] * 10)), ("e", "last")]
+    batches = [[key for key, _ in batch]
+               for batch in batch_chunks(chunks, max_tokens=8, max_chunks=2, tokenizer=str.split)]
+    assert batches == [["a", "b"], ["c"], ["d"], ["e"]], batches
+    print("✓ Batches respect the token budget and size, long chunks go alone")
+
+
+def test_parse():
+    """Answers are attributed to chunks by their chunk lines, or rejected"""
+    print("\nTesting batch answer parsing...")
+    answer = "<preamble>\n**Chunk 1:**\n(Hana, runs on, Linux)\nChunk 3: (Esxi, hosts, Hana)\n"
+    assert parse_batch_response(answer, 3) == [[("Hana", "Runs on", "Linux")], None,
+                                               [("Esxi", "Hosts", "Hana")]]
+    for bad in ("(Hana, runs on, Linux)", "Chunk 1:\nChunk 1:", "Chunk 4:\n(a, b, c)",
+                "(Hana, is, first)\nChunk 1:\n"):
+        try:
+            parse_batch_response(bad, 3)
+        except MalformedBatch:
+            continue
+        raise AssertionError(f"accepted {bad!r}")
+    print("✓ Missing chunks left out, repeated, unknown or unlabelled answers rejected")
+
+
+def build(pages, llm, tmp, name, **kwargs):
+    store = FakeGraphStore()
+    stats = build_knowledge_graph(make_docs(pages), store, llm, os.path.join(tmp, name), "test",
+                                  concurrency=2, **kwargs)
+    return store, stats
+
+
+def test_batched_ingestion():
+    """Batches build the same graph with fewer calls, and fall back to one call per chunk"""
+    print("\nTesting batched extraction during ingestion...")
+    pages = [(f"{i}.pdf", f"Page {i} covers Hana{i} sizing.") for i in range(12)]
+    with tempfile.TemporaryDirectory() as tmp:
+        single, _ = build(pages, FakeLLM(), tmp, "single.json")
+        llm = FakeBatchLLM()
+        store, stats = build(pages, llm, tmp, "batched.json",
+                             extract_batch_tokens=1000, extract_batch_size=4)
+        assert store.triplets == single.triplets, store.triplets ^ single.triplets
+        assert llm.calls == 3 and stats.chunks_added == 12, (llm.calls, stats)
+        print(f"✓ 12 chunks extracted with {llm.calls} prompts")
+
+        # each triplet is still recorded for its own chunk
+        _, stats = build(pages[1:], llm, tmp, "batched.json")
+        assert stats.triplets_deleted == 1, stats   # Hana0; Page is on the other pages too
+        print("✓ Triplets attributed to their chunks")
+
+        for mode, calls in (("drop", 3 + 3), ("garbage", 3 + 12)):
+            llm = FakeBatchLLM(mode)
+            store, _ = build(pages, llm, tmp, f"{mode}.json",
+                             extract_batch_tokens=1000, extract_batch_size=4)
+            assert store.triplets == single.triplets, (mode, store.triplets ^ single.triplets)
+            assert llm.calls == calls, (mode, llm.calls)
+        print("✓ Left out and unusable answers re-extracted chunk by chunk")
+
+
+if __name__ == "__main__":
+    print("=== Batched Extraction Test ===")
+    try:
+        test_batch_chunks()
+        test_parse()
+        test_batched_ingestion()
+    except AssertionError as e:
+        print(f"✗ Batched extraction test failed: {e}")
+        sys.exit(1)
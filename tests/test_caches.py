@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test the on-disk model caches offline, with fake models
+"""
+
+import sys
+import tempfile
+sys.path.append('.')
+
+import os
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.prompts.default_prompts import DEFAULT_QUERY_KEYWORD_EXTRACT_TEMPLATE
+from answer_cache import AnswerCache
+from embed_cache import CachedEmbedding, EmbeddingStore
+from llm_cache import CachedLLM, CompletionCache
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embeds text as [len, vowels, words] and counts the texts it was sent"""
+    calls: int = 0
+
+    def _embed(self, text):
+        self.calls += 1
+        return [float(len(text)), float(sum(c in "aeiou" for c in text)), float(len(text.split()))]
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed(text)
+
+
+class CountingLLM:
+    model = "fake"
+    temperature = 0.0
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, prompt, **prompt_args):
+        self.calls += 1
+        return f"KEYWORDS: {prompt_args['question']}"
+
+
+def test_embedding_cache():
+    """Only misses reach the model, vectors survive a restart and the LRU entry is evicted"""
+    print("Testing embedding cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        inner = CountingEmbedding(model_name="fake")
+        cached = CachedEmbedding(inner, EmbeddingStore(tmp, max_entries=3))
+        first = cached.get_text_embedding_batch(["sap hana", "vsphere", "sap hana"])
+        assert inner.calls == 2, inner.calls
+        assert first[0] == first[2] == inner._embed("sap hana")
+        cached.store.close()
+        print("✓ Duplicate texts in a batch embedded once")
+
+        inner = CountingEmbedding(model_name="fake")
+        cached = CachedEmbedding(inner, EmbeddingStore(tmp, max_entries=3))
+        again = cached.get_text_embedding_batch(["sap hana", "vsphere", "numa"])
+        assert inner.calls == 1 and again[:2] == first[:2], inner.calls
+        print("✓ Cached vectors reloaded from disk, only the miss was embedded")
+
+        cached.get_query_embedding("sap hana")  # queries are keyed apart from texts
+        assert inner.calls == 2 and len(cached.store) == 3
+        cached.get_text_embedding("sap hana")  # evicted by the query
+        cached.get_text_embedding("vsphere")  # evicted by "sap hana"
+        assert inner.calls == 4, inner.calls
+        cached.store.close()
+        print("✓ Least recently used vectors evicted at max_entries")
+
+
+def test_completion_cache():
+    """Repeated prompts are answered from disk, different inputs or sampling are not"""
+    print("\nTesting completion cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "completions.sqlite")
+        inner = CountingLLM()
+        llm = CachedLLM(inner, CompletionCache(path))
+        prompt = DEFAULT_QUERY_KEYWORD_EXTRACT_TEMPLATE
+        answer = llm.predict(prompt, max_keywords=5, question="What is SAP HANA?")
+        assert llm.predict(prompt, max_keywords=5, question="What is SAP HANA?") == answer
+        llm.predict(prompt, max_keywords=3, question="What is SAP HANA?")
+        assert inner.calls == 2 and llm.cache.stats()["hits"] == 1, llm.cache.stats()
+        llm.cache.close()
+        print("✓ Repeated prompt served from cache")
+
+        inner = CountingLLM()
+        llm = CachedLLM(inner, CompletionCache(path))
+        assert llm.predict(prompt, max_keywords=5, question="What is SAP HANA?") == answer
+        assert inner.calls == 0
+        inner.temperature = 0.7
+        llm.predict(prompt, max_keywords=5, question="What is SAP HANA?")
+        assert inner.calls == 1
+        llm.cache.close()
+        print("✓ Answers persist across restarts and are keyed by sampling params")
+
+
+def test_answer_cache():
+    """Near-duplicate questions reuse an answer until the graph version changes"""
+    print("\nTesting answer cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "answers.sqlite")
+        embed = CountingEmbedding(model_name="fake")
+        cache = AnswerCache(path, embed, graph_version="v1", threshold=0.999)
+        assert cache.get("What is SAP HANA?") is None
+        cache.put("What is SAP HANA?", "An in-memory database.")
+        assert cache.get("what is SAP HANA?") == "An in-memory database."
+        assert cache.get("Which hypervisors does SAP certify for production use?") is None
+        cache.close()
+        print("✓ Similar question answered from cache, different one missed")
+
+        cache = AnswerCache(path, embed, graph_version="v1", threshold=0.999)
+        assert cache.get("What is SAP HANA?") == "An in-memory database."
+        cache.set_graph_version("v2")
+        assert cache.get("What is SAP HANA?") is None and len(cache) == 0
+        cache.close()
+        cache = AnswerCache(path, embed, graph_version="v1", threshold=0.999)
+        assert len(cache) == 0
+        cache.close()
+        print("✓ Answers persist across restarts and are dropped when the graph changes")
+
+
+if __name__ == "__main__":
+    print("=== Model Cache Test ===")
+    try:
+        test_embedding_cache()
+        test_completion_cache()
+        test_answer_cache()
+    except AssertionError as e:
+        print(f"✗ Model cache test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test entity canonicalization offline: normalization, aliases, embedding merges and the registry
+"""
+
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+import numpy as np
+from llama_index.core import Document
+from canonical import Canonicalizer, entity_key, relation_key
+from ingest import build_knowledge_graph
+from tests.test_ingest import FakeGraphStore
+
+
+class FakeEmbedding:
+    """Names sharing a word get similar vectors"""
+
+    def get_text_embedding_batch(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.zeros(32)
+            for word in text.lower().split():
+                vector[sum(map(ord, word)) % 32] += 1.0
+            vectors.append(vector)
+        return vectors
+
+
+class ListLLM:
+    """Answers the triplet prompt with the triplets listed for each chunk's text"""
+
+    def __init__(self, triplets):
+        self.triplets = triplets
+
+    def predict(self, prompt, text, **kwargs):
+        return "\n".join(f"({s}, {r}, {o})" for s, r, o in self.triplets[text.split("\n")[-1]])
+
+
+def test_keys():
+    """Spellings that differ in case, punctuation, articles or plurals share a key"""
+    print("Testing normalization...")
+    assert entity_key("The SAP  HANA Systems") == entity_key("sap hana system") == "sap hana system"
+    assert entity_key("NUMA nodes") == entity_key("NUMA node")
+    assert entity_key("processes") == entity_key("process")
+    assert entity_key("Linux") == "linux" and entity_key("vSphere") == "vsphere"
+    assert relation_key("Is part of") == relation_key("part of") == "part of"
+    print("✓ Case, articles, plurals and auxiliaries normalized")
+
+
+def test_canonicalize():
+    """Triplets are mapped onto the first spelling seen, and deduplicated"""
+    print("\nTesting canonicalization...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "entities.json")
+        canonicalizer = Canonicalizer(path, "test")
+        triplets = canonicalizer.canonicalize([
+            ("SAP HANA", "runs on", "vSphere"),
+            ("sap hana", "Runs on", "VSphere"),
+            ("The SAP HANA", "is certified for", "V Sphere"),
+            ("HANA", "runs on", "hana"),
+        ])
+        # the last one is a self-loop once both names are canonical
+        assert triplets == [("SAP HANA", "runs on", "vSphere"),
+                            ("SAP HANA", "certified for", "vSphere")], triplets
+        print(f"✓ {canonicalizer.stats}")
+
+        # hand-written aliases are kept, and the mapping survives a restart
+        canonicalizer.save()
+        with open(path) as f:
+            data = json.load(f)
+        data["aliases"] = {"HANA": "SAP HANA"}
+        with open(path, "w") as f:
+            json.dump(data, f)
+        canonicalizer = Canonicalizer(path, "test")
+        assert canonicalizer.entity("sap hana") == "SAP HANA"
+        assert canonicalizer.entity("hana") == "SAP HANA"
+        assert Canonicalizer(path, "other graph").entity("sap hana") == "sap hana"
+        print("✓ Registry and aliases reloaded, ignored for another graph")
+
+
+def test_stats():
+    """Edges repeated across chunks are counted once per chunk"""
+    print("\nTesting canonicalization stats...")
+    with tempfile.TemporaryDirectory() as tmp:
+        canonicalizer = Canonicalizer(os.path.join(tmp, "entities.json"), "test")
+        canonicalizer.canonicalize([
+            ("SAP HANA", "runs on", "vSphere"),
+            ("sap hana", "Runs on", "VSphere"),
+            ("Linux", "hosts", "SAP HANA"),
+        ])
+        canonicalizer.canonicalize([
+            ("SAP HANA", "runs on", "vSphere"),
+            ("NUMA", "is part of", "Linux"),
+        ])
+        stats = canonicalizer.stats
+        assert stats.edge_mentions == {("SAP HANA", "runs on", "vSphere"): 2,
+                                       ("Linux", "hosts", "SAP HANA"): 1,
+                                       ("NUMA", "part of", "Linux"): 1}, stats.edge_mentions
+        assert len(stats.triplets) == 4 and stats.reduction == 0.25, stats
+        assert str(stats) == ("6 entity names -> 4 entities, 4 distinct triplets -> 3 edges "
+                              "(25% fewer, 1 extracted more than once)"), str(stats)
+    print(f"✓ {stats}")
+
+
+def test_embedding_merge():
+    """A new name close to a known entity by embedding is merged into it"""
+    print("\nTesting embedding merges...")
+    with tempfile.TemporaryDirectory() as tmp:
+        canonicalizer = Canonicalizer(os.path.join(tmp, "entities.json"), "test",
+                                      embed_model=FakeEmbedding(), embed_threshold=0.8)
+        assert canonicalizer.entity("HANA database") == "HANA database"
+        assert canonicalizer.entity("database HANA") == "HANA database"
+        assert canonicalizer.entity("Kubernetes") == "Kubernetes"
+        assert canonicalizer.stats.embedding_merges == 1
+    print("✓ Reordered name merged by embedding, unrelated name kept")
+
+
+def test_ingestion():
+    """Canonical triplets reach the graph, and are deleted by their canonical names
+
+    The stock triplet parser capitalizes names ("SAP HANA" -> "Sap hana").
+    """
+    print("\nTesting canonicalization during ingestion...")
+    llm = ListLLM({
+        "SAP HANA on vSphere.": [("SAP HANA", "runs on", "vSphere"),
+                                 ("SAP HANA systems", "run on", "VMware vSphere")],
+        "The sap hana system.": [("sap hana", "runs on", "vsphere")],
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = os.path.join(tmp, "manifest.json")
+        store = FakeGraphStore()
+
+        def build(pages):
+            docs = [Document(text=text, metadata={"file_path": path}) for path, text in pages]
+            canonicalizer = Canonicalizer(os.path.join(tmp, "entities.json"), "test")
+            return build_knowledge_graph(docs, store, llm, manifest, "test",
+                                         canonicalizer=canonicalizer)
+
+        stats = build([("a.pdf", "SAP HANA on vSphere."), ("b.pdf", "The sap hana system.")])
+        assert store.triplets == {("Sap hana", "runs on", "Vsphere"),
+                                  ("Sap hana systems", "run on", "Vmware vsphere")}, store.triplets
+        print(f"✓ {stats}")
+
+        build([("b.pdf", "The sap hana system.")])
+        assert store.triplets == {("Sap hana", "runs on", "Vsphere")}, store.triplets
+        build([])
+        assert not store.triplets, store.triplets
+        print("✓ Edges shared by two chunks stay until both are gone")
+
+
+if __name__ == "__main__":
+    print("=== Entity Canonicalization Test ===")
+    try:
+        test_keys()
+        test_canonicalize()
+        test_stats()
+        test_embedding_merge()
+        test_ingestion()
+    except AssertionError as e:
+        print(f"✗ Canonicalization test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test the command line entry point and the HTTP service offline
+"""
+
+import asyncio
+import json
+import subprocess
+import sys
+import time
+sys.path.append('.')
+
+from service import QueryService
+
+
+def test_lazy_imports():
+    """Importing main loads no backend, so each command only pays for its own"""
+    print("Testing lazy imports...")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, main; "
+         "print(sorted(m for m in ('llama_index.core', 'redis', 'qdrant_client', 'pypdf', "
+         "'neo4j') if m in sys.modules))"],
+        capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    assert result.stdout.strip() == "[]", result.stdout
+    print(f"✓ main imported without backends in {elapsed:.2f}s")
+
+    result = subprocess.run([sys.executable, "main.py", "--help"], capture_output=True,
+                            text=True, check=True)
+    for command in ("ingest", "query", "serve"):
+        assert command in result.stdout, result.stdout
+    print("✓ ingest, query and serve commands listed")
+
+
+class FakeQueryEngine:
+    """Answers after delay seconds, counting the answers generated"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.queries = []
+
+    async def aquery(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(self.delay)
+        return f"<think>hmm</think>Answer to {query}"
+
+
+class FakeAnswerCache:
+    def __init__(self):
+        self.answers = {}
+
+    def get(self, query):
+        return self.answers.get(query)
+
+    def put(self, query, answer):
+        self.answers[query] = answer
+
+
+async def post(port, payload, raw=None):
+    """(status, body) of a POST /query on a fresh connection"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = raw if raw is not None else json.dumps(payload).encode()
+    writer.write(b"POST /query HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                 % len(body) + body)
+    head, _, data = (await reader.read()).partition(b"\r\n\r\n")
+    writer.close()
+    return int(head.split()[1]), json.loads(data)
+
+
+def test_service():
+    """Duplicates are coalesced, generations are capped and overload is turned away"""
+    print("\nTesting HTTP service...")
+    engine = FakeQueryEngine()
+    service = QueryService(engine, FakeAnswerCache(), max_generations=1, max_pending=2)
+
+    async def run():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            start = time.perf_counter()
+            same = [post(port, {"query": "What is HANA?"}) for _ in range(5)]
+            others = [post(port, {"query": q}) for q in ("What is NUMA?", "a", "b")]
+            results = await asyncio.gather(*same, *others)
+            elapsed = time.perf_counter() - start
+            repeat = await post(port, {"query": "What is HANA?"})
+            bad = await post(port, None, raw=b'{"question": "What is HANA?"}')
+        return results, elapsed, repeat, bad
+
+    results, elapsed, repeat, bad = asyncio.run(run())
+    statuses = [status for status, _ in results]
+    assert sorted(statuses) == [200] * 6 + [503] * 2, results
+    assert all(body["answer"] == "Answer to What is HANA?" for _, body in results[:5]), results
+    assert sum(body["coalesced"] for _, body in results[:5]) == 4, results
+    assert len(engine.queries) == 2, engine.queries
+    # one generation at a time: the second question waited for the first
+    assert elapsed >= 2 * engine.delay, elapsed
+    print(f"✓ 5 identical questions answered by one generation, 2 turned away, {elapsed:.2f}s")
+
+    assert repeat[0] == 200 and repeat[1]["cached"] and len(engine.queries) == 2, repeat
+    assert bad[0] == 400, bad
+    print("✓ Repeated question served from the answer cache")
+
+
+if __name__ == "__main__":
+    print("=== CLI and Service Test ===")
+    try:
+        test_lazy_imports()
+        test_service()
+    except AssertionError as e:
+        print(f"✗ CLI test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test packing retrieved context into a token budget offline, with a word tokenizer
+"""
+
+import sys
+sys.path.append('.')
+
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+from context_packing import ContextPacker
+from telemetry import telemetry
+
+HEADER = ("The following are knowledge sequence in max depth 2 in the form of directed graph "
+          "like:\n`subject -[predicate]->, object, <-[predicate_next_hop]-, object_next_hop ...`"
+          " extracted based on key entities as subject:\n")
+
+
+def kg_node(triplets):
+    """A node as KnowledgeGraphRAGRetriever builds it"""
+    rel_texts = [str(list(triplet)) for triplet in triplets]
+    keys = ["kg_rel_map", "kg_rel_text"]
+    return NodeWithScore(node=TextNode(
+        text=HEADER + "\n".join(rel_texts),
+        metadata={"kg_rel_map": {}, "kg_rel_text": rel_texts},
+        excluded_embed_metadata_keys=keys, excluded_llm_metadata_keys=keys,
+    ), score=None)
+
+
+def snippet(text, **metadata):
+    return NodeWithScore(node=TextNode(text=text, metadata=metadata), score=0.5)
+
+
+def tokens(nodes):
+    return sum(len(node.node.get_content(metadata_mode=MetadataMode.LLM).split()) for node in nodes)
+
+
+def test_facts():
+    """Triplets are deduplicated by canonical names and grouped by subject"""
+    print("Testing fact packing...")
+    packer = ContextPacker(token_budget=1000, tokenizer=str.split)
+    nodes = [kg_node([
+        ("SAP HANA", "runs on", "vSphere"),
+        ("SAP HANA", "requires", "memory"),
+        ("SAP HANA", "runs on", "vSphere"),      # reached from a second query entity
+        ("sap hana", "Runs on", "VSphere"),      # another spelling of the same fact
+        ("SAP HANA", "runs on", "KVM"),
+        ("vSphere", "supports", "NUMA"),
+    ])]
+    packed = packer.postprocess_nodes(nodes)
+    assert len(packed) == 1
+    text = packed[0].node.get_content(metadata_mode=MetadataMode.LLM)
+    assert "SAP HANA: runs on vSphere, KVM; requires memory\nvSphere: supports NUMA" in text, text
+    assert packed[0].node.metadata["kg_rel_text"] == [
+        "['SAP HANA', 'runs on', 'vSphere']", "['SAP HANA', 'requires', 'memory']",
+        "['SAP HANA', 'runs on', 'KVM']", "['vSphere', 'supports', 'NUMA']"]
+    assert tokens(packed) < tokens(nodes) / 2, (tokens(packed), tokens(nodes))
+    print(f"✓ {tokens(nodes)} tokens packed into {tokens(packed)}")
+
+
+def test_budget():
+    """Facts and snippets are kept in order while they fit, the last snippet is cut"""
+    print("\nTesting the token budget...")
+    telemetry.reset()
+    packer = ContextPacker(token_budget=120, tokenizer=str.split, min_snippet_tokens=10)
+    facts = kg_node([(f"Entity {i}", "relates to", f"Entity {i + 1}") for i in range(10)])
+    long_text = " ".join(f"word{i}" for i in range(100))
+    nodes = [
+        facts,
+        snippet("SAP HANA needs a lot of memory."),
+        snippet("SAP HANA needs a lot of memory."),          # returned twice
+        snippet("needs a lot of memory"),                     # contained in the first
+        snippet(long_text, file_name="manual.pdf"),           # only partly fits
+        snippet("Too late for the budget, nothing is left."),
+    ]
+    packed = packer.postprocess_nodes(nodes)
+    assert len(packed) == 3, [node.node.text for node in packed]
+    assert tokens(packed) <= 120, tokens(packed)
+    cut = packed[2].node
+    assert cut.text.endswith(" ...") and cut.text.startswith("word0 word1"), cut.text
+    assert cut.metadata == {"file_name": "manual.pdf"}
+    assert nodes[4].node.text == long_text, "the retrieved node was changed"
+    saved = telemetry.counter("context_tokens_saved_total")
+    assert saved == tokens(nodes) - tokens(packed), saved
+    print(f"✓ {tokens(nodes)} tokens packed into {tokens(packed)} of 120, {saved} saved")
+
+
+def test_other_paths():
+    """Knowledge sequences that are not triplets are kept as they are, once"""
+    print("\nTesting other knowledge sequences...")
+    packer = ContextPacker(token_budget=100, tokenizer=str.split)
+    node = kg_node([])
+    paths = ["['RUNS_ON', 'vSphere', 'SUPPORTS', 'NUMA']"] * 2
+    node.node.metadata["kg_rel_text"] = paths
+    packed = packer.postprocess_nodes([node])
+    assert packed[0].node.metadata["kg_rel_text"] == paths[:1]
+    assert packed[0].node.text.endswith(paths[0]), packed[0].node.text
+    print("✓ Paths deduplicated and kept verbatim")
+
+
+if __name__ == "__main__":
+    print("=== Context Packing Test ===")
+    try:
+        test_facts()
+        test_budget()
+        test_other_paths()
+    except AssertionError as e:
+        print(f"✗ Context packing test failed: {e}")
+        sys.exit(1)
@@ -9,6 +9,7 @@ sys.path.append('.')
 from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
 from llama_index.llms.ollama import Ollama
 from llama_index.embeddings.ollama import OllamaEmbedding
+from embed_cache import cached_embed_model
 from llama_index.core import Settings
 from config import config
 
@@ -58,7 +59,9 @@ def test_embedding_model():
         # Test embedding
         embedding = embed_model.get_text_embedding("SAP HANA database")
         print(f"✓ Embedding model working, vector dimension: {len(embedding)}")
-        return embed_model
+        # the RAG test re-embeds the same chunks on every run
+        return cached_embed_model(embed_model, config.state_path("embeddings"),
+                                  config.EMBED_CACHE_MAX_ENTRIES)
     except Exception as e:
         print(f"✗ Embedding model failed: {e}")
         return None
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test resolving query entities from the entity index offline, without an LLM
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+from llama_index.core import StorageContext
+from llama_index.core.schema import QueryBundle
+from entity_index import EntityIndex, update_entity_index
+from local_graph_store import CSRGraphStore
+from retrieval import GraphRAGRetriever
+
+NAMES = ["SAP HANA", "Hana", "SUSE Linux Enterprise Server", "vSphere", "VMware", "Manual"]
+
+
+class NoLLM:
+    """Fails the test if the retriever asks the LLM anything"""
+
+    def __init__(self, answer=None):
+        self.calls = 0
+        self.answer = answer
+
+    def predict(self, prompt, **prompt_args):
+        self.calls += 1
+        if self.answer is None:
+            raise AssertionError("LLM called for entity extraction")
+        return self.answer
+
+
+def test_resolve():
+    """Phrases, compact spellings, typos and aliases resolve to graph entity names"""
+    print("Testing entity resolution...")
+    index = EntityIndex(NAMES, extra_aliases={"SLES": "SUSE Linux Enterprise Server"})
+    assert index.resolve("Is SAP HANA certified on vsphere?") == ["SAP HANA", "vSphere"]
+    assert index.resolve("what about saphana") == ["SAP HANA"]
+    assert index.resolve("Does hana run on SLES?") == ["Hana", "SUSE Linux Enterprise Server"]
+    assert index.resolve("Is VMwar supported?") == ["VMware"], index.resolve("Is VMwar supported?")
+    assert index.resolve("What is the weather like?") == []
+    print("✓ Query entities resolved without the LLM")
+
+    names = [f"Component {i}" for i in range(50_000)] + NAMES
+    index = EntityIndex(names)
+    start = time.perf_counter()
+    for _ in range(100):
+        assert index.resolve("Which Component 4711 runs on vSphere?") == ["Component 4711", "vSphere"]
+    elapsed = (time.perf_counter() - start) / 100
+    print(f"✓ {elapsed * 1000:.2f} ms per query against {len(index)} entities")
+
+
+def test_rebuild():
+    """The saved index is only rebuilt when the graph version changes"""
+    print("\nTesting entity index rebuild...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "entity_index.json")
+        update_entity_index(path, NAMES, "v1")
+        assert update_entity_index(path, [], "v1").names == sorted(NAMES)
+        assert update_entity_index(path, ["Oracle"], "v2").names == ["Oracle"]
+        assert EntityIndex.load(path).graph_version == "v2"
+        print("✓ Index kept for the same graph, rebuilt for a new one")
+
+
+def test_retriever():
+    """GraphRAGRetriever reads the graph without LLM calls, and falls back only if asked"""
+    print("\nTesting retrieval with the entity index...")
+    store = CSRGraphStore()
+    store.upsert_triplet("SAP HANA", "is certified on", "vSphere")
+    storage_context = StorageContext.from_defaults(graph_store=store)
+    index = EntityIndex(store.entities())
+
+    retriever = GraphRAGRetriever(storage_context=storage_context, llm=NoLLM(), entity_index=index)
+    nodes = retriever.retrieve(QueryBundle("Where does SAP HANA run?"))
+    assert "['SAP HANA', 'is certified on', 'vSphere']" in nodes[0].node.text
+    assert retriever.retrieve(QueryBundle("Hello there")) == []
+    print("✓ Graph retrieved without asking the LLM")
+
+    llm = NoLLM(answer="KEYWORDS:")
+    retriever = GraphRAGRetriever(storage_context=storage_context, llm=llm, entity_index=index,
+                                  llm_fallback=True)
+    retriever.retrieve(QueryBundle("Where does SAP HANA run?"))
+    assert llm.calls == 0
+    retriever.retrieve(QueryBundle("Where does the in-memory database run?"))
+    assert llm.calls == 2  # keywords, then synonyms
+    print("✓ LLM only asked when the index finds nothing")
+
+
+if __name__ == "__main__":
+    print("=== Entity Index Test ===")
+    try:
+        test_resolve()
+        test_rebuild()
+        test_retriever()
+    except AssertionError as e:
+        print(f"✗ Entity index test failed: {e}")
+        sys.exit(1)
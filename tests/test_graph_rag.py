@@ -5,12 +5,12 @@ sys.path.append('.')
 
 from llama_index.core import SimpleDirectoryReader, Settings
 from llama_index.core import StorageContext, KnowledgeGraphIndex
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
+from neo4j_pool import PooledNeo4jGraphStore
 from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.ollama import OllamaEmbedding
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
 from config import config
+from models import build_embed_model
 
 print("Testing full Graph RAG system...")
 print(f"LLM: {config.OLLAMA_LLM_MODEL}")
@@ -21,8 +21,7 @@ try:
     llm = Ollama(model=config.OLLAMA_LLM_MODEL, 
                  base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}",
                  request_timeout=120.0)
-    embed_model = OllamaEmbedding(model_name=config.OLLAMA_EMBED_MODEL,
-                                  base_url=f"http://{config.OLLAMA_HOST}:{config.OLLAMA_PORT}")
+    embed_model = build_embed_model()
     
     Settings.llm = llm
     Settings.embed_model = embed_model
@@ -37,10 +36,7 @@ try:
     print(f"✓ Testing with {len(test_docs)} chunks for speed (out of {len(docs)} total)")
     
     # Setup Neo4j graph store
-    graph_store = Neo4jGraphStore(
-        username=config.NEO4J_USERNAME,
-        password=config.NEO4J_PASSWORD,
-        url=config.NEO4J_URI,
+    graph_store = PooledNeo4jGraphStore(
         database="neo4j",
         timeout=120.0
     )
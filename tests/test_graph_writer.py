@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Quick test of batched triplet writes against Neo4j"""
+import sys
+import time
+sys.path.append('.')
+
+from config import config
+from neo4j_pool import PooledNeo4jGraphStore
+from graph_writer import Neo4jTripletWriter
+
+LABEL = "WriterTest"  # kept apart from the Entity nodes of the real graph
+
+print(f"Testing batched writes to: {config.NEO4J_URI}")
+
+try:
+    graph_store = PooledNeo4jGraphStore(
+        database="neo4j",
+        node_label=LABEL,
+        refresh_schema=False,  # needs APOC
+    )
+    triplets = [(f"Host {i}", "runs on", f"Cluster {i % 50}") for i in range(2000)]
+
+    writer = Neo4jTripletWriter(graph_store, batch_size=500)
+    start = time.perf_counter()
+    for triplet in triplets:
+        writer.upsert(*triplet)
+    writer.flush()
+    elapsed = time.perf_counter() - start
+
+    count = graph_store.query(f"MATCH (:{LABEL})-[r:RUNS_ON]->(:{LABEL}) RETURN count(r) AS n")[0]["n"]
+    assert count == len(triplets), f"expected {len(triplets)} relationships, found {count}"
+    print(f"✓ Wrote {count} triplets in {writer.round_trips} round trips "
+          f"({count / elapsed:.0f} triplets/sec)")
+
+    for triplet in triplets:
+        writer.delete(*triplet)
+    writer.flush()
+    left = graph_store.query(f"MATCH (n:{LABEL}) RETURN count(n) AS n")[0]["n"]
+    assert left == 0, f"{left} orphaned entities left after delete"
+    print("✓ Deleted all triplets and their orphaned entities")
+
+except Exception as e:
+    print(f"✗ FAILED: {e}")
+    sys.exit(1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test hybrid retrieval offline: rank fusion, deduplication and the latency budget
+"""
+
+import asyncio
+import sys
+import time
+sys.path.append('.')
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from retrieval import HybridRetriever
+
+
+class FixedRetriever(BaseRetriever):
+    """Returns the given texts as nodes, after delay seconds"""
+
+    def __init__(self, texts, delay=0.0):
+        super().__init__()
+        self.texts = texts
+        self.delay = delay
+
+    def _retrieve(self, query_bundle):
+        time.sleep(self.delay)
+        return [NodeWithScore(node=TextNode(text=text), score=1.0) for text in self.texts]
+
+    async def _aretrieve(self, query_bundle):
+        await asyncio.sleep(self.delay)
+        return [NodeWithScore(node=TextNode(text=text), score=1.0) for text in self.texts]
+
+
+def texts(nodes):
+    return [node.node.get_content() for node in nodes]
+
+
+def test_fusion():
+    """Nodes found by both retrievers are merged and ranked first"""
+    print("Testing reciprocal rank fusion...")
+    retriever = HybridRetriever({
+        "vector": FixedRetriever(["hana sizing", "hana on vsphere", "numa"]),
+        "graph": FixedRetriever(["hana on vsphere", "vmware"]),
+    })
+    nodes = retriever.retrieve(QueryBundle("hana on vsphere"))
+    assert texts(nodes)[0] == "hana on vsphere", texts(nodes)
+    assert sorted(texts(nodes)) == ["hana on vsphere", "hana sizing", "numa", "vmware"]
+    print("✓ Overlapping node ranked first and deduplicated")
+
+
+def test_budget():
+    """A retriever slower than the budget is dropped instead of waited for"""
+    print("\nTesting latency budget...")
+    retriever = HybridRetriever({
+        "vector": FixedRetriever(["hana sizing"], delay=0.05),
+        "graph": FixedRetriever(["vmware"], delay=2.0),
+    }, budget=0.3)
+    for retrieve in (retriever.retrieve, lambda q: asyncio.run(retriever.aretrieve(q))):
+        start = time.perf_counter()
+        nodes = retrieve(QueryBundle("hana"))
+        elapsed = time.perf_counter() - start
+        assert texts(nodes) == ["hana sizing"] and elapsed < 1.0, (texts(nodes), elapsed)
+    print(f"✓ Slow graph retrieval skipped, answered in {elapsed:.2f}s")
+
+    retriever = HybridRetriever({
+        "vector": FixedRetriever(["hana sizing"], delay=0.6),
+        "graph": FixedRetriever(["vmware"], delay=2.0),
+    }, budget=0.3)
+    assert texts(retriever.retrieve(QueryBundle("hana"))) == ["hana sizing"]
+    print("✓ First result used when every retriever is over budget")
+
+    retriever = HybridRetriever({
+        "vector": FixedRetriever(["hana sizing"], delay=2.0),
+        "graph": FixedRetriever(["vmware"], delay=2.0),
+    }, budget=0.2, grace=0.2)
+    for retrieve in (retriever.retrieve, lambda q: asyncio.run(retriever.aretrieve(q))):
+        start = time.perf_counter()
+        nodes = retrieve(QueryBundle("hana"))
+        elapsed = time.perf_counter() - start
+        assert nodes == [] and elapsed < 1.0, (texts(nodes), elapsed)
+    print(f"✓ Nothing retrieved when every retriever is past the grace period ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    print("=== Hybrid Retrieval Test ===")
+    try:
+        test_fusion()
+        test_budget()
+    except AssertionError as e:
+        print(f"✗ Hybrid retrieval test failed: {e}")
+        sys.exit(1)
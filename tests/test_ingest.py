@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test incremental knowledge graph ingestion offline, with a fake LLM and graph store
+"""
+
+import os
+import sys
+import tempfile
+import threading
+sys.path.append('.')
+
+from llama_index.core import Document
+from ingest import build_knowledge_graph, prefetch, stream_documents
+
+
+class FakeLLM:
+    """Answers the triplet prompt with one triplet per capitalised word"""
+
+    def __init__(self, failures=0):
+        self.calls = 0
+        self.failures = failures
+        self._lock = threading.Lock()
+
+    def predict(self, prompt, text, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if self.failures:
+                self.failures -= 1
+                raise TimeoutError("simulated Ollama timeout")
+        words = [w.strip(".,") for w in text.split("\n")[-1].split() if w[0].isupper()]
+        return "\n".join(f"({w}, mentioned in, manual)" for w in words)
+
+
+class FakeGraphStore:
+    def __init__(self):
+        self.triplets = set()
+
+    def upsert_triplet(self, subj, rel, obj):
+        self.triplets.add((subj, rel, obj))
+
+    def delete(self, subj, rel, obj):
+        self.triplets.discard((subj, rel, obj))
+
+
+def make_docs(pages):
+    return [Document(text=text, metadata={"file_path": path}) for path, text in pages]
+
+
+def test_incremental_ingestion():
+    """Only new chunks reach the LLM and removed chunks leave the graph"""
+    print("Testing incremental ingestion...")
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = os.path.join(tmp, "manifest.json")
+        store, llm = FakeGraphStore(), FakeLLM()
+        pages = [("a.pdf", "Hana runs on Linux."), ("b.pdf", "Vsphere hosts Hana.")]
+
+        def build(pages):
+            return build_knowledge_graph(make_docs(pages), store, llm, manifest, "test")
+
+        stats = build(pages)
+        assert stats.chunks_added == 2 and llm.calls == 2, stats
+        assert ("Linux", "Mentioned in", "Manual") in store.triplets
+        version = stats.graph_version
+
+        stats = build(pages)
+        assert stats.chunks_added == 0 and llm.calls == 2, stats
+        assert stats.graph_version == version
+        print("✓ Unchanged corpus made no LLM calls")
+
+        stats = build([("a.pdf", "Hana runs on Suse."), pages[1]])
+        assert stats.chunks_added == 1 and stats.chunks_removed == 1, stats
+        assert stats.graph_version != version
+        assert ("Linux", "Mentioned in", "Manual") not in store.triplets
+        assert ("Hana", "Mentioned in", "Manual") in store.triplets  # still in b.pdf
+        print("✓ Changed file re-extracted, stale triplets removed")
+
+        build([pages[1]])
+        assert store.triplets == {("Vsphere", "Mentioned in", "Manual"),
+                                  ("Hana", "Mentioned in", "Manual")}, store.triplets
+        print("✓ Deleted file removed from graph")
+
+
+def test_concurrent_extraction():
+    """Concurrent extraction retries failures and builds the same graph"""
+    print("\nTesting concurrent extraction...")
+    pages = [(f"{i}.pdf", f"Page {i} covers Hana{i} sizing.") for i in range(12)]
+    with tempfile.TemporaryDirectory() as tmp:
+        sequential = FakeGraphStore()
+        build_knowledge_graph(make_docs(pages), sequential, FakeLLM(),
+                              os.path.join(tmp, "seq.json"), "test")
+        concurrent, llm = FakeGraphStore(), FakeLLM(failures=2)
+        stats = build_knowledge_graph(make_docs(pages), concurrent, llm,
+                                      os.path.join(tmp, "conc.json"), "test",
+                                      concurrency=4, retries=2)
+    assert concurrent.triplets == sequential.triplets
+    assert stats.chunks_added == 12 and llm.calls == 14, (stats, llm.calls)
+    print(f"✓ {stats.chunks_added} chunks extracted with 4 workers, 2 retried")
+
+
+class FakeReader:
+    """Stands in for SimpleDirectoryReader, counting the files parsed so far"""
+
+    def __init__(self, files):
+        self.files = files
+        self.parsed = 0
+
+    def iter_data(self):
+        for i in range(self.files):
+            self.parsed += 1
+            yield make_docs([(f"{i}.pdf", f"Manual{i} covers Numa{i}.")])
+
+
+def test_streaming_ingestion():
+    """Triplets are written while later files are still unparsed"""
+    print("\nTesting streaming ingestion...")
+    reader = FakeReader(files=50)
+    parsed_at_first_write = []
+
+    class RecordingStore(FakeGraphStore):
+        def upsert_triplet(self, subj, rel, obj):
+            parsed_at_first_write.append(reader.parsed)
+            super().upsert_triplet(subj, rel, obj)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RecordingStore()
+        stats = build_knowledge_graph(stream_documents(reader, files_ahead=2), store, FakeLLM(),
+                                      os.path.join(tmp, "manifest.json"), "test",
+                                      write_max_delay=0)
+    assert stats.documents == 50 and len(store.triplets) == 100, stats
+    assert parsed_at_first_write[0] <= 5, parsed_at_first_write[0]
+    print(f"✓ First triplets written after parsing {parsed_at_first_write[0]} of 50 files")
+
+    def failing():
+        yield 1
+        raise OSError("unreadable PDF")
+    try:
+        list(prefetch(failing(), 2))
+        assert False, "reader error was swallowed"
+    except OSError:
+        print("✓ Reader errors reach the consumer")
+
+
+if __name__ == "__main__":
+    print("=== Incremental Ingestion Test ===")
+    try:
+        test_incremental_ingestion()
+        test_concurrent_extraction()
+        test_streaming_ingestion()
+    except AssertionError as e:
+        print(f"✗ Ingestion test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test the embedded CSR graph store offline: traversal, persistence and retrieval
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+import numpy as np
+from llama_index.core import StorageContext
+from llama_index.core.indices.knowledge_graph.retrievers import KnowledgeGraphRAGRetriever
+from local_graph_store import CSRGraphStore
+from ingest import build_knowledge_graph
+from tests.test_ingest import FakeLLM, make_docs
+
+
+TRIPLETS = [
+    ("SAP HANA", "runs on", "SUSE Linux"),
+    ("SAP HANA", "is certified on", "vSphere"),
+    ("vSphere", "is made by", "VMware"),
+    ("VMware", "is owned by", "Broadcom"),
+]
+
+
+def test_traversal():
+    """get_rel_map follows edges breadth first, case-insensitively, up to depth and limit"""
+    print("Testing CSR traversal...")
+    store = CSRGraphStore()
+    for triplet in TRIPLETS:
+        store.upsert_triplet(*triplet)
+    store.upsert_triplet(*TRIPLETS[0])  # duplicate edges are merged
+
+    assert store.get("sap hana") == [["runs on", "SUSE Linux"], ["is certified on", "vSphere"]]
+    rel_map = store.get_rel_map(["SAP HANA"], depth=2)
+    assert rel_map["SAP HANA"] == [list(TRIPLETS[0]), list(TRIPLETS[1]), list(TRIPLETS[2])], rel_map
+    assert len(store.get_rel_map(["SAP HANA"], depth=3)["SAP HANA"]) == 4
+    assert len(store.get_rel_map(["SAP HANA"], depth=3, limit=2)["SAP HANA"]) == 2
+    assert store.get_rel_map(["Oracle"]) == {}
+    assert store.query("MATCH (n) RETURN n") == []  # Cypher degrades to no rows
+    print("✓ Subgraph lookups match the inserted triplets")
+
+    store.compact()
+    store.delete(*TRIPLETS[2])
+    assert store.get("vSphere") == []
+    store.compact()
+    assert "vSphere" in store.entities() and len(store.entities()) == 5
+    store.delete(*TRIPLETS[1])
+    store.compact()
+    assert "vSphere" not in store.entities()
+    print("✓ Deletes survive compaction and drop unconnected entities")
+
+
+def test_persistence():
+    """A persisted graph is memory-mapped on load and keeps accepting writes"""
+    print("\nTesting CSR persistence...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph")
+        store = CSRGraphStore(path)
+        for triplet in TRIPLETS:
+            store.upsert_triplet(*triplet)
+        store.persist()
+
+        store = CSRGraphStore(path)
+        assert isinstance(store._dst, np.memmap)
+        assert store.get_rel_map(["SAP HANA"], depth=3)["SAP HANA"][-1] == list(TRIPLETS[3])
+        store.upsert_triplet("Broadcom", "is based in", "Palo Alto")
+        store.delete(*TRIPLETS[0])
+        store.persist()
+        assert sorted(os.listdir(path)) == ["CURRENT", "gen-2"]
+
+        store = CSRGraphStore(path)
+        assert store.get("Broadcom") == [["is based in", "Palo Alto"]]
+        assert store.get("SAP HANA") == [["is certified on", "vSphere"]]
+        print("✓ Graph reloaded from memory-mapped arrays after each persist")
+
+
+def test_retrieval():
+    """KnowledgeGraphRAGRetriever reads a graph built by build_knowledge_graph"""
+    print("\nTesting retrieval from the CSR store...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CSRGraphStore(os.path.join(tmp, "graph"))
+        pages = [(f"{i}.pdf", f"Hana{i} runs on Linux{i}.") for i in range(2000)]
+        build_knowledge_graph(make_docs(pages), store, FakeLLM(),
+                              os.path.join(tmp, "manifest.json"), "test")
+        assert os.path.exists(os.path.join(tmp, "graph", "CURRENT"))
+
+        storage_context = StorageContext.from_defaults(graph_store=store)
+        retriever = KnowledgeGraphRAGRetriever(storage_context=storage_context, llm=FakeLLM())
+        sequence, _ = retriever._get_knowledge_sequence(["Hana7", "Linux7"])
+        assert sequence == ["['Hana7', 'Mentioned in', 'Manual']",
+                            "['Linux7', 'Mentioned in', 'Manual']"], sequence
+
+        start = time.perf_counter()
+        for i in range(1000):
+            store.get_rel_map([f"Hana{i}"], depth=2)
+        elapsed = (time.perf_counter() - start) / 1000
+        print(f"✓ Retriever reads the graph, {elapsed * 1e6:.0f} µs per 2-hop lookup")
+
+
+if __name__ == "__main__":
+    print("=== Embedded Graph Store Test ===")
+    try:
+        test_traversal()
+        test_persistence()
+        test_retrieval()
+    except AssertionError as e:
+        print(f"✗ Embedded graph store test failed: {e}")
+        sys.exit(1)
@@ -1,23 +1,24 @@
 #!/usr/bin/env python3
-"""Quick test of local Neo4j connection"""
+"""Quick test of local Neo4j connection, through the shared driver"""
 import sys
 sys.path.append('.')
 
 from config import config
-from neo4j import GraphDatabase
+from neo4j_pool import get_driver, probe
 
 print(f"Testing Neo4j connection to: {config.NEO4J_URI}")
 print(f"Username: {config.NEO4J_USERNAME}")
 
 try:
-    with GraphDatabase.driver(config.NEO4J_URI, auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD)) as driver:
-        driver.verify_connectivity()
-        
-        with driver.session() as session:
-            result = session.run("RETURN 'Neo4j is working!' as message")
-            message = result.single()["message"]
-            print(f"✓ SUCCESS: {message}")
-            
+    driver = get_driver()
+    with driver.session() as session:
+        result = session.run("RETURN 'Neo4j is working!' as message")
+        message = result.single()["message"]
+        print(f"✓ SUCCESS: {message}")
+
+    first, again = probe(), probe()
+    print(f"✓ Round trip {first * 1000:.1f} ms, {again * 1000:.1f} ms on a pooled connection")
+
 except Exception as e:
     print(f"✗ FAILED: {e}")
-    sys.exit(1)
\ No newline at end of file
+    sys.exit(1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test parallel PDF loading offline against SimpleDirectoryReader
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from llama_index.core import SimpleDirectoryReader
+import pdf_loader
+from pdf_loader import ParallelPDFLoader
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one line of Helvetica text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def summary(docs):
+    return [(d.text, d.metadata, d.excluded_llm_metadata_keys) for d in docs]
+
+
+def test_parallel_loading():
+    """Same documents as SimpleDirectoryReader, in order, and cached between runs"""
+    print("Testing parallel PDF loading...")
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_dir, cache_dir = os.path.join(tmp, "docs"), os.path.join(tmp, "cache")
+        os.makedirs(os.path.join(docs_dir, "vendor"))
+        write_pdf(os.path.join(docs_dir, "hana.pdf"), [f"SAP HANA page {i}" for i in range(7)])
+        write_pdf(os.path.join(docs_dir, "vendor", "vsphere.pdf"), ["vSphere sizing", "NUMA"])
+
+        def reader():
+            return SimpleDirectoryReader(input_dir=docs_dir, required_exts=[".pdf"], recursive=True)
+
+        expected = summary(reader().load_data())
+        # split_bytes=0 splits every file into page ranges of 3
+        loader = ParallelPDFLoader(reader(), workers=2, cache_dir=cache_dir,
+                                   split_bytes=0, pages_per_task=3)
+        assert summary(loader.load_data()) == expected
+        loader.close()
+        print(f"✓ {len(expected)} pages match SimpleDirectoryReader, split across 2 workers")
+
+        def no_parsing(*args):
+            raise AssertionError("unchanged PDF was parsed again")
+        pdf_loader._parse_pages, parse_pages = no_parsing, pdf_loader._parse_pages
+        try:
+            os.utime(os.path.join(docs_dir, "hana.pdf"))  # touched, content unchanged
+            assert summary(ParallelPDFLoader(reader(), workers=1, cache_dir=cache_dir).load_data()) == expected
+        finally:
+            pdf_loader._parse_pages = parse_pages
+        print("✓ Unchanged PDFs served from the parse cache")
+
+        write_pdf(os.path.join(docs_dir, "hana.pdf"), ["SAP HANA revised"])
+        docs = ParallelPDFLoader(reader(), workers=1, cache_dir=cache_dir).load_data()
+        assert [d.text for d in docs][0] == "SAP HANA revised" and len(docs) == 3
+        print("✓ Modified PDF parsed again")
+
+
+if __name__ == "__main__":
+    print("=== Parallel PDF Loading Test ===")
+    try:
+        test_parallel_loading()
+    except AssertionError as e:
+        print(f"✗ Parallel PDF loading failed: {e}")
+        sys.exit(1)
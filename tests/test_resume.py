@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test checkpointed, resumable ingestion and the dead letter list offline, with fakes
+"""
+
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from ingest import build_knowledge_graph
+from tests.test_ingest import FakeGraphStore, FakeLLM, make_docs
+
+
+class BrokenLLM(FakeLLM):
+    """Times out on chunks mentioning "Broken", or on every chunk after `healthy` calls"""
+
+    def __init__(self, healthy=None):
+        super().__init__()
+        self.healthy = healthy
+
+    def predict(self, prompt, text, **kwargs):
+        if "Broken" in text or (self.healthy is not None and self.calls >= self.healthy):
+            with self._lock:
+                self.calls += 1
+            raise TimeoutError("simulated Ollama timeout")
+        return super().predict(prompt, text)
+
+
+class FlakyGraphStore(FakeGraphStore):
+    """Drops the connection once, at the given upsert"""
+
+    def __init__(self, fail_at):
+        super().__init__()
+        self.upserts = 0
+        self.fail_at = fail_at
+
+    def upsert_triplet(self, subj, rel, obj):
+        self.upserts += 1
+        if self.upserts == self.fail_at:
+            raise ConnectionError("simulated Neo4j hiccup")
+        super().upsert_triplet(subj, rel, obj)
+
+
+class FlakyDeleteStore(FakeGraphStore):
+    """Drops the connection once, at the given delete"""
+
+    def __init__(self, fail_at):
+        super().__init__()
+        self.deletes = 0
+        self.fail_at = fail_at
+
+    def delete(self, subj, rel, obj):
+        self.deletes += 1
+        if self.deletes == self.fail_at:
+            raise ConnectionError("simulated Neo4j hiccup")
+        super().delete(subj, rel, obj)
+
+
+PAGES = [(f"{i}.pdf", f"Page {i} covers Hana{i} sizing.") for i in range(8)]
+
+
+def build(pages, store, llm, tmp, **kwargs):
+    return build_knowledge_graph(make_docs(pages), store, llm, os.path.join(tmp, "manifest.json"),
+                                 "test", retries=0, write_batch_size=4,
+                                 dead_letter_path=os.path.join(tmp, "dead_letters.json"), **kwargs)
+
+
+def full_graph(tmp):
+    store = FakeGraphStore()
+    build_knowledge_graph(make_docs(PAGES), store, FakeLLM(), os.path.join(tmp, "full.json"), "test")
+    return store.triplets
+
+
+def test_dead_letters():
+    """A failing chunk doesn't fail the build, and is skipped once it failed twice"""
+    print("Testing the dead letter list...")
+    pages = PAGES + [("broken.pdf", "Broken scan of Numa.")]
+    with tempfile.TemporaryDirectory() as tmp:
+        store, llm = FakeGraphStore(), BrokenLLM()
+        stats = build(pages, store, llm, tmp)
+        assert stats.chunks_added == 8 and stats.chunks_failed == 1, stats
+        assert stats.dead_letters == 0 and store.triplets == full_graph(tmp), stats
+        print("✓ Build completed without the failing chunk")
+
+        stats = build(pages, store, llm, tmp)
+        assert stats.chunks_failed == 1 and stats.dead_letters == 1 and llm.calls == 10, stats
+        with open(os.path.join(tmp, "dead_letters.json")) as f:
+            entry, = json.load(f)["documents"]["broken.pdf"].values()
+        assert entry["failures"] == 2 and "TimeoutError" in entry["error"], entry
+
+        stats = build(pages, store, llm, tmp)
+        assert stats.chunks_skipped == 1 and llm.calls == 10, (stats, llm.calls)
+        print("✓ Chunk dead-lettered after failing in two runs, then skipped")
+
+        stats = build(pages, store, FakeLLM(), tmp, retry_dead_letters=True)
+        assert stats.chunks_added == 1 and stats.dead_letters == 0, stats
+        assert ("Numa", "Mentioned in", "Manual") in store.triplets
+        print("✓ Dead letter retried on request and extracted")
+
+        store, llm = FakeGraphStore(), BrokenLLM()
+        build(pages[-1:], store, llm, os.path.join(tmp, "removed"))
+        stats = build(pages[:1], store, llm, os.path.join(tmp, "removed"))
+        with open(os.path.join(tmp, "removed", "dead_letters.json")) as f:
+            assert json.load(f)["documents"] == {}
+        print("✓ Failures of removed documents forgotten")
+
+
+def test_resume_after_outage():
+    """When Ollama goes down the build stops, and the next run resumes where it stopped"""
+    print("\nTesting resuming after an Ollama outage...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store, llm = FakeGraphStore(), BrokenLLM(healthy=5)
+        try:
+            build(PAGES, store, llm, tmp, max_consecutive_failures=2)
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("the build went on without Ollama")
+        assert llm.calls == 7, llm.calls
+
+        llm = FakeLLM()
+        stats = build(PAGES, store, llm, tmp)
+        assert stats.chunks_added == 3 and stats.chunks_unchanged == 5, stats
+        assert llm.calls == 3 and store.triplets == full_graph(tmp), llm.calls
+        print("✓ 5 chunks checkpointed, 3 extracted after the restart")
+
+
+def test_resume_after_write_failure():
+    """A failed graph write is retried at the checkpoint, and nothing extracted is lost"""
+    print("\nTesting resuming after a graph store failure...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store, llm = FlakyGraphStore(fail_at=6), FakeLLM()
+        try:
+            build(PAGES, store, llm, tmp)
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("the write failure was swallowed")
+        checkpointed = llm.calls
+
+        stats = build(PAGES, store, llm, tmp)
+        assert stats.chunks_unchanged + stats.chunks_added == 8, stats
+        assert stats.chunks_added < 8 - 1 and llm.calls == checkpointed + stats.chunks_added
+        assert store.triplets == full_graph(tmp), store.triplets ^ full_graph(tmp)
+        print(f"✓ {stats.chunks_unchanged} chunks kept, {stats.chunks_added} extracted again")
+
+
+def test_resume_after_delete_failure():
+    """Triplets of removed chunks whose deletes failed are deleted by the next run"""
+    print("\nTesting resuming after a failed delete...")
+    # three triplets per removed chunk, so a flush falls between a chunk's deletes
+    pages = [(f"{i}.pdf", f"Page {i} covers Hana{i}, Numa{i} and Sizing{i}.") for i in range(4)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FlakyDeleteStore(fail_at=6)
+        build(pages, store, FakeLLM(), tmp)
+        try:
+            build(pages[:1], store, FakeLLM(), tmp)
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("the delete failure was swallowed")
+
+        build(pages[:1], store, FakeLLM(), tmp)
+        expected = FakeGraphStore()
+        build_knowledge_graph(make_docs(pages[:1]), expected, FakeLLM(),
+                              os.path.join(tmp, "expected.json"), "test")
+        assert store.triplets == expected.triplets, store.triplets ^ expected.triplets
+        print("✓ No triplets of removed chunks left behind")
+
+
+if __name__ == "__main__":
+    print("=== Resumable Ingestion Test ===")
+    try:
+        test_dead_letters()
+        test_resume_after_outage()
+        test_resume_after_write_failure()
+        test_resume_after_delete_failure()
+    except AssertionError as e:
+        print(f"✗ Resumable ingestion test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test streamed answers offline, with a fake LLM that streams a deepseek-r1 style reply
+"""
+
+import io
+import sys
+import time
+sys.path.append('.')
+
+from typing import Any
+
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from streaming import ThinkFilter, stream_answer
+
+REPLY = "<think>\nThe context says HANA is in-memory.\n</think>\n\nSAP HANA is an in-memory database."
+
+
+class StreamingLLM(CustomLLM):
+    """Streams REPLY a few characters at a time, slowly"""
+    delay: float = 0.01
+
+    @property
+    def metadata(self):
+        return LLMMetadata()
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return CompletionResponse(text=REPLY)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        def gen():
+            text = ""
+            for i in range(0, len(REPLY), 3):
+                time.sleep(self.delay)
+                text += REPLY[i:i + 3]
+                yield CompletionResponse(text=text, delta=REPLY[i:i + 3])
+        return gen()
+
+
+class FixedRetriever(BaseRetriever):
+    def _retrieve(self, query_bundle):
+        return [NodeWithScore(node=TextNode(text="SAP HANA is an in-memory database."), score=1.0)]
+
+
+def test_think_filter():
+    """Reasoning is hidden however the tags are split across tokens"""
+    print("Testing <think> filtering...")
+    for size in range(1, len(REPLY) + 1):
+        think_filter = ThinkFilter()
+        tokens = [REPLY[i:i + size] for i in range(0, len(REPLY), size)]
+        shown = "".join(think_filter.feed(token) for token in tokens) + think_filter.flush()
+        assert shown == "SAP HANA is an in-memory database.", (size, shown)
+    think_filter = ThinkFilter()
+    assert think_filter.feed("a < b and c <th") == "a < b and c "
+    assert think_filter.feed("ree") + think_filter.flush() == "<three"
+    print("✓ Reasoning hidden for every token size, other '<' kept")
+
+
+def test_stream_answer():
+    """Tokens reach the output while the answer is still being generated"""
+    print("\nTesting streamed query...")
+    engine = RetrieverQueryEngine.from_args(FixedRetriever(), llm=StreamingLLM(), streaming=True)
+    out = io.StringIO()
+    answer, stats = stream_answer(engine, "What is SAP HANA?", out=out)
+    assert answer == REPLY
+    assert out.getvalue() == "SAP HANA is an in-memory database.\n", out.getvalue()
+    assert stats.first_token < stats.first_visible < stats.total, stats
+    print(f"✓ Answer streamed with reasoning hidden ({stats})")
+
+    out = io.StringIO()
+    stream_answer(engine, "What is SAP HANA?", hide_thinking=False, out=out)
+    assert out.getvalue() == REPLY + "\n"
+    print("✓ Reasoning shown when not hidden")
+
+
+if __name__ == "__main__":
+    print("=== Streaming Response Test ===")
+    try:
+        test_think_filter()
+        test_stream_answer()
+    except AssertionError as e:
+        print(f"✗ Streaming test failed: {e}")
+        sys.exit(1)
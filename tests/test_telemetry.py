@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test the telemetry layer offline: spans, counters, LlamaIndex callbacks and the exports
+"""
+
+import json
+import os
+import sys
+import tempfile
+import urllib.request
+sys.path.append('.')
+
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.llms import MockLLM
+from embed_cache import CachedEmbedding, EmbeddingStore
+from graph_writer import make_triplet_writer
+from local_graph_store import CSRGraphStore
+from telemetry import Telemetry, TelemetryHandler, serve_metrics, telemetry
+from tests.test_caches import CountingEmbedding
+
+
+def test_spans_and_counters():
+    """Spans feed the stage histogram, counters add up per label"""
+    print("Testing spans and counters...")
+    registry = Telemetry()
+    for _ in range(3):
+        with registry.span("extract", chars=100):
+            pass
+    registry.incr("cache_hits_total", 2, cache="embedding")
+    registry.incr("cache_hits_total", cache="completion")
+    registry.incr("cache_misses_total", 0, cache="completion")
+    assert registry.stages()["extract"][0] == 3, registry.stages()
+    assert registry.counter("cache_hits_total") == 3
+    assert registry.counter("cache_hits_total", cache="embedding") == 2
+    assert registry.counter("cache_misses_total") == 0
+    trace = registry.trace()
+    assert [e["name"] for e in trace["traceEvents"]] == ["extract"] * 3
+    assert trace["traceEvents"][0]["args"] == {"chars": 100}
+    print(f"✓ Stage summary:\n{registry.summary()}")
+
+
+def test_exports():
+    """Prometheus text and the JSON trace, from a file and over HTTP"""
+    print("\nTesting exports...")
+    registry = Telemetry(max_events=1)
+    with registry.span("graph_write"):
+        pass
+    with registry.span("graph_write"):
+        pass
+    registry.incr("llm_calls_total", model='deepseek-r1:14b "q"')
+    text = registry.prometheus()
+    assert '# TYPE graphrag_llm_calls_total counter' in text, text
+    assert 'graphrag_llm_calls_total{model="deepseek-r1:14b \\"q\\""} 1' in text, text
+    assert 'graphrag_stage_seconds_bucket{stage="graph_write",le="+Inf"} 2' in text, text
+    assert 'graphrag_stage_seconds_count{stage="graph_write"} 2' in text, text
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trace.json")
+        registry.write_trace(path)
+        with open(path) as f:
+            trace = json.load(f)
+    assert len(trace["traceEvents"]) == 1 and trace["otherData"]["dropped_events"] == 1
+
+    server = serve_metrics(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.read().decode() == text
+        with urllib.request.urlopen(url + "/trace") as response:
+            assert json.load(response)["traceEvents"][0]["name"] == "graph_write"
+    finally:
+        server.shutdown()
+    print("✓ Prometheus text and JSON trace exported")
+
+
+def test_callbacks():
+    """LLM calls made through LlamaIndex are counted and timed"""
+    print("\nTesting LlamaIndex callbacks...")
+    registry = Telemetry()
+    llm = MockLLM(max_tokens=5, callback_manager=CallbackManager([TelemetryHandler(registry)]))
+    llm.complete("hello")
+    llm.chat([])
+    assert registry.counter("llm_calls_total") == 2, registry.prometheus()
+    assert registry.stages()["llm"][0] == 2
+    print("✓ LLM events recorded as spans and counted")
+
+
+def test_nested_events():
+    """An LLM or embedding call that makes another one is counted once"""
+    print("\nTesting nested callback events...")
+    registry = Telemetry()
+    llm = MockLLM(max_tokens=5, callback_manager=CallbackManager([TelemetryHandler(registry)]))
+    llm.chat([])  # MockLLM's chat() calls complete(), like Ollama's complete() calls chat()
+    assert registry.counter("llm_calls_total") == 1, registry.prometheus()
+    assert registry.stages()["llm"][0] == 1
+    print("✓ Nested LLM event left to the outer one")
+
+    telemetry.reset()
+    callback_manager = CallbackManager([TelemetryHandler()])
+    inner = CountingEmbedding(model_name="fake", callback_manager=callback_manager)
+    with tempfile.TemporaryDirectory() as tmp:
+        cached = CachedEmbedding(inner, EmbeddingStore(tmp), callback_manager=callback_manager)
+        texts = ["sap hana", "vsphere", "numa"]
+        cached.get_text_embedding_batch(texts)
+        assert telemetry.counter("embedded_texts_total") == 3, telemetry.prometheus()
+        cached.get_text_embedding_batch(texts)
+        assert inner.calls == 3 and telemetry.counter("embedded_texts_total") == 6
+        assert telemetry.counter("cache_hits_total", cache="embedding") == 3
+        assert telemetry.stages()["embedding"][0] == 2, telemetry.stages()
+        cached.store.close()
+    print("✓ Cached embedding model's events counted once, hits included")
+
+
+def test_graph_round_trips():
+    """Batched graph writes report their round trips"""
+    print("\nTesting graph write instrumentation...")
+    telemetry.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        with make_triplet_writer(CSRGraphStore(tmp), batch_size=10) as writer:
+            for i in range(25):
+                writer.upsert(f"A{i}", "runs on", f"B{i}")
+    assert telemetry.counter("graph_round_trips_total", store="CSRGraphStore") == 3
+    assert telemetry.stages()["graph_write"][0] == 3
+    print("✓ 25 triplets written in 3 round trips")
+
+
+if __name__ == "__main__":
+    print("=== Telemetry Test ===")
+    try:
+        test_spans_and_counters()
+        test_exports()
+        test_callbacks()
+        test_nested_events()
+        test_graph_round_trips()
+    except AssertionError as e:
+        print(f"✗ Telemetry test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test budgeted graph traversal offline: fan-out, hub pruning, relevance ranking and time budget
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+from llama_index.core import StorageContext
+from llama_index.core.schema import QueryBundle
+from entity_index import EntityIndex, update_entity_index
+from local_graph_store import CSRGraphStore
+from retrieval import GraphRAGRetriever
+from tests.test_entity_index import NoLLM
+from traversal import TraversalBudget, traverse
+
+
+def build_store():
+    """SAP HANA with a few specific facts, next to the hub "memory" with 200"""
+    store = CSRGraphStore()
+    store.upsert_triplets([
+        ("SAP HANA", "runs on", "vSphere"),
+        ("SAP HANA", "requires", "memory"),
+        ("SAP HANA", "is certified for", "SLES"),
+        ("SAP HANA", "is documented in", "Manual"),
+        ("vSphere", "supports", "NUMA"),
+        ("SLES", "includes", "saptune"),
+    ])
+    store.upsert_triplets([("memory", "is used by", f"application {i}") for i in range(200)])
+    store.upsert_triplets([("Manual", "describes", f"topic {i}") for i in range(20)])
+    return store
+
+
+def test_hub_pruning():
+    """Hubs are reached but not expanded, their neighbours are not fetched"""
+    print("Testing hub pruning...")
+    store = build_store()
+    stock = store.get_rel_map(["SAP HANA"], depth=2, limit=30)["SAP HANA"]
+    assert any(obj.startswith("application") for _, _, obj in stock), stock
+
+    traversal = traverse(store, ["SAP HANA"], "Does SAP HANA run on vSphere?",
+                         TraversalBudget(fanout=8, hub_degree=50), depth=2, max_triplets=30)
+    triplets = traversal.rel_map["SAP HANA"]
+    assert ["SAP HANA", "requires", "memory"] in triplets
+    assert ["vSphere", "supports", "NUMA"] in triplets
+    assert not any(obj.startswith("application") for _, _, obj in triplets), triplets
+    assert traversal.hubs == ["memory"] and traversal.truncated == "", traversal
+    print(f"✓ {traversal.triplets} triplets instead of {len(stock)}, hub {traversal.hubs} pruned")
+
+    # a hub the question names is expanded, within the fan-out
+    traversal = traverse(store, ["memory"], "Which applications use memory?",
+                         TraversalBudget(fanout=5), depth=1)
+    assert traversal.triplets == 5, traversal
+    print("✓ Named hub expanded within the fan-out")
+
+
+def test_ranking():
+    """Relationships naming words of the question, then specific entities, come first"""
+    print("\nTesting relevance ranking...")
+    store = build_store()
+    traversal = traverse(store, ["SAP HANA"], "Is SAP HANA certified for SLES?",
+                         TraversalBudget(fanout=1), depth=2)
+    assert traversal.rel_map["SAP HANA"] == [["SAP HANA", "is certified for", "SLES"],
+                                             ["SLES", "includes", "saptune"]], traversal
+    # without matching words, the entity with the fewest relationships first
+    traversal = traverse(store, ["SAP HANA"], "Tell me more", TraversalBudget(fanout=1), depth=1)
+    assert traversal.rel_map["SAP HANA"][0][2] in ("SLES", "vSphere"), traversal
+    print("✓ Question words, then specific entities, ranked first")
+
+
+def test_budgets():
+    """The traversal stops at max_triplets, and when its time is up"""
+    print("\nTesting triplet and time budgets...")
+    store = build_store()
+    traversal = traverse(store, ["SAP HANA", "Manual"], "", TraversalBudget(fanout=20),
+                         depth=2, max_triplets=6)
+    assert traversal.triplets == 6 and traversal.truncated == "triplets", traversal
+    # the budget is shared: both entities got their best relationships
+    assert set(traversal.rel_map) == {"SAP HANA", "Manual"}, traversal
+
+    class SlowStore:
+        def __init__(self):
+            self.calls = 0
+
+        def neighbors(self, names, terms=(), limit=None, timeout=None):
+            self.calls += 1
+            time.sleep(0.1)
+            return {name: [(name, "links", f"{name}+")] for name in names}
+
+    slow = SlowStore()
+    start = time.perf_counter()
+    traversal = traverse(slow, ["a"], "", TraversalBudget(seconds=0.15), depth=10)
+    elapsed = time.perf_counter() - start
+    assert traversal.truncated == "time" and slow.calls == 2, (traversal, slow.calls)
+    assert elapsed < 0.3, elapsed
+    print(f"✓ Stopped at 6 triplets, and after {elapsed:.2f}s of a 0.15s budget")
+
+
+def test_retriever():
+    """GraphRAGRetriever traverses within the budget, with degrees from the entity index"""
+    print("\nTesting budgeted retrieval...")
+    store = build_store()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "entity_index.json")
+        degrees = {name: store.degree(name) for name in store.entities()}
+        update_entity_index(path, store.entities(), "v1", degrees=degrees)
+        index = EntityIndex.load(path)
+    assert index.degree("MEMORY") == 200, index.degree("MEMORY")
+
+    retriever = GraphRAGRetriever(
+        storage_context=StorageContext.from_defaults(graph_store=store),
+        llm=NoLLM(), entity_index=index, traversal_budget=TraversalBudget(fanout=4),
+        graph_traversal_depth=2, max_knowledge_sequence=10,
+    )
+    text = retriever.retrieve(QueryBundle("Does SAP HANA run on vSphere?"))[0].node.text
+    assert "['vSphere', 'supports', 'NUMA']" in text, text
+    assert "application" not in text, text
+    print("✓ Hub left out of the context, neighbours of vSphere kept")
+
+
+if __name__ == "__main__":
+    print("=== Graph Traversal Test ===")
+    try:
+        test_hub_pruning()
+        test_ranking()
+        test_budgets()
+        test_retriever()
+    except AssertionError as e:
+        print(f"✗ Traversal test failed: {e}")
+        sys.exit(1)
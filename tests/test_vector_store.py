@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test the memory-mapped local vector store offline, with a bag-of-words embedding
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+import numpy as np
+from llama_index.core import Document, StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from mmap_vector_store import MmapVectorStore
+
+DIM = 64
+
+
+class BagOfWordsEmbedding(BaseEmbedding):
+    """Hashes words into DIM buckets, so texts sharing words are similar"""
+
+    def _embed(self, text):
+        vector = np.zeros(DIM)
+        for word in text.lower().split():
+            vector[hash(word.strip("?.,")) % DIM] += 1.0
+        return vector.tolist()
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed(text)
+
+
+def test_index_roundtrip():
+    """A VectorStoreIndex on the store answers queries again after reopening"""
+    print("Testing local vector store...")
+    embed_model = BagOfWordsEmbedding(model_name="bow")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MmapVectorStore(persist_dir=tmp)
+        docs = [Document(text="SAP HANA runs on SUSE Linux", doc_id="hana"),
+                Document(text="vSphere hosts virtual machines", doc_id="vsphere"),
+                Document(text="NUMA nodes group memory and CPUs", doc_id="numa")]
+        VectorStoreIndex.from_documents(
+            docs, storage_context=StorageContext.from_defaults(vector_store=store),
+            embed_model=embed_model)
+        store.close()
+
+        store = MmapVectorStore(persist_dir=tmp)
+        assert store.node_count == 3
+        index = VectorStoreIndex.from_vector_store(store, embed_model=embed_model)
+        nodes = index.as_retriever(similarity_top_k=1).retrieve("Which Linux does HANA run on?")
+        assert nodes[0].node.get_content() == "SAP HANA runs on SUSE Linux", [n.node.get_content() for n in nodes]
+        print("✓ Index reopened from disk without re-embedding")
+
+        store.delete("hana")
+        nodes = index.as_retriever(similarity_top_k=3).retrieve("Which Linux does HANA run on?")
+        assert "SAP HANA runs on SUSE Linux" not in [n.node.get_content() for n in nodes]
+        assert MmapVectorStore(persist_dir=tmp).node_count == 2
+        print("✓ Deleted document no longer retrieved, also after reopening")
+
+
+def test_ivf():
+    """Clustered search finds the same neighbours as the exact scan"""
+    print("\nTesting clustered (IVF) search...")
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(50, DIM))
+    vectors = centers[rng.integers(0, 50, 20_000)] + 0.1 * rng.normal(size=(20_000, DIM))
+    nodes = [TextNode(text=str(i), id_=str(i), embedding=v.tolist()) for i, v in enumerate(vectors)]
+    queries = vectors[:100] + 0.05 * rng.normal(size=(100, DIM))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = MmapVectorStore(persist_dir=os.path.join(tmp, "exact"), ivf_min_rows=10**9)
+        clustered = MmapVectorStore(persist_dir=os.path.join(tmp, "ivf"), ivf_min_rows=10_000)
+        exact.add(nodes)
+        clustered.add(nodes)
+        assert clustered._centroids is not None
+
+        timings = {}
+        found = {}
+        for name, store in (("exact", exact), ("ivf", clustered)):
+            start = time.perf_counter()
+            found[name] = [store.query(VectorStoreQuery(query_embedding=q.tolist(),
+                                                        similarity_top_k=10)).ids
+                           for q in queries]
+            timings[name] = (time.perf_counter() - start) / len(queries)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found["exact"], found["ivf"])])
+        assert recall > 0.9, recall
+        print(f"✓ Recall@10 {recall:.2f}; {timings['exact'] * 1000:.2f} ms exact, "
+              f"{timings['ivf'] * 1000:.2f} ms clustered per query over 20,000 vectors")
+
+        start = time.perf_counter()
+        MmapVectorStore(persist_dir=os.path.join(tmp, "ivf"))
+        print(f"✓ Reopened in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("=== Local Vector Store Test ===")
+    try:
+        test_index_roundtrip()
+        test_ivf()
+    except AssertionError as e:
+        print(f"✗ Local vector store test failed: {e}")
+        sys.exit(1)
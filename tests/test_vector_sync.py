@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test incremental vector index updates offline, with the local vector store
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from llama_index.core import VectorStoreIndex
+from mmap_vector_store import MmapVectorStore
+from tests.test_ingest import make_docs
+from tests.test_vector_store import BagOfWordsEmbedding
+from vector_sync import FileDocumentHashes, VectorSync
+
+CALLS = []
+
+
+class CountingEmbedding(BagOfWordsEmbedding):
+    """Counts the texts it embeds"""
+
+    def _get_text_embeddings(self, texts):
+        CALLS.append(("embed", len(texts)))
+        return [self._embed(text) for text in texts]
+
+
+class CountingStore(MmapVectorStore):
+    """Records the size of every add"""
+
+    def add(self, nodes, **add_kwargs):
+        CALLS.append(("add", len(nodes)))
+        return super().add(nodes, **add_kwargs)
+
+
+PAGES = [("a.pdf", "SAP HANA runs on SUSE Linux"),
+         ("b.pdf", "vSphere hosts virtual machines"),
+         ("c.pdf", "NUMA nodes group memory and CPUs")]
+
+
+def sync(tmp, pages, batch_size=256):
+    CALLS.clear()
+    store = CountingStore(persist_dir=os.path.join(tmp, "vectors"))
+    hashes = FileDocumentHashes(os.path.join(tmp, "hashes.json"))
+    vector_sync = VectorSync(store, hashes, embed_model=CountingEmbedding(model_name="bow"),
+                             batch_size=batch_size)
+    passed = list(vector_sync.passthrough(make_docs(pages)))
+    assert len(passed) == len(pages)
+    return store, vector_sync.finish()
+
+
+def retrieve(store, query):
+    index = VectorStoreIndex.from_vector_store(store, embed_model=BagOfWordsEmbedding(model_name="bow"))
+    return [n.node.get_content() for n in index.as_retriever(similarity_top_k=3).retrieve(query)]
+
+
+def test_incremental_sync():
+    """Only changed files are re-embedded, and removed files leave the index"""
+    print("Testing incremental vector index updates...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store, stats = sync(tmp, PAGES)
+        assert (stats.updated, store.node_count) == (3, 3), stats
+        store.close()
+
+        store, stats = sync(tmp, PAGES)
+        assert CALLS == [] and stats.unchanged == 3, (CALLS, stats)
+        store.close()
+        print("✓ Unchanged documents neither embedded nor written")
+
+        pages = [PAGES[0], ("b.pdf", "ESXi hosts virtual machines")]
+        store, stats = sync(tmp, pages)
+        assert (stats.updated, stats.removed, stats.nodes_deleted) == (1, 1, 2), stats
+        assert CALLS == [("embed", 1), ("add", 1)], CALLS
+        assert store.node_count == 2
+        texts = retrieve(store, "Which machines does ESXi host?")
+        assert texts[0] == "ESXi hosts virtual machines", texts
+        assert "vSphere hosts virtual machines" not in texts
+        assert "NUMA nodes group memory and CPUs" not in texts
+        print(f"✓ Changed file replaced and removed file deleted: {stats}")
+
+
+def test_batches():
+    """Nodes are embedded and written in batches of batch_size"""
+    print("\nTesting batched writes...")
+    pages = [(f"{i}.pdf", f"Document number {i}") for i in range(7)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store, stats = sync(tmp, pages, batch_size=3)
+        adds = [size for kind, size in CALLS if kind == "add"]
+        assert adds == [3, 3, 1], CALLS
+        assert store.node_count == 7 and stats.nodes_added == 7
+        print(f"✓ 7 nodes written in batches of {adds}")
+
+
+def test_resume_after_crash():
+    """Nodes written before a crash are overwritten, not duplicated, by the next run"""
+    print("\nTesting a crash between the write and the hash update...")
+
+    class CrashingHashes(FileDocumentHashes):
+        def update(self, entries, removed=()):
+            raise KeyboardInterrupt
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CountingStore(persist_dir=os.path.join(tmp, "vectors"))
+        vector_sync = VectorSync(store, CrashingHashes(os.path.join(tmp, "hashes.json")),
+                                 embed_model=CountingEmbedding(model_name="bow"))
+        try:
+            vector_sync.sync(make_docs(PAGES))
+        except KeyboardInterrupt:
+            pass
+        assert store.node_count == 3
+        store.close()
+
+        store, stats = sync(tmp, PAGES)
+        assert stats.updated == 3 and store.node_count == 3, (stats, store.node_count)
+        print(f"✓ {store.node_count} nodes after the rerun")
+
+
+if __name__ == "__main__":
+    print("=== Vector Index Sync Test ===")
+    try:
+        test_incremental_sync()
+        test_batches()
+        test_resume_after_crash()
+    except AssertionError as e:
+        print(f"✗ Vector index sync test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,132 @@
+"""Budgeted knowledge graph traversal for retrieval
+
+KnowledgeGraphRAGRetriever hands the query entities to get_rel_map, which
+follows every path of up to graph_traversal_depth hops. Through a hub such as
+"SAP" or "memory" that is hundreds of triplets: the Cypher query slows down
+with the density of the graph, and the triplets crowd the synthesis context.
+traverse() expands breadth first within explicit budgets instead:
+- at most `fanout` relationships are followed out of each entity, the most
+  relevant first: those naming words of the question, then those leading to
+  the entities with the fewest relationships, which are the most specific
+- hubs, entities with more than hub_degree relationships, are kept as the
+  object of a triplet but not expanded, unless the question names them
+- it stops after `depth` hops, max_triplets triplets or `seconds`, whichever
+  comes first, so the cost of a query no longer grows with the graph
+Entity degrees come from the entity index, counted at ingestion from the
+manifest, or else from the graph store.
+
+Graph stores take part by implementing neighbors(names, terms, limit, timeout),
+see CSRGraphStore and PooledNeo4jGraphStore.
+"""
+import logging
+import time
+from dataclasses import dataclass, field
+from itertools import chain, zip_longest
+
+from canonical import singular
+from entity_index import STOPWORDS, normalize
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TraversalBudget:
+    # relationships followed out of each entity
+    fanout: int = 8
+    # entities with more relationships are not expanded
+    hub_degree: int = 50
+    # time for all hops; a graph query still running then is cancelled
+    seconds: float = 2.0
+    # relationships fetched per entity and slot of fanout, to rank; a store
+    # ranking on the server (Neo4j) leaves the rest of a hub's relationships there
+    candidates: int = 4
+
+
+@dataclass
+class Traversal:
+    # {entity: [[subj, rel, obj], ...]} like get_rel_map, closer triplets first
+    rel_map: dict = field(default_factory=dict)
+    # entities reached but not expanded for having more than hub_degree relationships
+    hubs: list = field(default_factory=list)
+    # "triplets", "time" or "error" if a budget or a failing query cut the traversal short
+    truncated: str = ""
+
+    @property
+    def triplets(self):
+        return sum(len(triplets) for triplets in self.rel_map.values())
+
+
+def words(text):
+    """Singular normalized words, with Neo4j relationship types ('RUNS_ON') split"""
+    return {singular(word) for word in normalize(text.replace("_", " ")).split()}
+
+
+def query_terms(query):
+    """Words of the question that make a relationship relevant"""
+    return sorted({singular(word) for word in normalize(query).split()
+                   if word not in STOPWORDS and len(word) > 2})
+
+
+def traverse(graph_store, entities, query="", budget=None, depth=2, max_triplets=30,
+             degree=None):
+    """Triplets around entities within budget, as a Traversal
+
+    degree(name) is the number of relationships of an entity, 0 if unknown;
+    by default graph_store.degree, if the store has one.
+    """
+    budget = budget or TraversalBudget()
+    if degree is None:
+        degree = getattr(graph_store, "degree", None) or (lambda name: 0)
+    deadline = time.perf_counter() + budget.seconds
+    terms = query_terms(query)
+    term_set = set(terms)
+
+    def rank(edge):
+        _, rel, obj = edge
+        return -len(words(f"{rel} {obj}") & term_set), degree(obj), obj
+
+    result = Traversal()
+    entities = list(dict.fromkeys(entities))
+    seen = {entity.lower() for entity in entities}
+    frontier = [(entity, entity) for entity in entities]  # (query entity, entity to expand)
+    for _ in range(depth):
+        if not frontier:
+            break
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+            result.truncated = "time"
+            break
+        try:
+            edges = graph_store.neighbors(list(dict.fromkeys(entity for _, entity in frontier)),
+                                          terms, limit=budget.fanout * budget.candidates,
+                                          timeout=timeout)
+        except Exception as e:
+            logger.warning("Graph traversal stopped after %d triplets: %r", result.triplets, e)
+            result.truncated = "error"
+            break
+
+        # the best relationship of every entity before the second best of any,
+        # so the triplet budget is shared between the query entities
+        ranked = []
+        for seed, entity in frontier:
+            best = sorted(edges.get(entity, ()), key=rank)[:budget.fanout]
+            ranked.append([(seed, edge) for edge in best])
+        frontier = []
+        for item in chain.from_iterable(zip_longest(*ranked)):
+            if item is None:
+                continue
+            if result.triplets >= max_triplets:
+                result.truncated = "triplets"
+                break
+            seed, (subj, rel, obj) = item
+            result.rel_map.setdefault(seed, []).append([subj, rel, obj])
+            if obj.lower() in seen:
+                continue
+            seen.add(obj.lower())
+            if degree(obj) > budget.hub_degree:
+                result.hubs.append(obj)
+            else:
+                frontier.append((seed, obj))
+        if result.truncated:
+            break
+    return result
@@ -0,0 +1,205 @@
+"""Incremental vector index updates
+
+The vector index used to be dropped, and the whole corpus embedded and written
+again, on every start. VectorSync instead keeps a hash of every source
+file with the ids of the nodes indexed for it, and on each run only re-embeds
+files whose hash changed and deletes the nodes of changed or removed files.
+Writes go out in pipelined batches of batch_size nodes. The hashes live next to
+the index: in a Redis hash for RedisVectorStore, in a JSON file otherwise.
+
+Node ids are derived from the file's key, its hash and the chunk's position,
+so nodes written by a run that stopped before recording the hash are
+overwritten, not duplicated, when the file is indexed again.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from itertools import count, groupby
+
+from llama_index.core import Settings
+from llama_index.core.schema import MetadataMode
+
+from ingest import document_key
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(file_docs):
+    """Hash of a file's documents (text and metadata), in order"""
+    digest = hashlib.sha256()
+    for doc in file_docs:
+        digest.update(doc.hash.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def chunk_ids(doc_key, digest):
+    """Node parser id_func numbering the chunks of one version of a file"""
+    position = count()
+
+    def id_func(i, node):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_key}\0{digest}\0{next(position)}"))
+    return id_func
+
+
+class FileDocumentHashes:
+    """{doc_key: {"hash": ..., "nodes": [node ids]}} in a JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._entries = json.load(f)
+
+    def get_all(self):
+        return dict(self._entries)
+
+    def update(self, entries, removed=()):
+        self._entries.update(entries)
+        for doc_key in removed:
+            self._entries.pop(doc_key, None)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self._entries, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+class RedisDocumentHashes:
+    """The same entries as fields of one Redis hash, stored next to the index"""
+
+    def __init__(self, redis_client, key):
+        self.redis = redis_client
+        self.key = key
+
+    def get_all(self):
+        return {
+            (field.decode() if isinstance(field, bytes) else field): json.loads(value)
+            for field, value in self.redis.hgetall(self.key).items()
+        }
+
+    def update(self, entries, removed=()):
+        with self.redis.pipeline(transaction=False) as pipe:
+            if entries:
+                pipe.hset(self.key, mapping={k: json.dumps(v) for k, v in entries.items()})
+            if removed:
+                pipe.hdel(self.key, *removed)
+            pipe.execute()
+
+
+def _delete_nodes(vector_store, node_ids, batch_size):
+    if not node_ids:
+        return
+    index = getattr(vector_store, "_index", None)
+    if hasattr(index, "key") and hasattr(index, "client"):
+        # RedisVectorStore: nodes are plain keys, deleted in pipelined batches
+        for start in range(0, len(node_ids), batch_size):
+            with index.client.pipeline(transaction=False) as pipe:
+                for node_id in node_ids[start:start + batch_size]:
+                    pipe.delete(index.key(node_id))
+                pipe.execute()
+    else:
+        vector_store.delete_nodes(node_ids)
+
+
+@dataclass
+class VectorSyncStats:
+    documents: int = 0
+    unchanged: int = 0
+    updated: int = 0
+    removed: int = 0
+    nodes_added: int = 0
+    nodes_deleted: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"{self.documents} documents: {self.updated} updated, {self.removed} removed, "
+                f"{self.unchanged} unchanged; {self.nodes_added} nodes added, "
+                f"{self.nodes_deleted} deleted in {self.seconds:.1f}s")
+
+
+class VectorSync:
+    """Brings vector_store in line with a document stream, one source file at a time
+
+    Use sync(docs) on its own, or passthrough(docs) to index the documents on
+    their way to build_knowledge_graph, then finish().
+    """
+
+    def __init__(self, vector_store, hashes, embed_model=None, batch_size=256):
+        self.vector_store = vector_store
+        self.hashes = hashes
+        self.embed_model = embed_model or Settings.embed_model
+        self.batch_size = batch_size
+        self.stats = VectorSyncStats()
+        self._known = hashes.get_all()
+        self._seen = set()
+        self._nodes = []
+        self._entries = {}
+        self._start = time.perf_counter()
+
+    def sync(self, docs):
+        for _ in self.passthrough(docs):
+            pass
+        return self.finish()
+
+    def passthrough(self, docs):
+        for doc_key, file_docs in groupby(docs, key=document_key):
+            file_docs = list(file_docs)
+            self._sync_file(doc_key, file_docs)
+            yield from file_docs
+
+    def _sync_file(self, doc_key, file_docs):
+        if doc_key in self._seen:
+            raise ValueError(f"Documents from {doc_key} are not contiguous")
+        self._seen.add(doc_key)
+        self.stats.documents += 1
+        digest = file_hash(file_docs)
+        known = self._known.get(doc_key)
+        if known is not None and known["hash"] == digest:
+            self.stats.unchanged += 1
+            return
+        if known is not None:
+            _delete_nodes(self.vector_store, known["nodes"], self.batch_size)
+            self.stats.nodes_deleted += len(known["nodes"])
+        parser = Settings.node_parser.model_copy(update={"id_func": chunk_ids(doc_key, digest)})
+        nodes = parser.get_nodes_from_documents(file_docs)
+        self._nodes.extend(nodes)
+        self._entries[doc_key] = {"hash": digest, "nodes": [node.node_id for node in nodes]}
+        self.stats.updated += 1
+        if len(self._nodes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Embed and write the buffered nodes, then record their files' hashes"""
+        nodes, self._nodes = self._nodes, []
+        for start in range(0, len(nodes), self.batch_size):
+            batch = nodes[start:start + self.batch_size]
+            with telemetry.span("vector_embed", nodes=len(batch)):
+                embeddings = self.embed_model.get_text_embedding_batch(
+                    [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch])
+            for node, embedding in zip(batch, embeddings):
+                node.embedding = embedding
+            with telemetry.span("vector_write", nodes=len(batch)):
+                self.vector_store.add(batch, batch_size=self.batch_size)
+        self.stats.nodes_added += len(nodes)
+        entries, self._entries = self._entries, {}
+        if entries:
+            self.hashes.update(entries)
+
+    def finish(self):
+        """Flush, and delete the nodes of files that were not in the stream"""
+        self.flush()
+        removed = [doc_key for doc_key in self._known if doc_key not in self._seen]
+        node_ids = [node_id for doc_key in removed for node_id in self._known[doc_key]["nodes"]]
+        _delete_nodes(self.vector_store, node_ids, self.batch_size)
+        if removed:
+            self.hashes.update({}, removed)
+        self.stats.removed += len(removed)
+        self.stats.nodes_deleted += len(node_ids)
+        self.stats.seconds = time.perf_counter() - self._start
+        logger.info("Vector index sync: %s", self.stats)
+        return self.stats